@@ -2,36 +2,111 @@ import os
 import sys
 import io
 import json
+import gc
+import sqlite3
 import time
 import math
 import zipfile
 import tempfile
 import logging
+from contextlib import closing, contextmanager
 from logging.handlers import RotatingFileHandler
 import threading
 import subprocess
 import platform
 import uuid
-from datetime import datetime
+import re
+import hashlib
+import hmac
+import random
+import functools
+import atexit
+from datetime import datetime, timedelta
 import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import importlib
+import mimetypes
+from urllib.parse import quote as url_quote
+
+_STARTUP_T0 = time.perf_counter()
 
 from dotenv import load_dotenv
 from flask import (
-    Flask, render_template, request, redirect, flash, url_for,
+    Flask, Request, Response, render_template, request, redirect, flash, url_for,
     jsonify, send_file, after_this_request, g
 )
 from flask_mail import Mail, Message
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 
-import fitz  # PyMuPDF
-from PIL import Image
-from fpdf import FPDF
-from pdf2docx import Converter
-import pdfplumber
-import pytesseract
-import camelot
-import pandas as pd
+
+# ---------------------------- Bibliotecas sob demanda ----------------------------
+class LazyModule:
+    """
+    Módulo carregado no primeiro atributo acessado (fitz.open, pd.DataFrame...).
+    Um worker que só serve /merge ou os templates não paga camelot/OpenCV,
+    pandas etc. no startup nem na memória.
+    """
+
+    def __init__(self, name: str, on_load=None):
+        self._name = name
+        self._on_load = on_load
+        self._module = None
+        self._lock = threading.Lock()
+        self.load_s = None
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    if self._on_load:
+                        self._on_load(module)
+                    self.load_s = round(time.perf_counter() - started, 3)
+                    self._module = module
+                    logging.info(f"Biblioteca {self._name} carregada em {self.load_s:.2f} s.")
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return f"<LazyModule {self._name} ({'carregado' if self.loaded else 'não carregado'})>"
+
+
+def _configure_tesseract(module) -> None:
+    # Pytesseract: sem caminho fixo no Linux
+    if platform.system() == "Windows":
+        module.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+
+fitz = LazyModule("fitz")  # PyMuPDF
+Image = LazyModule("PIL.Image")
+fpdf = LazyModule("fpdf")
+pdf2docx = LazyModule("pdf2docx")
+pdfplumber = LazyModule("pdfplumber")
+pytesseract = LazyModule("pytesseract", on_load=_configure_tesseract)
+camelot = LazyModule("camelot")  # puxa OpenCV
+pd = LazyModule("pandas")
+
+# nomes aceitos em WARMUP_MODULES
+LAZY_MODULES = {
+    "fitz": fitz,
+    "PIL": Image,
+    "fpdf": fpdf,
+    "pdf2docx": pdf2docx,
+    "pdfplumber": pdfplumber,
+    "pytesseract": pytesseract,
+    "camelot": camelot,
+    "pandas": pd,
+}
 
 load_dotenv()
 
@@ -48,6 +123,109 @@ app.config['MAIL_PASSWORD'] = os.getenv("MAIL_PASSWORD")
 app.config['MAIL_DEFAULT_SENDER'] = (os.getenv("MAIL_DEFAULT_SENDER_NAME"), os.getenv("MAIL_DEFAULT_SENDER_EMAIL"))
 mail = Mail(app)
 
+# Limite global de processos Ghostscript simultâneos (vale para todas as tarefas)
+app.config['GS_MAX_WORKERS'] = int(os.getenv("GS_MAX_WORKERS", max((os.cpu_count() or 2) // 2, 1)))
+
+# Instâncias persistentes do Ghostscript (recicladas por nº de jobs ou memória)
+app.config['GS_PERSISTENT'] = os.getenv("GS_PERSISTENT", "True").lower() in ("true", "1", "yes")
+app.config['GS_WORKER_MAX_JOBS'] = int(os.getenv("GS_WORKER_MAX_JOBS", 50))
+app.config['GS_WORKER_MAX_RSS_MB'] = float(os.getenv("GS_WORKER_MAX_RSS_MB", 512))
+app.config['GS_JOB_TIMEOUT_S'] = float(os.getenv("GS_JOB_TIMEOUT_S", 1800))
+
+# Limites de upload por rota em MB: (por arquivo, por requisição).
+# Rotas fora da tabela usam MAX_CONTENT_LENGTH para os dois.
+app.config['UPLOAD_LIMITS_MB'] = {
+    'compress': (1024, 1024),
+}
+
+# Cache de resultados da compressão (0 MB desliga)
+app.config['COMPRESS_CACHE_MAX_MB'] = int(os.getenv("COMPRESS_CACHE_MAX_MB", 2048))
+app.config['COMPRESS_CACHE_MAX_AGE_H'] = float(os.getenv("COMPRESS_CACHE_MAX_AGE_H", 24 * 7))
+
+# Miniaturas das páginas (organize/split) renderizadas no servidor: cache LRU em
+# disco por documento/página/tamanho; THUMB_MAX_PAGES = páginas por pedido de intervalo.
+# O PDF e as imagens somem THUMB_MAX_AGE_H depois do último uso (janitor) ou
+# quando o organize/split daquele arquivo é aceito.
+app.config['THUMB_CACHE_MAX_MB'] = int(os.getenv("THUMB_CACHE_MAX_MB", 512))
+app.config['THUMB_MAX_AGE_H'] = float(os.getenv("THUMB_MAX_AGE_H", 2))
+app.config['THUMB_FORMAT'] = os.getenv("THUMB_FORMAT", "webp").lower()
+app.config['THUMB_MAX_PAGES'] = int(os.getenv("THUMB_MAX_PAGES", 40))
+
+# Estado das tarefas: "memory" (um processo só, dev) ou "sqlite" (compartilhado
+# entre workers/processos). Tarefas sem atualização há TASK_TTL_S somem.
+app.config['TASK_STORE'] = os.getenv("TASK_STORE", "memory").lower()
+app.config['TASK_STORE_DB'] = os.getenv("TASK_STORE_DB", "tasks.db")
+app.config['TASK_TTL_S'] = float(os.getenv("TASK_TTL_S", 6 * 3600))
+
+# Agendador das operações pesadas: quantas rodam ao mesmo tempo por tipo,
+# quantas podem esperar na fila (por tipo) e quanto uma requisição síncrona espera.
+app.config['JOB_LIMITS'] = {
+    'compress': int(os.getenv("JOB_LIMIT_COMPRESS", 2)),
+    'convert': int(os.getenv("JOB_LIMIT_CONVERT", 2)),
+    'merge': int(os.getenv("JOB_LIMIT_MERGE", 4)),
+    'split': int(os.getenv("JOB_LIMIT_SPLIT", 2)),
+    'organize': int(os.getenv("JOB_LIMIT_ORGANIZE", 4)),
+    'thumbnail': int(os.getenv("JOB_LIMIT_THUMBNAIL", 2)),
+}
+app.config['JOB_QUEUE_MAX'] = int(os.getenv("JOB_QUEUE_MAX", 20))
+app.config['JOB_QUEUE_MAX_WAIT_S'] = float(os.getenv("JOB_QUEUE_MAX_WAIT_S", 60))
+# menor arquivo primeiro, mas quem já esperou isso tudo passa na frente
+app.config['JOB_AGING_S'] = float(os.getenv("JOB_AGING_S", 30))
+
+# Resultados prontos continuam disponíveis RESULT_TTL_S depois do 1º download
+# (retomar com Range, baixar de novo). DOWNLOAD_ACCEL entrega pelo proxy:
+# "" (Flask/gunicorn, com sendfile), "x-sendfile" (Apache/lighttpd) ou "x-accel"
+# (nginx: DOWNLOAD_ACCEL_PREFIX é a location `internal` que aponta para processed/).
+app.config['RESULT_TTL_S'] = float(os.getenv("RESULT_TTL_S", 3600))
+app.config['DOWNLOAD_ACCEL'] = os.getenv("DOWNLOAD_ACCEL", "").lower()
+app.config['DOWNLOAD_ACCEL_PREFIX'] = os.getenv("DOWNLOAD_ACCEL_PREFIX", "/_processed/")
+
+# Limpeza automática de uploads/ e processed/ (arquivos mais velhos que o limite)
+app.config['JANITOR_ENABLED'] = os.getenv("JANITOR_ENABLED", "True").lower() in ("true", "1", "yes")
+app.config['JANITOR_INTERVAL_S'] = float(os.getenv("JANITOR_INTERVAL_S", 600))
+app.config['UPLOAD_MAX_AGE_H'] = float(os.getenv("UPLOAD_MAX_AGE_H", 6))
+app.config['PROCESSED_MAX_AGE_H'] = float(os.getenv("PROCESSED_MAX_AGE_H", 6))
+
+# Bibliotecas carregadas já no startup (ex.: "fitz,pdfplumber"); as demais, no 1º uso
+app.config['WARMUP_MODULES'] = [
+    name.strip() for name in os.getenv("WARMUP_MODULES", "").split(",") if name.strip()
+]
+
+# Profiling sob demanda (logs/profiles): header X-ZG-Profile ou ?profile= com o
+# PROFILE_TOKEN, ou uma porcentagem dos POSTs. Sem token, só a amostragem vale.
+app.config['PROFILE_ENABLED'] = os.getenv("PROFILE_ENABLED", "False").lower() in ("true", "1", "yes")
+app.config['PROFILE_TOKEN'] = os.getenv("PROFILE_TOKEN", "")
+app.config['PROFILE_SAMPLE_PCT'] = float(os.getenv("PROFILE_SAMPLE_PCT", 0))
+app.config['PROFILE_KEEP'] = max(int(os.getenv("PROFILE_KEEP", 200)), 1)
+
+# Partes do split geradas em paralelo num pool de processos próprio; PDFs com
+# menos de SPLIT_PARALLEL_MIN_PAGES páginas são divididos no próprio processo.
+app.config['PDF_WORKERS'] = int(os.getenv("PDF_WORKERS", max((os.cpu_count() or 2) // 2, 1)))
+app.config['SPLIT_PARALLEL_MIN_PAGES'] = int(os.getenv("SPLIT_PARALLEL_MIN_PAGES", 200))
+# Merge une streams/fontes idênticos entre as entradas (logos, papel timbrado, anexos)
+app.config['MERGE_DEDUP'] = os.getenv("MERGE_DEDUP", "True").lower() in ("true", "1", "yes")
+# Máximo de intervalos no split por intervalos ("1-3, 7, 10-40, 41-fim")
+app.config['SPLIT_MAX_RANGES'] = int(os.getenv("SPLIT_MAX_RANGES", 200))
+
+# Merge/split/organize a partir de ASYNC_PDF_MIN_MB rodam como tarefa em background
+# (task_id + /progress + /download); abaixo disso, a resposta continua síncrona.
+app.config['ASYNC_PDF_MIN_MB'] = float(os.getenv("ASYNC_PDF_MIN_MB", 20))
+
+# Merge/split/organize: acima de LARGE_PDF_MIN_MB as partes e o resultado vão
+# direto para o disco (sem BytesIO), e o cache do MuPDF é esvaziado sempre que o
+# RSS do processo passa de PDF_MEMORY_BUDGET_MB.
+app.config['LARGE_PDF_MIN_MB'] = float(os.getenv("LARGE_PDF_MIN_MB", 50))
+app.config['PDF_MEMORY_BUDGET_MB'] = float(os.getenv("PDF_MEMORY_BUDGET_MB", 768))
+
+# Compressão em partes (shards) para PDFs muito grandes
+app.config['SHARD_MIN_MB'] = float(os.getenv("SHARD_MIN_MB", 150))
+app.config['SHARD_MIN_PAGES'] = int(os.getenv("SHARD_MIN_PAGES", 500))
+app.config['SHARD_PAGES'] = int(os.getenv("SHARD_PAGES", 200))
+# O gs faz subset das fontes em cada parte, então a mesma fonte volta uma vez
+# por parte. Se essas cópias passarem desta % da saída, roda também uma
+# passada única e fica com o menor.
+app.config['SHARD_FONT_OVERHEAD_PCT'] = float(os.getenv("SHARD_FONT_OVERHEAD_PCT", 5))
+
 # =================== LOGGING GLOBAL ===================
 
 PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -94,38 +272,837 @@ log = logging.getLogger("zg_pdf")
 WORK_DIR = tempfile.gettempdir() if getattr(sys, 'frozen', False) else os.getcwd()
 UPLOAD_FOLDER = os.path.join(WORK_DIR, 'uploads')
 PROCESSED_FOLDER = os.path.join(WORK_DIR, 'processed')
+COMPRESS_CACHE_FOLDER = os.path.join(WORK_DIR, 'cache', 'compress')
+THUMB_CACHE_FOLDER = os.path.join(WORK_DIR, 'cache', 'thumbs')
 
-for folder in [UPLOAD_FOLDER, PROCESSED_FOLDER]:
+for folder in [UPLOAD_FOLDER, PROCESSED_FOLDER, COMPRESS_CACHE_FOLDER, THUMB_CACHE_FOLDER]:
     os.makedirs(folder, exist_ok=True)
 
 # Logs / tasks
-COMPRESSION_LOG_FILE = 'compression_log.json'
-log_lock = threading.Lock()
-tasks_lock = threading.Lock()
-tasks = {}
+COMPRESSION_LOG_DB = os.getenv("COMPRESSION_LOG_DB", 'compression_log.db')
+COMPRESSION_LOG_FILE = 'compression_log.json'  # formato antigo, importado uma vez para o banco
+
+# Pool global de processos do Ghostscript (criado sob demanda)
+gs_pool = None
+gs_pool_lock = threading.Lock()
+# Fila de progresso (worker -> processo principal) e estado de páginas por tarefa
+gs_progress_queue = None
+task_progress = {}
+task_progress_lock = threading.Lock()
+# Pool de processos do split (extração de partes com PyMuPDF)
+pdf_pool = None
+pdf_pool_lock = threading.Lock()
+cache_lock = threading.Lock()
+thumb_cache_lock = threading.Lock()
 
 # Ajuste Ghostscript por SO
 GS_CMD = "gswin64c" if platform.system() == "Windows" else "gs"
 
-# Pytesseract: sem caminho fixo no Linux
-if platform.system() == "Windows":
-    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-
 if platform.system() != "Windows":
     os.environ.setdefault("TESSDATA_PREFIX", "/usr/share/tesseract-ocr/5/tessdata")
+# ---------------------------- Estado das tarefas ----------------------------
+class TaskStore:
+    """
+    Estado das tarefas assíncronas (progresso, arquivo de saída, erro, resumo).
+    `get` devolve uma cópia; toda escrita passa por `create`/`update`/`pop`,
+    que são atômicas e renovam o TTL da tarefa.
+    """
+    EVICT_INTERVAL_S = 60
+
+    def __init__(self, ttl_s: float):
+        self.ttl_s = ttl_s
+        self._last_evict = 0.0
+
+    def get(self, task_id):
+        raise NotImplementedError
+
+    def create(self, task_id, data: dict) -> None:
+        raise NotImplementedError
+
+    def update(self, task_id, **fields) -> bool:
+        """Aplica os campos; devolve False se a tarefa não existe (mais)."""
+        raise NotImplementedError
+
+    def pop(self, task_id):
+        raise NotImplementedError
+
+    def touch(self, task_id, ttl_s: float) -> None:
+        """Troca o prazo da tarefa (ex.: janela de retenção depois do download)."""
+        raise NotImplementedError
+
+    def evict_expired(self) -> list:
+        """Remove as tarefas vencidas e as devolve."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def wait_for_change(self, task_id, known, timeout: float):
+        """Espera até o estado ficar diferente de `known` (ou o timeout); devolve o atual."""
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        """Remove as tarefas vencidas junto com o resultado que ainda estava guardado."""
+        self._last_evict = time.time()
+        expired = self.evict_expired()
+        for task in expired:
+            file_path = task.get('file')
+            if file_path:
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.warning(f"Erro ao remover resultado expirado {file_path}: {e}")
+        if expired:
+            logging.info(f"{len(expired)} tarefa(s) expirada(s) removida(s) do estado.")
+        return len(expired)
+
+    def _maybe_evict(self) -> None:
+        if time.time() - self._last_evict >= self.EVICT_INTERVAL_S:
+            self.sweep()
+
+
+class MemoryTaskStore(TaskStore):
+    """Dict em memória: só enxerga as tarefas do próprio processo."""
+
+    def __init__(self, ttl_s: float):
+        super().__init__(ttl_s)
+        self._tasks = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+        # acorda quem acompanha uma tarefa (SSE) quando o estado dela muda
+        self._changed = threading.Condition(self._lock)
+
+    def get(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def create(self, task_id, data: dict) -> None:
+        self._maybe_evict()
+        with self._lock:
+            self._tasks[task_id] = dict(data)
+            self._expires[task_id] = time.time() + self.ttl_s
+            self._changed.notify_all()
+
+    def update(self, task_id, **fields) -> bool:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return False
+            task.update(fields)
+            self._expires[task_id] = time.time() + self.ttl_s
+            self._changed.notify_all()
+            return True
+
+    def pop(self, task_id):
+        with self._lock:
+            self._expires.pop(task_id, None)
+            task = self._tasks.pop(task_id, None)
+            self._changed.notify_all()
+            return task
+
+    def touch(self, task_id, ttl_s: float) -> None:
+        with self._lock:
+            if task_id in self._tasks:
+                self._expires[task_id] = time.time() + ttl_s
+
+    def evict_expired(self) -> list:
+        now = time.time()
+        with self._lock:
+            expired = [task_id for task_id, expires in self._expires.items() if expires <= now]
+            for task_id in expired:
+                self._expires.pop(task_id, None)
+            return [task for task in (self._tasks.pop(task_id, None) for task_id in expired) if task]
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._tasks)
+
+    def wait_for_change(self, task_id, known, timeout: float):
+        deadline = time.time() + timeout
+        with self._changed:
+            while True:
+                task = self._tasks.get(task_id)
+                remaining = deadline - time.time()
+                if task != known or remaining <= 0:
+                    return dict(task) if task is not None else None
+                self._changed.wait(remaining)
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    Uma linha JSON por tarefa num SQLite em WAL, compartilhado por todos os
+    workers da máquina. Escritas usam BEGIN IMMEDIATE (ler-alterar-gravar atômico).
+    Cada thread mantém a própria conexão (refeita depois de um fork).
+    """
+    POLL_S = 0.25
+
+    def __init__(self, path: str, ttl_s: float):
+        super().__init__(ttl_s)
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        # WAL fica gravado no arquivo do banco: basta pedir uma vez
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_expires_at ON tasks (expires_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Conexão da thread atual; synchronous vale por conexão, então vai junto."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, task_id):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT data FROM tasks WHERE task_id = ? AND expires_at > ?",
+            (task_id, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def create(self, task_id, data: dict) -> None:
+        self._maybe_evict()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO tasks (task_id, data, expires_at) VALUES (?, ?, ?)",
+            (task_id, json.dumps(data, ensure_ascii=False), time.time() + self.ttl_s),
+        )
+
+    def update(self, task_id, **fields) -> bool:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            task = json.loads(row[0])
+            task.update(fields)
+            conn.execute(
+                "UPDATE tasks SET data = ?, expires_at = ? WHERE task_id = ?",
+                (json.dumps(task, ensure_ascii=False), time.time() + self.ttl_s, task_id),
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def pop(self, task_id):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return json.loads(row[0]) if row else None
+
+    def touch(self, task_id, ttl_s: float) -> None:
+        conn = self._connect()
+        conn.execute("UPDATE tasks SET expires_at = ? WHERE task_id = ?", (time.time() + ttl_s, task_id))
+
+    def evict_expired(self) -> list:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            rows = conn.execute("SELECT data FROM tasks WHERE expires_at <= ?", (now,)).fetchall()
+            conn.execute("DELETE FROM tasks WHERE expires_at <= ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self) -> int:
+        conn = self._connect()
+        return conn.execute("SELECT COUNT(*) FROM tasks WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+
+    def wait_for_change(self, task_id, known, timeout: float):
+        # sem notificação entre processos: relê o banco em intervalos curtos
+        deadline = time.time() + timeout
+        while True:
+            task = self.get(task_id)
+            if task != known or time.time() >= deadline:
+                return task
+            time.sleep(min(self.POLL_S, max(deadline - time.time(), 0)))
+
+
+def create_task_store() -> TaskStore:
+    backend = app.config['TASK_STORE']
+    ttl_s = app.config['TASK_TTL_S']
+    if backend == "sqlite":
+        return SQLiteTaskStore(app.config['TASK_STORE_DB'], ttl_s)
+    if backend != "memory":
+        logging.warning(f"TASK_STORE desconhecido ({backend}); usando memória.")
+    return MemoryTaskStore(ttl_s)
+
+
+task_store = create_task_store()
+
+
+# ---------------------------- Agendador de operações pesadas ----------------------------
+class SchedulerBusy(Exception):
+    """Fila da operação cheia (ou espera longa demais): vira HTTP 429."""
+
+    def __init__(self, operation: str, queue_position: int, retry_after_s: int):
+        super().__init__(f"Fila de {operation} cheia.")
+        self.operation = operation
+        self.queue_position = queue_position
+        self.retry_after_s = retry_after_s
+
+
+class JobScheduler:
+    """
+    Um único ponto de entrada para compressão, conversão (inclui OCR), merge,
+    split e organize. Cada operação tem um limite de execuções simultâneas e
+    uma fila limitada; na fila, o menor arquivo sai primeiro (com envelhecimento
+    para o grande não esperar para sempre).
+
+    - `slot()` é para rotas síncronas: a própria thread da requisição espera a vez.
+    - `submit()` é para tarefas em background: a thread só nasce quando há vaga.
+    """
+
+    def __init__(self, limits: dict, max_queue: int, max_wait_s: float, aging_s: float):
+        self.limits = dict(limits)
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.aging_s = aging_s
+        self._lock = threading.Lock()
+        self._running = {op: 0 for op in self.limits}
+        self._queues = {op: [] for op in self.limits}
+        self._avg_s = {op: 10.0 for op in self.limits}  # média móvel da duração, p/ o Retry-After
+        self._seq = 0
+
+    def _retry_after(self, operation: str, position: int) -> int:
+        return max(1, math.ceil(self._avg_s[operation] * position / self.limits[operation]))
+
+    def _position(self, operation: str, job: dict) -> int:
+        queue = self._queues[operation]
+        return 1 + sum(1 for other in queue if (other["size"], other["seq"]) < (job["size"], job["seq"]))
+
+    def _enqueue(self, operation: str, size: int, run=None, on_queued=None) -> dict:
+        with self._lock:
+            self._seq += 1
+            job = {
+                "size": size,
+                "seq": self._seq,
+                "queued_at": time.time(),
+                "run": run,
+                "event": threading.Event(),
+                "granted": False,
+            }
+            queue = self._queues[operation]
+            if not queue and self._running[operation] < self.limits[operation]:
+                self._running[operation] += 1
+                job["granted"] = True
+                return job
+            if len(queue) >= self.max_queue:
+                position = len(queue) + 1
+                raise SchedulerBusy(operation, position, self._retry_after(operation, position))
+            queue.append(job)
+            if on_queued:
+                # ainda com o lock: a vaga não pode ser liberada antes de avisarmos a posição
+                on_queued(self._position(operation, job))
+            return job
+
+    def _next(self, operation: str) -> dict:
+        queue = self._queues[operation]
+        oldest = min(queue, key=lambda job: job["seq"])
+        if time.time() - oldest["queued_at"] >= self.aging_s:
+            return oldest
+        return min(queue, key=lambda job: (job["size"], job["seq"]))
+
+    def _release(self, operation: str, elapsed_s: float) -> None:
+        to_start = []
+        with self._lock:
+            self._running[operation] -= 1
+            self._avg_s[operation] = 0.8 * self._avg_s[operation] + 0.2 * elapsed_s
+            queue = self._queues[operation]
+            while queue and self._running[operation] < self.limits[operation]:
+                job = self._next(operation)
+                queue.remove(job)
+                self._running[operation] += 1
+                job["granted"] = True
+                if job["run"]:
+                    to_start.append(job["run"])
+                else:
+                    job["event"].set()
+        for run in to_start:
+            self._start(operation, run)
+
+    def _start(self, operation: str, run) -> None:
+        def target():
+            started = time.time()
+            try:
+                run()
+            finally:
+                self._release(operation, time.time() - started)
+        threading.Thread(target=target, daemon=True).start()
+
+    @contextmanager
+    def slot(self, operation: str, size: int = 0):
+        job = self._enqueue(operation, size)
+        if not job["granted"] and not job["event"].wait(self.max_wait_s):
+            with self._lock:
+                if not job["granted"]:
+                    position = self._position(operation, job)
+                    self._queues[operation].remove(job)
+                    raise SchedulerBusy(operation, position, self._retry_after(operation, position))
+        started = time.time()
+        try:
+            yield
+        finally:
+            self._release(operation, time.time() - started)
+
+    def snapshot(self) -> dict:
+        """{operação: {"running": n, "queued": n, "limit": n}} para o /metrics."""
+        with self._lock:
+            return {
+                op: {"running": self._running[op], "queued": len(self._queues[op]), "limit": self.limits[op]}
+                for op in self.limits
+            }
+
+    def submit(self, operation: str, size: int, fn, *args, on_queued=None) -> None:
+        """Roda fn(*args) numa thread quando houver vaga; on_queued(posição) se precisar esperar."""
+        job = self._enqueue(operation, size, run=functools.partial(fn, *args), on_queued=on_queued)
+        if job["granted"]:
+            self._start(operation, job["run"])
+
+
+job_scheduler = JobScheduler(
+    app.config['JOB_LIMITS'],
+    app.config['JOB_QUEUE_MAX'],
+    app.config['JOB_QUEUE_MAX_WAIT_S'],
+    app.config['JOB_AGING_S'],
+)
+
+
+@app.errorhandler(SchedulerBusy)
+def scheduler_busy(e):
+    msg = (
+        f"Servidor ocupado. Tente novamente em {e.retry_after_s} s "
+        f"(posição na fila: {e.queue_position})."
+    )
+    logging.warning(f"Fila de {e.operation} cheia; requisição recusada (posição {e.queue_position}).")
+    response = jsonify({
+        'error': msg,
+        'message': msg,
+        'queue_position': e.queue_position,
+        'retry_after_s': e.retry_after_s,
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after_s)
+    return response
+
+
+def heavy_operation(operation: str, size=None, background=None):
+    """
+    Decorator das rotas síncronas pesadas: a view só roda com vaga no agendador.
+    size() dá a prioridade em bytes; sem ele, vale o total enviado na requisição.
+    Se background() for True, a view só enfileira uma tarefa (submit) e roda
+    sem ocupar vaga; ela vê `g.background_task`.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if background and background():
+                g.background_task = True
+                return view(*args, **kwargs)
+            if size:
+                job_size = size()
+            else:
+                # uploads multipart já estão em disco quando request.files é lido
+                request.files
+                job_size = request.upload_bytes or request.content_length or 0
+            with job_scheduler.slot(operation, job_size):
+                return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ---------------------------- Métricas ----------------------------
+# Segundos: cobre de um merge pequeno (~50 ms) a um gs de PDF enorme (minutos)
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Metrics:
+    """
+    Contadores e histogramas em memória, exportados no formato texto do
+    Prometheus. Valem para o processo (cada worker do gunicorn tem os seus).
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}    # (nome, labels) -> valor
+        self._histograms = {}  # (nome, labels) -> [contagens por bucket..., soma, total]
+        self._help = {}
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, labels: dict = None, value: float = 1) -> None:
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict = None) -> None:
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()) -> str:
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        def escape(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in items) + "}"
+
+    def render(self, gauges=()) -> str:
+        """gauges: [(nome, labels dict, valor)] calculados na hora do scrape."""
+        lines = []
+        seen = set()
+
+        def header(name, default_kind):
+            if name in seen:
+                return
+            seen.add(name)
+            kind, help_text = self._help.get(name, (default_kind, name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(hist)) for key, hist in self._histograms.items())
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{self._labels(labels)} {value}")
+
+        for (name, labels), hist in histograms:
+            header(name, "histogram")
+            for bound, count in zip(self.buckets, hist):
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {hist[-1]}")
+            lines.append(f"{name}_sum{self._labels(labels)} {round(hist[-2], 6)}")
+            lines.append(f"{name}_count{self._labels(labels)} {hist[-1]}")
+
+        # uma família de métrica fica toda junta no texto
+        for name, labels, value in sorted(gauges, key=lambda gauge: gauge[0]):
+            header(name, "gauge")
+            lines.append(f"{name}{self._labels(sorted(labels.items()))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("zg_http_requests_total", "counter", "Requisições por rota, método e status.")
+metrics.describe("zg_http_request_duration_seconds", "histogram", "Latência por rota (até a resposta sair da view).")
+metrics.describe("zg_stage_duration_seconds", "histogram", "Duração de cada etapa interna (gs, LibreOffice, OCR...).")
+metrics.describe("zg_scheduler_queue_depth", "gauge", "Pedidos esperando vaga no agendador, por operação.")
+metrics.describe("zg_scheduler_running", "gauge", "Pedidos em execução no agendador, por operação.")
+metrics.describe("zg_scheduler_limit", "gauge", "Limite de execuções simultâneas, por operação.")
+metrics.describe("zg_tasks_active", "gauge", "Tarefas assíncronas no TaskStore (em andamento ou aguardando download).")
+metrics.describe("zg_folder_bytes", "gauge", "Bytes ocupados nas pastas temporárias.")
+metrics.describe("zg_process_resident_memory_bytes", "gauge", "RSS deste processo.")
+metrics.describe("zg_janitor_reclaimed_bytes_total", "counter", "Bytes liberados pelo janitor desde o startup.")
+metrics.describe("zg_janitor_files_removed_total", "counter", "Arquivos removidos pelo janitor desde o startup.")
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    metrics.observe("zg_stage_duration_seconds", seconds, {"stage": stage})
+
+
+@contextmanager
+def stage_timer(stage: str, sink: dict = None):
+    """
+    Mede uma etapa interna. Dentro do pool de processos passe `sink` (um dict):
+    o tempo volta no resultado do job e é registrado no processo principal.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        if sink is not None:
+            sink[stage] = sink.get(stage, 0.0) + elapsed
+        else:
+            observe_stage(stage, elapsed)
+
+
+# ---------------------------- Profiling sob demanda ----------------------------
+PROFILE_DIR = os.path.join(LOG_DIR, "profiles")
+PROFILE_HEADER = "X-ZG-Profile"
+
+# cProfile e tracemalloc valem para o processo: uma captura por vez
+profile_lock = threading.Lock()
+
+
+class ProfileCapture:
+    """
+    cProfile + pico do tracemalloc de uma requisição ou tarefa em background.
+    Grava em `logs/profiles/` um `.prof` (pstats/snakeviz) e um `.json` com o
+    resumo (tempo, CPU, pico de memória, funções e linhas que mais alocaram).
+    O trabalho feito no pool de processos (gs) aparece só como espera.
+    """
+
+    def __init__(self, label: str, kind: str, **info):
+        self.label = label
+        self.kind = kind  # "request" ou "task"
+        self.info = info
+        self.profiler = None
+        self._owns_tracemalloc = False
+
+    def start(self) -> bool:
+        if not profile_lock.acquire(blocking=False):
+            logging.info(f"[profile] captura de {self.label} ignorada: já existe outra em andamento.")
+            return False
+        import cProfile
+        import tracemalloc
+
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start(10)
+            self._owns_tracemalloc = True
+        self.started_at = datetime.utcnow().isoformat() + "Z"
+        self.wall_t0 = time.perf_counter()
+        self.cpu_t0 = time.thread_time()
+        self.rss_before_mb = process_rss_mb()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        return True
+
+    def stop(self, **info):
+        """Encerra a captura e grava os arquivos; devolve o caminho do resumo."""
+        if self.profiler is None:
+            return None
+        import pstats
+        import tracemalloc
+
+        self.profiler.disable()
+        wall_s = time.perf_counter() - self.wall_t0
+        cpu_s = time.thread_time() - self.cpu_t0
+        try:
+            _, peak = tracemalloc.get_traced_memory()
+            top_allocations = [
+                {"where": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in tracemalloc.take_snapshot().statistics("lineno")[:15]
+            ]
+        finally:
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+            profiler, self.profiler = self.profiler, None
+            profile_lock.release()
+
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            base = os.path.join(PROFILE_DIR, f"{stamp}_{secure_filename(str(self.label))}_{self.kind}")
+            profiler.dump_stats(base + ".prof")
+
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(30)
+            summary = {
+                "label": self.label,
+                "kind": self.kind,
+                "started_at": self.started_at,
+                "wall_s": round(wall_s, 4),
+                "cpu_s": round(cpu_s, 4),
+                "tracemalloc_peak_mb": round(peak / (1024 * 1024), 2),
+                "rss_before_mb": self.rss_before_mb,
+                "rss_after_mb": process_rss_mb(),
+                **self.info,
+                **info,
+                "top_allocations": top_allocations,
+                "top_functions": text.getvalue().splitlines(),
+            }
+            with open(base + ".json", "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+            logging.info(
+                f"[profile] {self.kind} {self.label}: {wall_s:.2f}s, pico tracemalloc "
+                f"{summary['tracemalloc_peak_mb']} MB -> {base}.prof"
+            )
+            prune_profiles()
+            return base + ".json"
+        except Exception as e:
+            logging.warning(f"[profile] Falha gravando captura de {self.label}: {e}")
+            return None
+
+
+def prune_profiles() -> None:
+    """Mantém só as `PROFILE_KEEP` capturas mais recentes."""
+    try:
+        names = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith(".json"))
+    except FileNotFoundError:
+        return
+    for name in names[:max(len(names) - app.config['PROFILE_KEEP'], 0)]:
+        base = os.path.join(PROFILE_DIR, name[:-len(".json")])
+        for path in (base + ".json", base + ".prof"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def profile_requested() -> bool:
+    """Header/query com o PROFILE_TOKEN ou, nos POSTs, a amostragem PROFILE_SAMPLE_PCT."""
+    if not app.config['PROFILE_ENABLED']:
+        return False
+    token = app.config['PROFILE_TOKEN']
+    flag = request.headers.get(PROFILE_HEADER) or request.args.get('profile')
+    if token and flag and hmac.compare_digest(flag, token):
+        return True
+    sample_pct = app.config['PROFILE_SAMPLE_PCT']
+    return request.method == "POST" and sample_pct > 0 and random.random() * 100 < sample_pct
+
+
+def profile_handoff() -> bool:
+    """
+    Para rotas que só enfileiram uma tarefa: fecha a captura da requisição e
+    devolve True se a tarefa em background deve ser perfilada no lugar dela.
+    """
+    capture = g.pop('profile', None)
+    if capture is None:
+        return False
+    capture.label = g.get('task_id') or capture.label
+    g.profile_id = capture.label
+    capture.stop(status=202, handoff=True)
+    return True
+
+
+def profiled(fn, label: str, **info):
+    """Envolve a função de uma tarefa em background numa ProfileCapture."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        capture = ProfileCapture(label, "task", **info)
+        capture.start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            capture.stop()
+    return wrapper
+
+
 # ---------------------------- Utils ----------------------------
+def process_rss_mb(pid="self") -> float:
+    """RSS de um processo em MB (Linux, via /proc); 0 onde não der para medir."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _compression_log_db() -> sqlite3.Connection:
+    # WAL: vários processos gravam ao mesmo tempo e leitores não bloqueiam
+    conn = sqlite3.connect(COMPRESSION_LOG_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _compression_log_row(log_data: dict) -> tuple:
+    return (
+        log_data.get("task_id"),
+        log_data.get("finished_at"),
+        log_data.get("compression_type"),
+        log_data.get("files_count"),
+        log_data.get("total_input_mb"),
+        log_data.get("total_output_mb"),
+        log_data.get("total_reduction_pct"),
+        log_data.get("time_taken_seconds"),
+        log_data.get("status"),
+        json.dumps(log_data, ensure_ascii=False),
+    )
+
+
+_COMPRESSION_LOG_INSERT = """
+    INSERT INTO compression_log (
+        task_id, finished_at, compression_type, files_count, total_input_mb,
+        total_output_mb, total_reduction_pct, time_taken_seconds, status, data
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def init_compression_log() -> None:
+    """Cria a tabela e importa o compression_log.json antigo, se existir."""
+    with closing(_compression_log_db()) as conn, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS compression_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id TEXT,
+                finished_at TEXT,
+                compression_type TEXT,
+                files_count INTEGER,
+                total_input_mb REAL,
+                total_output_mb REAL,
+                total_reduction_pct REAL,
+                time_taken_seconds REAL,
+                status TEXT,
+                data TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_compression_log_finished ON compression_log (finished_at)")
+
+        if os.path.exists(COMPRESSION_LOG_FILE):
+            try:
+                with open(COMPRESSION_LOG_FILE, 'r', encoding='utf-8') as f:
+                    legacy = json.load(f)
+                conn.executemany(_COMPRESSION_LOG_INSERT, [_compression_log_row(d) for d in legacy])
+                os.replace(COMPRESSION_LOG_FILE, COMPRESSION_LOG_FILE + '.migrated')
+                logging.info(f"{len(legacy)} registros de {COMPRESSION_LOG_FILE} importados para {COMPRESSION_LOG_DB}.")
+            except (OSError, ValueError) as e:
+                logging.warning(f"Não foi possível importar {COMPRESSION_LOG_FILE}: {e}")
+
+
+init_compression_log()
+
+
 def save_compression_log(log_data: dict) -> None:
-    """Append seguro em JSON (cria se não existir)."""
-    with log_lock:
-        if not os.path.exists(COMPRESSION_LOG_FILE):
-            with open(COMPRESSION_LOG_FILE, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False)
-        with open(COMPRESSION_LOG_FILE, 'r+', encoding='utf-8') as f:
-            data = json.load(f)
-            data.append(log_data)
-            f.seek(0)
-            json.dump(data, f, indent=4, ensure_ascii=False)
-            f.truncate()
+    """Append de um registro (uma linha, O(1) por tarefa)."""
+    try:
+        with closing(_compression_log_db()) as conn, conn:
+            conn.execute(_COMPRESSION_LOG_INSERT, _compression_log_row(log_data))
+    except sqlite3.Error as e:
+        logging.error(f"Erro gravando log de compressão da tarefa {log_data.get('task_id')}: {e}")
+
+
+def _percentile(values, pct: float):
+    if not values:
+        return None
+    values = sorted(values)
+    k = max(math.ceil(pct / 100 * len(values)) - 1, 0)
+    return values[k]
 
 
 def get_pdf_page_count(pdf_path: str) -> int:
@@ -138,12 +1115,988 @@ def get_pdf_page_count(pdf_path: str) -> int:
         return 0
 
 
-def get_estimated_compression_ratio(compression_type: str) -> float:
-    ratios = {
-        'screen': 0.20,  # ~80% de compressão
-        'ebook': 0.40,   # ~60% de compressão
+# Resolução-alvo das imagens em cada PDFSETTINGS do Ghostscript
+GS_PRESET_IMAGE_DPI = {
+    'screen': 72,
+    'ebook': 150,
+    'printer': 300,
+    'prepress': 300,
+}
+
+# Passo agressivo: força 72 dpi e JPEG em todas as imagens
+GS_AGGRESSIVE_FLAGS = [
+    '-dDownsampleColorImages=true', '-dColorImageResolution=72', '-dAutoFilterColorImages=false', '-dColorImageFilter=/DCTEncode',
+    '-dGrayImageResolution=72', '-dDownsampleGrayImages=true', '-dAutoFilterGrayImages=false', '-dGrayImageFilter=/DCTEncode',
+    '-dMonoImageResolution=72', '-dDownsampleMonoImages=true',
+]
+
+FONT_FILE_SUBTYPES = ('/Type1C', '/CIDFontType0C', '/OpenType')
+
+
+def _xref_stream_length(doc, xref: int) -> int:
+    """Tamanho do stream pelo /Length; só lê o conteúdo se o /Length for indireto."""
+    kind, value = doc.xref_get_key(xref, "Length")
+    if kind == 'int':
+        return int(value)
+    return len(doc.xref_stream_raw(xref) or b'')
+
+
+def analyze_pdf(pdf_path: str) -> dict:
+    """
+    Raio-X barato do PDF com PyMuPDF (sem renderizar nada):
+    quantas imagens, quanto do arquivo é imagem/fonte/outros streams,
+    quanto está sem filtro e a resolução efetiva das imagens.
+    """
+    total_bytes = os.path.getsize(pdf_path)
+    image_bytes = font_bytes = other_stream_bytes = 0
+    unfiltered_bytes = unfiltered_image_bytes = 0
+    image_count = 0
+    max_image_dpi = 0.0
+
+    with fitz.open(pdf_path) as doc:
+        pages = doc.page_count
+
+        for xref in range(1, doc.xref_length()):
+            if not doc.xref_is_stream(xref):
+                continue
+            length = _xref_stream_length(doc, xref)
+            subtype = doc.xref_get_key(xref, "Subtype")[1]
+
+            if subtype == '/Image':
+                image_count += 1
+                image_bytes += length
+            elif subtype in FONT_FILE_SUBTYPES or doc.xref_get_key(xref, "Length1")[0] != 'null':
+                font_bytes += length
+            else:
+                other_stream_bytes += length
+
+            if doc.xref_get_key(xref, "Filter")[0] == 'null':
+                unfiltered_bytes += length
+                if subtype == '/Image':
+                    unfiltered_image_bytes += length
+
+        # dpi aproximado: largura da imagem em px / largura da página em polegadas
+        if image_count:
+            for page in doc:
+                page_width_in = page.rect.width / 72 or 1
+                for img in page.get_images(full=True):
+                    max_image_dpi = max(max_image_dpi, img[2] / page_width_in)
+
+    share = (lambda n: n / total_bytes) if total_bytes else (lambda n: 0.0)
+    return {
+        "pages": pages,
+        "total_bytes": total_bytes,
+        "image_count": image_count,
+        "image_bytes": image_bytes,
+        "font_bytes": font_bytes,
+        "other_stream_bytes": other_stream_bytes,
+        "unfiltered_bytes": unfiltered_bytes,
+        "unfiltered_image_bytes": unfiltered_image_bytes,
+        "image_share": share(image_bytes),
+        "font_share": share(font_bytes),
+        "unfiltered_share": share(unfiltered_bytes),
+        "max_image_dpi": round(max_image_dpi, 1),
     }
-    return ratios.get(compression_type, 0.30)
+
+
+def choose_compression_strategy(analysis: dict, compression_type: str) -> str:
+    """
+    'skip'       -> nada a ganhar (sem imagens, streams já comprimidos, fontes pequenas)
+    'aggressive' -> dominado por imagens que o preset não reduziria; vai direto às flags agressivas
+    'standard'   -> preset normal, com fallback agressivo se não houver ganho
+    """
+    if (analysis["image_share"] < 0.02
+            and analysis["unfiltered_share"] < 0.02
+            and analysis["font_share"] < 0.10):
+        return 'skip'
+
+    preset_dpi = GS_PRESET_IMAGE_DPI.get(compression_type, 72)
+    if (analysis["image_share"] >= 0.5
+            and 0 < analysis["max_image_dpi"] <= preset_dpi
+            and analysis["max_image_dpi"] > 72):
+        return 'aggressive'
+
+    return 'standard'
+
+
+def estimate_compressed_size(analysis: dict, compression_type: str, strategy: str = 'standard') -> int:
+    """Estimativa do tamanho final (bytes) a partir da composição do PDF."""
+    total = analysis["total_bytes"]
+    if strategy == 'skip' or total == 0:
+        return total
+
+    target_dpi = 72 if strategy == 'aggressive' else GS_PRESET_IMAGE_DPI.get(compression_type, 72)
+    dpi = analysis["max_image_dpi"]
+    # reamostragem reduz os pixels com o quadrado da razão de resolução
+    image_factor = min(1.0, (target_dpi / dpi) ** 2) if dpi > 0 else 1.0
+    if strategy == 'aggressive':
+        image_factor *= 0.5  # JPEG forçado
+
+    # pixels crus (sem filtro) passam a ser comprimidos pelo gs
+    image_part = analysis["image_bytes"] * image_factor
+    image_part -= analysis["unfiltered_image_bytes"] * image_factor * 0.85
+
+    other_unfiltered = analysis["unfiltered_bytes"] - analysis["unfiltered_image_bytes"]
+    other_filtered = max(analysis["other_stream_bytes"] - other_unfiltered, 0)
+
+    stream_total = analysis["image_bytes"] + analysis["font_bytes"] + analysis["other_stream_bytes"]
+    structure = max(total - stream_total, 0)
+
+    estimate = (
+        image_part
+        + analysis["font_bytes"] * 0.7             # re-subset das fontes
+        + other_filtered * 0.9
+        + other_unfiltered * 0.3                   # streams sem filtro ganham Flate
+        + structure * 0.8
+    )
+    return min(max(int(estimate), 1), total)
+
+
+def _init_gs_worker(progress_queue) -> None:
+    global gs_progress_queue
+    gs_progress_queue = progress_queue
+
+
+def get_gs_pool() -> ProcessPoolExecutor:
+    """Pool único de processos para compressão; limita quantos `gs` rodam ao mesmo tempo."""
+    global gs_pool, gs_progress_queue
+    with gs_pool_lock:
+        if gs_progress_queue is None:
+            gs_progress_queue = multiprocessing.Queue()
+            threading.Thread(target=_pump_gs_progress, args=(gs_progress_queue,), daemon=True).start()
+        if gs_pool is None:
+            gs_pool = ProcessPoolExecutor(
+                max_workers=app.config['GS_MAX_WORKERS'],
+                initializer=_init_gs_worker,
+                initargs=(gs_progress_queue,),
+            )
+            logging.info(f"Pool do Ghostscript criado com {app.config['GS_MAX_WORKERS']} processo(s).")
+        return gs_pool
+
+
+def reset_gs_pool() -> None:
+    """Descarta o pool (ex.: um worker morreu) para que o próximo uso crie outro."""
+    global gs_pool
+    with gs_pool_lock:
+        if gs_pool is not None:
+            gs_pool.shutdown(wait=False, cancel_futures=True)
+            gs_pool = None
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    """Pool de processos para gerar partes do split em paralelo (`PDF_WORKERS`)."""
+    global pdf_pool
+    with pdf_pool_lock:
+        if pdf_pool is None:
+            pdf_pool = ProcessPoolExecutor(max_workers=app.config['PDF_WORKERS'])
+            logging.info(f"Pool de extração de PDF criado com {app.config['PDF_WORKERS']} processo(s).")
+        return pdf_pool
+
+
+def reset_pdf_pool() -> None:
+    global pdf_pool
+    with pdf_pool_lock:
+        if pdf_pool is not None:
+            pdf_pool.shutdown(wait=False, cancel_futures=True)
+            pdf_pool = None
+
+
+# ---------------------------- Progresso por página ----------------------------
+def gs_page_reporter(job):
+    """Callback (roda no worker) que manda cada página do gs para o processo principal."""
+    key = job.get("progress_key")
+    queue = gs_progress_queue
+    if key is None or queue is None:
+        return None
+
+    def report(page):
+        queue.put((key[0], key[1], page))
+    return report
+
+
+def _pump_gs_progress(queue) -> None:
+    while True:
+        try:
+            task_id, unit, page = queue.get()
+        except (EOFError, OSError):
+            return
+        record_unit_pages(task_id, unit, page)
+
+
+def _format_eta(seconds: float) -> str:
+    if seconds >= 90:
+        return f"~{math.ceil(seconds / 60)} min"
+    return f"~{max(int(seconds), 1)} s"
+
+
+def start_page_progress(task_id, units: dict, files_total: int) -> None:
+    """units: {unidade: nº de páginas}. Unidade = um arquivo ou uma parte (shard)."""
+    with task_progress_lock:
+        task_progress[task_id] = {
+            "units": units,
+            "done": {unit: 0 for unit in units},
+            "files_total": files_total,
+            "files_done": 0,
+            "started": time.time(),
+            "pages_skipped": 0,  # páginas resolvidas sem gs (cache); fora do cálculo de ritmo
+            "seq": 0,            # ordem das atualizações calculadas
+            "written_seq": 0,    # última que chegou ao task_store
+            "write_lock": threading.Lock(),
+        }
+
+
+def record_unit_pages(task_id, unit, pages_done, file_done=False, skipped=False) -> None:
+    """Avança a unidade (nunca volta; o fallback recomeça do 1) e publica percent/ETA."""
+    with task_progress_lock:
+        progress = task_progress.get(task_id)
+        if not progress or unit not in progress["units"]:
+            return
+        pages_done = min(pages_done, progress["units"][unit])
+        gained = pages_done - progress["done"][unit]
+        if gained > 0:
+            progress["done"][unit] = pages_done
+            if skipped:
+                progress["pages_skipped"] += gained
+        if file_done:
+            progress["files_done"] += 1
+        if gained <= 0 and not file_done:
+            return
+
+        pages_total = sum(progress["units"].values()) or 1
+        done = sum(progress["done"].values())
+        processed = done - progress["pages_skipped"]
+        elapsed = time.time() - progress["started"]
+
+        eta_s = None
+        if processed > 0 and elapsed > 0:
+            eta_s = round((pages_total - done) / (processed / elapsed), 1)
+
+        status = f"Página {done} de {pages_total}"
+        if progress["files_total"] > 1:
+            status = f"Comprimidos {progress['files_done']} de {progress['files_total']} arquivos • {status}"
+        if eta_s is not None and done < pages_total:
+            status += f" • {_format_eta(eta_s)} restantes"
+
+        progress["seq"] += 1
+        seq = progress["seq"]
+        fields = {
+            "percent": int(done / pages_total * 90),
+            "status": status + "...",
+            "eta_s": eta_s,
+            "pages_done": done,
+            "pages_total": pages_total,
+        }
+
+    # grava fora do lock global: só as atualizações da mesma tarefa se esperam,
+    # e uma que chegue depois de outra mais nova é descartada
+    with progress["write_lock"]:
+        if seq > progress["written_seq"]:
+            task_store.update(task_id, **fields)
+            progress["written_seq"] = seq
+
+
+def finish_page_progress(task_id) -> None:
+    with task_progress_lock:
+        progress = task_progress.pop(task_id, None)
+    if progress:
+        # espera a gravação em andamento; as atrasadas não sobrescrevem o estado final
+        with progress["write_lock"]:
+            progress["written_seq"] = math.inf
+
+
+# ---------------------------- Cache de compressão ----------------------------
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 do arquivo lido em blocos (não carrega tudo na memória)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compression_cache_key(job: dict, compression_type: str) -> str:
+    # o hash normalmente já vem do upload; só relê o arquivo se faltar
+    digest = job.get("sha256") or file_sha256(job["input_path"])
+    return f"{digest}_{compression_type}"
+
+
+def compression_cache_get(key: str, job: dict):
+    """
+    Se o resultado já estiver no cache, copia para o output do job,
+    remove o input e devolve as métricas. Caso contrário, None.
+    """
+    if app.config['COMPRESS_CACHE_MAX_MB'] <= 0:
+        return None
+
+    cached_pdf = os.path.join(COMPRESS_CACHE_FOLDER, f"{key}.pdf")
+    cached_meta = os.path.join(COMPRESS_CACHE_FOLDER, f"{key}.json")
+    max_age_s = app.config['COMPRESS_CACHE_MAX_AGE_H'] * 3600
+
+    try:
+        if time.time() - os.path.getmtime(cached_pdf) > max_age_s:
+            return None
+        with open(cached_meta, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        shutil.copyfile(cached_pdf, job["output_path"])
+        os.utime(cached_pdf)  # marca como usado recentemente (LRU)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    initial_file_size = os.path.getsize(job["input_path"])
+    try:
+        os.remove(job["input_path"])
+    except Exception as e:
+        logging.warning(f"Não foi possível remover o arquivo de entrada {job['input_path']}: {e}")
+
+    res = build_compression_result(
+        job["filename"], job["output_path"], initial_file_size,
+        os.path.getsize(job["output_path"]), meta.get("pages", 0), cache_hit=True,
+    )
+    res["strategy"] = meta.get("strategy")
+    res["estimated_mb"] = meta.get("estimated_mb")
+    return res
+
+
+def compression_cache_put(key: str, res: dict) -> None:
+    """Guarda uma cópia do resultado no cache e aplica a política de expiração."""
+    if app.config['COMPRESS_CACHE_MAX_MB'] <= 0:
+        return
+
+    cached_pdf = os.path.join(COMPRESS_CACHE_FOLDER, f"{key}.pdf")
+    cached_meta = os.path.join(COMPRESS_CACHE_FOLDER, f"{key}.json")
+    tmp_pdf = f"{cached_pdf}.{uuid.uuid4().hex}.tmp"
+
+    shutil.copyfile(res["output_path"], tmp_pdf)
+    with open(cached_meta, 'w', encoding='utf-8') as f:
+        json.dump({
+            "pages": res["pages"],
+            "strategy": res.get("strategy"),
+            "estimated_mb": res.get("estimated_mb"),
+        }, f)
+    os.replace(tmp_pdf, cached_pdf)  # publica de forma atômica
+
+    evict_compression_cache()
+
+
+def evict_compression_cache() -> None:
+    """Remove entradas vencidas e, se passar do limite de tamanho, as menos usadas."""
+    max_bytes = app.config['COMPRESS_CACHE_MAX_MB'] * 1024 * 1024
+    max_age_s = app.config['COMPRESS_CACHE_MAX_AGE_H'] * 3600
+    now = time.time()
+
+    with cache_lock:
+        entries = []
+        for name in os.listdir(COMPRESS_CACHE_FOLDER):
+            if not name.endswith('.pdf'):
+                continue
+            path = os.path.join(COMPRESS_CACHE_FOLDER, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        entries.sort()  # mais antigos (menos usados) primeiro
+        total_bytes = sum(size for _, size, _ in entries)
+
+        for mtime, size, path in entries:
+            if now - mtime <= max_age_s and total_bytes <= max_bytes:
+                continue
+            for victim in (path, path[:-len('.pdf')] + '.json'):
+                try:
+                    os.remove(victim)
+                except FileNotFoundError:
+                    pass
+            total_bytes -= size
+
+
+# ---------------------------- Ghostscript ----------------------------
+class GhostscriptError(RuntimeError):
+    """Falha de uma instância persistente do Ghostscript."""
+
+
+class GhostscriptStartupError(GhostscriptError):
+    """A instância persistente não subiu (gs antigo, sem --permit-file-*, etc.)."""
+
+
+class GhostscriptTimeout(GhostscriptError):
+    """O job passou de GS_JOB_TIMEOUT_S e a instância foi morta pelo watchdog."""
+
+
+@functools.lru_cache(maxsize=1)
+def _find_gs():
+    for candidate in (shutil.which(GS_CMD), shutil.which("gs"), "/usr/bin/gs"):
+        if candidate and os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def gs_executable() -> str:
+    """Caminho do gs, resolvido uma vez por processo."""
+    gs_path = _find_gs()
+    if not gs_path:
+        raise FileNotFoundError(
+            "Ghostscript não encontrado em PATH. "
+            "Tente instalar ou definir o caminho."
+        )
+    return gs_path
+
+
+def gs_settings(preset: str, extra_flags=None) -> tuple:
+    """Parâmetros de dispositivo de um job; também é a chave do pool persistente."""
+    return ("-dCompatibilityLevel=1.4", f"-dPDFSETTINGS=/{preset}", *(extra_flags or ()))
+
+
+def _ps_string(value: str) -> str:
+    """Literal PostScript `( ... )` com \\, ( e ) escapados."""
+    return "(" + value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+class GhostscriptInstance:
+    """
+    Um `gs` de longa duração, já inicializado com um conjunto de settings,
+    que recebe jobs em PostScript pelo stdin. Cada job troca o OutputFile,
+    roda o PDF de entrada e devolve um marcador OK/FAIL no stdout.
+    """
+    READY_MARKER = "%%ZG_READY"
+    END_MARKER = "%%ZG_END"
+
+    def __init__(self, settings: tuple):
+        self.settings = settings
+        self.jobs_done = 0
+
+        permits = []
+        for folder in (UPLOAD_FOLDER, PROCESSED_FOLDER):
+            permits += [f"--permit-file-read={folder}{os.sep}", f"--permit-file-write={folder}{os.sep}"]
+        permits.append(f"--permit-file-write={os.devnull}")
+
+        self.process = subprocess.Popen(
+            [gs_executable(), "-sDEVICE=pdfwrite", "-dNOPAUSE", "-dSAFER", *permits,
+             *settings, f"-sOutputFile={os.devnull}", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+        try:
+            self._send(f"({self.READY_MARKER}\\n) print flush\n")
+            self._read_until(self.READY_MARKER)
+        except (GhostscriptError, OSError) as e:
+            self.close()
+            raise GhostscriptStartupError(str(e)) from e
+
+    def _send(self, ps: str) -> None:
+        self.process.stdin.write(ps)
+        self.process.stdin.flush()
+
+    def _read_until(self, marker: str, on_line=None):
+        """Lê o stdout até a linha do marcador; devolve (linhas anteriores, linha do marcador)."""
+        lines = []
+        for line in self.process.stdout:
+            line = line.rstrip("\n")
+            if line.startswith(marker):
+                return lines, line
+            lines.append(line)
+            if on_line:
+                on_line(line)
+        raise GhostscriptError("Ghostscript encerrou inesperadamente:\n" + "\n".join(lines[-20:]))
+
+    def run(self, input_path: str, output_path: str, timeout: float, on_line=None) -> None:
+        job_marker = f"{self.END_MARKER} {uuid.uuid4().hex}"
+        # o último setpagedevice fecha (e finaliza) o PDF de saída
+        self._send(
+            f"{{ << /OutputFile {_ps_string(output_path)} >> setpagedevice "
+            f"{_ps_string(input_path)} run "
+            f"<< /OutputFile {_ps_string(os.devnull)} >> setpagedevice }} stopped\n"
+            f"{{ (\\n{job_marker} FAIL\\n) print }} {{ (\\n{job_marker} OK\\n) print }} ifelse flush\n"
+        )
+
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            self.process.kill()
+
+        watchdog = threading.Timer(timeout, kill)
+        watchdog.start()
+        try:
+            lines, marker_line = self._read_until(job_marker, on_line)
+        except GhostscriptError as e:
+            if timed_out.is_set():
+                raise GhostscriptTimeout(f"Job excedeu {timeout:.0f} s; Ghostscript encerrado.") from e
+            raise
+        finally:
+            watchdog.cancel()
+
+        self.jobs_done += 1
+        if marker_line.endswith("FAIL"):
+            raise GhostscriptError("\n".join(lines[-20:]))
+
+    def rss_mb(self) -> float:
+        """RSS do processo gs."""
+        return process_rss_mb(self.process.pid)
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self) -> None:
+        try:
+            if self.alive():
+                self._send("quit\n")
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+            self.process.wait()
+        for pipe in (self.process.stdin, self.process.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+
+class GhostscriptPool:
+    """
+    Instâncias persistentes por conjunto de settings, recicladas depois de
+    GS_WORKER_MAX_JOBS jobs ou quando passam de GS_WORKER_MAX_RSS_MB.
+    Existe um pool por processo; quem limita a quantidade de processos é o
+    pool global de compressão (GS_MAX_WORKERS).
+    """
+
+    def __init__(self, max_jobs: int, max_rss_mb: float, job_timeout_s: float):
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.job_timeout_s = job_timeout_s
+        self.disabled = False
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def run(self, input_path: str, output_path: str, settings: tuple, on_line=None) -> None:
+        instance = self._acquire(settings)
+        try:
+            instance.run(input_path, output_path, self.job_timeout_s, on_line)
+        except Exception:
+            instance.close()
+            raise
+        self._release(instance)
+
+    def _acquire(self, settings: tuple) -> GhostscriptInstance:
+        with self._lock:
+            idle = self._idle.setdefault(settings, [])
+            while idle:
+                instance = idle.pop()
+                if instance.alive():
+                    return instance
+        return GhostscriptInstance(settings)
+
+    def _release(self, instance: GhostscriptInstance) -> None:
+        rss_mb = instance.rss_mb()
+        if instance.jobs_done >= self.max_jobs or rss_mb >= self.max_rss_mb:
+            logging.info(f"Reciclando Ghostscript (jobs={instance.jobs_done}, rss={rss_mb:.0f} MB).")
+            instance.close()
+            return
+        with self._lock:
+            self._idle.setdefault(instance.settings, []).append(instance)
+
+    def close_all(self) -> None:
+        with self._lock:
+            instances = [i for idle in self._idle.values() for i in idle]
+            self._idle.clear()
+        for instance in instances:
+            instance.close()
+
+
+_ghostscript_pool = None
+
+
+def get_ghostscript_pool() -> GhostscriptPool:
+    global _ghostscript_pool
+    if _ghostscript_pool is None:
+        _ghostscript_pool = GhostscriptPool(
+            app.config['GS_WORKER_MAX_JOBS'],
+            app.config['GS_WORKER_MAX_RSS_MB'],
+            app.config['GS_JOB_TIMEOUT_S'],
+        )
+        atexit.register(_ghostscript_pool.close_all)
+    return _ghostscript_pool
+
+
+GS_PAGE_LINE = re.compile(r"^Page (\d+)")
+
+
+def run_ghostscript(input_path: str, output_path: str, preset: str, extra_flags=None, on_page=None) -> None:
+    """
+    Ponto único para rodar o pdfwrite do Ghostscript (compressão, e futuramente PDF/A).
+    Usa uma instância persistente quando possível; senão, um processo avulso.
+    on_page(n) é chamado a cada "Page N" que o gs imprime.
+    Erros saem como subprocess.CalledProcessError; estouro de GS_JOB_TIMEOUT_S
+    também (returncode -9), sem nova tentativa em processo avulso.
+    """
+    settings = gs_settings(preset, extra_flags)
+
+    def on_line(line):
+        match = GS_PAGE_LINE.match(line)
+        if match and on_page:
+            on_page(int(match.group(1)))
+
+    pool = get_ghostscript_pool()
+    if app.config['GS_PERSISTENT'] and not pool.disabled:
+        try:
+            pool.run(input_path, output_path, settings, on_line)
+            return
+        except GhostscriptStartupError as e:
+            pool.disabled = True
+            logging.warning(f"Ghostscript persistente indisponível; usando um processo por job. Motivo: {e}")
+        except GhostscriptTimeout as e:
+            # não repete avulso: seria outro GS_JOB_TIMEOUT_S inteiro no mesmo PDF
+            raise subprocess.CalledProcessError(
+                -9, [gs_executable(), *settings, input_path], output=str(e)
+            ) from e
+        except GhostscriptError as e:
+            # repete avulso: se falhar de novo, o erro real vem do gs com returncode
+            logging.warning(f"Job falhou no Ghostscript persistente; repetindo em processo avulso. {e}")
+
+    # sem -dQUIET o gs imprime "Page N" por página processada
+    command = [
+        gs_executable(),
+        "-sDEVICE=pdfwrite",
+        *settings,
+        "-dNOPAUSE",
+        "-dBATCH",
+        f"-sOutputFile={output_path}",
+        input_path,
+    ]
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+    )
+    watchdog = threading.Timer(app.config['GS_JOB_TIMEOUT_S'], process.kill)
+    watchdog.start()
+    output = []
+    try:
+        for line in process.stdout:
+            line = line.rstrip("\n")
+            output.append(line)
+            on_line(line)
+        process.wait()
+    finally:
+        watchdog.cancel()
+        process.stdout.close()
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode,
+            command,
+            output="\n".join(output[-50:]),
+        )
+
+
+# ---------------------------- Upload em streaming ----------------------------
+class StreamedUpload:
+    """
+    Destino de um arquivo do multipart: o corpo é gravado em disco em blocos,
+    conforme chega, contando bytes (limites por arquivo e por requisição) e
+    calculando o SHA-256 no caminho. As rotas usam o próprio arquivo em disco.
+    """
+
+    def __init__(self, path: str, max_file_bytes: int, owner: "StreamingUploadRequest"):
+        self.path = path
+        self.size = 0
+        self.claimed = False
+        self._max_file_bytes = max_file_bytes
+        self._owner = owner
+        self._digest = hashlib.sha256()
+        self._file = open(path, 'w+b')
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.size > self._max_file_bytes:
+            raise RequestEntityTooLarge(
+                f"Arquivo maior que o limite de {self._max_file_bytes / (1024 * 1024):.0f} MB."
+            )
+        self._owner.count_upload_bytes(len(data))
+        self._digest.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    def __getattr__(self, name):
+        # read/seek/tell/flush/close... vão direto para o arquivo
+        return getattr(self._file, name)
+
+
+class StreamingUploadRequest(Request):
+    """Request que entrega cada arquivo enviado como StreamedUpload em UPLOAD_FOLDER."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_streams = []
+        self.upload_bytes = 0
+
+    def upload_limits(self):
+        default = app.config['MAX_CONTENT_LENGTH']
+        limits_mb = app.config['UPLOAD_LIMITS_MB'].get(self.endpoint)
+        if not limits_mb:
+            return default, default
+        return int(limits_mb[0] * 1024 * 1024), int(limits_mb[1] * 1024 * 1024)
+
+    def count_upload_bytes(self, n: int) -> None:
+        self.upload_bytes += n
+        max_request_bytes = self.upload_limits()[1]
+        if max_request_bytes and self.upload_bytes > max_request_bytes:
+            raise RequestEntityTooLarge(
+                f"O total enviado passou do limite de {max_request_bytes / (1024 * 1024):.0f} MB."
+            )
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        path = os.path.join(UPLOAD_FOLDER, f"upload_{uuid.uuid4().hex}.part")
+        stream = StreamedUpload(path, self.upload_limits()[0] or float('inf'), self)
+        self.upload_streams.append(stream)
+        return stream
+
+
+app.request_class = StreamingUploadRequest
+
+
+@app.before_request
+def apply_upload_limit():
+    # Content-Length acima do limite da rota é recusado antes de ler o corpo
+    request.max_content_length = request.upload_limits()[1]
+
+
+@app.teardown_request
+def discard_unclaimed_uploads(exc=None):
+    for stream in getattr(request, 'upload_streams', []):
+        if stream.claimed:
+            continue
+        try:
+            stream.close()
+            os.remove(stream.path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"Erro removendo upload temporário {stream.path}: {e}")
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def _record_request(status_code: int) -> None:
+    if getattr(g, 'request_recorded', False) or not hasattr(g, 'request_started'):
+        return
+    g.request_recorded = True
+    route = request.url_rule.rule if request.url_rule else "<sem rota>"
+    metrics.inc("zg_http_requests_total", {"route": route, "method": request.method, "status": status_code})
+    metrics.observe(
+        "zg_http_request_duration_seconds",
+        time.perf_counter() - g.request_started,
+        {"route": route},
+    )
+
+
+@app.after_request
+def record_request_metrics(response):
+    _record_request(response.status_code)
+    return response
+
+
+@app.teardown_request
+def record_failed_request(exc=None):
+    # exceção não tratada: o after_request não roda
+    if exc is not None:
+        _record_request(500)
+
+
+@app.before_request
+def start_request_profile():
+    if profile_requested():
+        capture = ProfileCapture(
+            uuid.uuid4().hex[:12], "request",
+            route=request.url_rule.rule if request.url_rule else request.path,
+            method=request.method,
+        )
+        if capture.start():
+            g.profile = capture
+
+
+@app.after_request
+def mark_profiled_response(response):
+    capture = g.get('profile')
+    if capture is not None:
+        # a captura leva o task_id quando a rota cria/usa um
+        capture.label = g.get('task_id') or capture.label
+        capture.info['status'] = response.status_code
+        g.profile_id = capture.label
+    if g.get('profile_id'):
+        response.headers['X-ZG-Profile-Id'] = g.profile_id
+    return response
+
+
+@app.teardown_request
+def stop_request_profile(exc=None):
+    capture = g.pop('profile', None)
+    if capture is not None:
+        capture.label = g.get('task_id') or capture.label
+        capture.stop(error=repr(exc) if exc is not None else None)
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    msg = e.description or 'Arquivo muito grande.'
+    return jsonify({'error': msg, 'message': msg}), 413
+
+
+def upload_path(file_storage) -> str:
+    """Caminho em disco do upload (válido até o fim da requisição)."""
+    file_storage.stream.flush()
+    return file_storage.stream.path
+
+
+def upload_sha256(file_storage) -> str:
+    return file_storage.stream.sha256
+
+
+def upload_size(file_storage) -> int:
+    return file_storage.stream.size
+
+
+def claim_upload(file_storage, dest_path: str) -> str:
+    """Move o upload para dest_path sem copiar os dados; ele deixa de ser apagado no fim da requisição."""
+    stream = file_storage.stream
+    stream.close()
+    os.replace(stream.path, dest_path)
+    stream.path = dest_path
+    stream.claimed = True
+    return dest_path
+
+
+class UploadIndex:
+    """
+    task_id -> caminho do upload guardado em UPLOAD_FOLDER (conversão).
+    Evita varrer a pasta inteira a cada pedido. Vale para o próprio processo;
+    quem não estiver no índice (outro worker, restart) cai na busca por prefixo.
+    """
+
+    def __init__(self):
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, path: str) -> None:
+        with self._lock:
+            self._paths[key] = path
+
+    def get(self, key: str):
+        with self._lock:
+            path = self._paths.get(key)
+        if path and os.path.exists(path):
+            return path
+        return _find_upload_by_prefix(f"{key}_")
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._paths.pop(key, None)
+
+    def discard_paths(self, paths) -> None:
+        paths = set(paths)
+        with self._lock:
+            for key in [k for k, path in self._paths.items() if path in paths]:
+                del self._paths[key]
+
+
+def _find_upload_by_prefix(prefix: str):
+    with os.scandir(UPLOAD_FOLDER) as entries:
+        for entry in entries:
+            if entry.name.startswith(prefix):
+                return entry.path
+    return None
+
+
+upload_index = UploadIndex()
+
+
+# ---------------------------- Limpeza (janitor) ----------------------------
+janitor_stats = {
+    "runs": 0,
+    "files_removed": 0,
+    "bytes_reclaimed": 0,
+    "last_run": None,
+}
+janitor_stats_lock = threading.Lock()
+
+
+def clean_folder(folder: str, max_age_s: float, now: float) -> tuple:
+    """Apaga arquivos com mtime mais antigo que max_age_s; devolve (removidos, bytes, caminhos)."""
+    removed, reclaimed, paths = 0, 0, []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                if now - stat.st_mtime < max_age_s:
+                    continue
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue  # outro worker (ou o download) chegou antes
+            except OSError as e:
+                logging.warning(f"Janitor: não foi possível remover {entry.path}: {e}")
+                continue
+            removed += 1
+            reclaimed += stat.st_size
+            paths.append(entry.path)
+    return removed, reclaimed, paths
+
+
+def run_janitor() -> dict:
+    """Uma passada em uploads/ e processed/; devolve o que foi liberado."""
+    # resultados cuja janela de retenção venceu saem junto com a tarefa
+    task_store.sweep()
+    evict_thumbnail_cache()
+    now = time.time()
+    removed, reclaimed = 0, 0
+    for folder, max_age_h in (
+        (UPLOAD_FOLDER, app.config['UPLOAD_MAX_AGE_H']),
+        (PROCESSED_FOLDER, app.config['PROCESSED_MAX_AGE_H']),
+    ):
+        folder_removed, folder_reclaimed, paths = clean_folder(folder, max_age_h * 3600, now)
+        if folder == UPLOAD_FOLDER:
+            upload_index.discard_paths(paths)
+        removed += folder_removed
+        reclaimed += folder_reclaimed
+
+    with janitor_stats_lock:
+        janitor_stats["runs"] += 1
+        janitor_stats["files_removed"] += removed
+        janitor_stats["bytes_reclaimed"] += reclaimed
+        janitor_stats["last_run"] = datetime.utcnow().isoformat() + "Z"
+
+    if removed:
+        logging.info(f"Janitor: {removed} arquivo(s) expirado(s) removido(s), {reclaimed / (1024 * 1024):.2f} MB liberados.")
+    return {"files_removed": removed, "bytes_reclaimed": reclaimed}
+
+
+def _janitor_loop() -> None:
+    while True:
+        try:
+            run_janitor()
+        except Exception as e:
+            logging.error(f"Janitor falhou: {e}")
+        time.sleep(app.config['JANITOR_INTERVAL_S'])
+
+
+def start_janitor() -> None:
+    if app.config['JANITOR_ENABLED']:
+        threading.Thread(target=_janitor_loop, name="janitor", daemon=True).start()
+
+
+start_janitor()
 
 
 # ---------------------------- Templates ----------------------------
@@ -227,70 +2180,72 @@ def compress():
             return jsonify({'error': 'Nenhum arquivo enviado'}), 400
 
     MAX_FILES = 10
-    MAX_TOTAL_MB = 1024  # MB
 
     if len(files) > MAX_FILES:
         return jsonify({
             'error': f'Você enviou {len(files)} arquivos. O limite é {MAX_FILES}.'
         }), 400
 
-    task_id = str(uuid.uuid4())
+    task_id = g.task_id = str(uuid.uuid4())
 
+    # limites de tamanho já foram aplicados durante o upload (UPLOAD_LIMITS_MB)
     jobs = []
-    total_bytes = 0
-
     for f in files:
         filename = secure_filename(f.filename)
         input_path = os.path.join(UPLOAD_FOLDER, f"{task_id}_{filename}")
-        output_path = os.path.join(PROCESSED_FOLDER, f"comprimidoZG_{filename}")
-        f.save(input_path)
-
-        size = os.path.getsize(input_path)
-        total_bytes += size
+        # com o task_id no nome: o resultado fica guardado e não pode colidir com outra tarefa
+        output_path = os.path.join(PROCESSED_FOLDER, f"{task_id}_comprimidoZG_{filename}")
 
         jobs.append({
             "filename": filename,
-            "input_path": input_path,
+            "input_path": claim_upload(f, input_path),
             "output_path": output_path,
-            "input_size": size,
+            "input_size": upload_size(f),
+            "sha256": upload_sha256(f),
         })
 
-    total_mb = total_bytes / (1024 * 1024)
-    if total_mb > MAX_TOTAL_MB:
+    compression_type = request.form.get('compression', 'screen')
+
+    task_store.create(task_id, {
+        'percent': 0,
+        'status': 'Iniciando compressão...',
+        'file': None,
+        'error': None,
+        'summary': None,
+        'streaming': False,
+        'eta_s': None,
+        'queue_position': 0,
+    })
+
+    def on_queued(position):
+        task_store.update(task_id, status=f"Na fila (posição {position})...", queue_position=position)
+
+    task_fn = compress_task_thread_many
+    if profile_handoff():
+        task_fn = profiled(task_fn, task_id, route="/compress", files=len(jobs))
+
+    try:
+        job_scheduler.submit(
+            'compress',
+            sum(job["input_size"] for job in jobs),
+            task_fn, task_id, jobs, compression_type,
+            on_queued=on_queued,
+        )
+    except SchedulerBusy:
+        task_store.pop(task_id)
         for job in jobs:
             try:
                 os.remove(job["input_path"])
-            except Exception:
+            except OSError:
                 pass
-        return jsonify({
-            'error': f'O total enviado é {total_mb:.2f} MB, maior que o limite de {MAX_TOTAL_MB} MB.'
-        }), 400
-
-    compression_type = request.form.get('compression', 'screen')
-
-    with tasks_lock:
-        tasks[task_id] = {
-            'percent': 0,
-            'status': 'Iniciando compressão...',
-            'file': None,
-            'error': None,
-            'summary': None,
-        }
-
-    thread = threading.Thread(
-        target=compress_task_thread_many,
-        args=(task_id, jobs, compression_type),
-        daemon=True,
-    )
-    thread.start()
+        raise
 
     return jsonify({'task_id': task_id})
 
 
 @app.route("/progress/<task_id>")
 def progress(task_id):
-    with tasks_lock:
-        task = tasks.get(task_id)
+    task = task_store.get(task_id)
     if task:
         if task.get('error'):
             return jsonify(task), 500
@@ -299,16 +2254,58 @@ def progress(task_id):
     return jsonify({'error': 'Tarefa não encontrada'}), 404
 
 
+SSE_HEARTBEAT_S = 15.0  # comentário vazio para proxies não derrubarem a conexão
+
+
+@app.route("/progress/<task_id>/stream")
+def progress_stream(task_id):
+    """
+    Mesmo conteúdo do /progress, mas por Server-Sent Events: um evento só quando
+    o estado muda, e a conexão fecha quando a tarefa termina (ou falha).
+    """
+    task = task_store.get(task_id)
+    if task is None:
+        logging.warning(f"Tarefa {task_id} não encontrada para progresso (stream).")
+        return jsonify({'error': 'Tarefa não encontrada'}), 404
+
+    def events():
+        last = None
+        current = task
+        last_sent = time.time()
+        while True:
+            if current is None:
+                # tarefa já baixada/expirada
+                yield "event: gone\ndata: {}\n\n"
+                return
+
+            if current != last:
+                last = current
+                last_sent = time.time()
+                yield f"data: {json.dumps(current, ensure_ascii=False, default=str)}\n\n"
+                if current.get('error') or current.get('percent', 0) >= 100:
+                    return
+            elif time.time() - last_sent >= SSE_HEARTBEAT_S:
+                last_sent = time.time()
+                yield ": ping\n\n"
+
+            current = task_store.wait_for_change(task_id, last, timeout=SSE_HEARTBEAT_S)
+
+    return Response(
+        events(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
 @app.route("/download/<task_id>")
 def download(task_id):
     logging.info(f"Requisição de download recebida para task_id: {task_id}")
-    with tasks_lock:
-        task = tasks.get(task_id)
+    task = task_store.get(task_id)
 
     if not task:
-        logging.warning(f"Download repetido ou tarefa expirada: {task_id}")
+        logging.warning(f"Download de tarefa expirada: {task_id}")
         # 410 = Gone (já existiu um dia, mas não mais)
-        return jsonify({'error': 'Download já realizado ou tarefa expirada.'}), 410
+        return jsonify({'error': 'Resultado expirado. Envie o arquivo novamente.'}), 410
 
     file_path = task.get('file')
     if not file_path or not os.path.exists(file_path):
@@ -317,18 +2314,96 @@ def download(task_id):
 
     logging.info(f"Servindo arquivo: {file_path}")
 
-    @after_this_request
-    def cleanup(response):
-        try:
-            os.remove(file_path)
-            logging.info(f"Arquivo {file_path} removido.")
-        except Exception as e:
-            logging.warning(f"Erro ao remover arquivo {file_path}: {e}")
-        with tasks_lock:
-            tasks.pop(task_id, None)
+    if task.get('streaming'):
+        # ZIP ainda crescendo: manda o que já existe e acompanha até a tarefa terminar
+        return Response(
+            _stream_growing_file(task_id, file_path),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename={os.path.basename(file_path)}'},
+        )
+
+    # o resultado fica guardado pela janela de retenção (download interrompido retoma com Range)
+    task_store.touch(task_id, app.config['RESULT_TTL_S'])
+    response = send_result_file(file_path, task.get('download_name'))
+    response.headers.update(dedup_headers(task.get('summary')))
+    return response
+
+
+def send_result_file(file_path, download_name=None):
+    """
+    Entrega um resultado guardado em processed/. Sem proxy, o send_file responde
+    Range (206), ETag/If-None-Match e If-Modified-Since, e o gunicorn usa o
+    sendfile() do SO. Com DOWNLOAD_ACCEL, só os headers saem do Python.
+    Sai com "private, no-cache" em vez do no-store geral: só o navegador guarda,
+    sempre revalidando, e fica com a ETag para retomar o download.
+    """
+    g.cacheable_response = True
+    accel = app.config['DOWNLOAD_ACCEL']
+    if accel not in ("x-accel", "x-sendfile"):
+        response = send_file(file_path, as_attachment=True, download_name=download_name, conditional=True, etag=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
         return response
 
-    return send_file(file_path, as_attachment=True)
+    download_name = download_name or os.path.basename(file_path)
+    response = Response(mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream')
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    if accel == "x-accel":
+        relative = os.path.relpath(file_path, PROCESSED_FOLDER).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + url_quote(relative)
+    else:
+        response.headers['X-Sendfile'] = os.path.abspath(file_path)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _stream_growing_file(task_id, file_path, chunk_size=1024 * 1024):
+    """Lê o arquivo enquanto ele é escrito; termina quando a tarefa sai do modo streaming."""
+    completed = False
+    try:
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if chunk:
+                    yield chunk
+                    continue
+                task = task_store.get(task_id) or {}
+                still_writing = task.get('streaming', False)
+                failed = bool(task.get('error'))
+                if failed:
+                    logging.warning(f"Tarefa {task_id} falhou durante o download em streaming.")
+                    return
+                if not still_writing:
+                    # tarefa fechou o ZIP: o que falta já está no disco
+                    for chunk in iter(lambda: f.read(chunk_size), b''):
+                        yield chunk
+                    completed = True
+                    return
+                time.sleep(0.2)
+    finally:
+        if completed:
+            # ZIP completo fica guardado (e agora com Range) pela janela de retenção
+            task_store.touch(task_id, app.config['RESULT_TTL_S'])
+
+
+def build_compression_result(filename, output_path, initial_file_size, final_file_size, pages, cache_hit=False):
+    """Monta o dict de métricas de um arquivo comprimido."""
+    size_reduction_bytes = initial_file_size - final_file_size
+    if initial_file_size > 0:
+        size_reduction_pct = round((size_reduction_bytes / initial_file_size) * 100, 2)
+    else:
+        size_reduction_pct = 0.0
+
+    return {
+        "filename": filename,
+        "output_path": output_path,
+        "input_mb": round(initial_file_size / (1024 * 1024), 2),
+        "output_mb": round(final_file_size / (1024 * 1024), 2),
+        "reduction_mb": round(size_reduction_bytes / (1024 * 1024), 2),
+        "reduction_pct": size_reduction_pct,
+        "pages": pages,
+        "cache_hit": cache_hit,
+    }
+
 
 def compress_single_pdf(job, compression_type):
     """
@@ -347,109 +2422,272 @@ def compress_single_pdf(job, compression_type):
     logging.info(f"Compressão (single) iniciada para: {filename}")
 
     initial_file_size = os.path.getsize(input_path)
-    compression_ratio = get_estimated_compression_ratio(compression_type)
-    estimated_final_size = max(int(initial_file_size * compression_ratio), 1)
-
-    def run_gs(current_input_path, cmd_output_path, compression_type_override, extra_flags=None):
-        gs_path = shutil.which("gs") or "/usr/bin/gs"
-        if not os.path.exists(gs_path):
-            raise FileNotFoundError(
-                f"Ghostscript não encontrado em PATH. "
-                f"Tente instalar ou definir o caminho. Procurado: {gs_path}"
-            )
-
-        command = [
-            gs_path,
-            "-sDEVICE=pdfwrite",
-            "-dCompatibilityLevel=1.4",
-            f"-dPDFSETTINGS=/{compression_type_override}",
-            "-dNOPAUSE",
-            "-dBATCH",
-            "-dQUIET",
-            f"-sOutputFile={cmd_output_path}",
-            current_input_path,
-        ]
-        if extra_flags:
-            command += extra_flags
-
-        return subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
+    on_page = gs_page_reporter(job)
+    stage_s = {}  # roda no pool: os tempos voltam no resultado
+
+    # --------- pré-análise: escolhe a estratégia antes de rodar o gs ---------
+    with stage_timer("analysis", stage_s):
+        analysis = analyze_pdf(input_path)
+    strategy = choose_compression_strategy(analysis, compression_type)
+    estimated_final_size = estimate_compressed_size(analysis, compression_type, strategy)
+    logging.info(
+        f"Pré-análise de {filename}: {analysis['pages']} pág., {analysis['image_count']} imagens "
+        f"({analysis['image_share']:.0%} do arquivo), estratégia={strategy}, "
+        f"estimativa={estimated_final_size / (1024 * 1024):.2f} MB"
+    )
 
-    # Chamada principal
-    process = run_gs(input_path, output_path, compression_type)
+    if strategy == 'skip':
+        logging.info(f"{filename}: sem ganho previsto (só texto/vetor já comprimido). Ghostscript não será executado.")
+        shutil.copyfile(input_path, output_path)
+        final_file_size = initial_file_size
+    else:
+        # Chamada principal (a agressiva já vai direto quando a análise indica)
+        with stage_timer("ghostscript", stage_s):
+            if strategy == 'aggressive':
+                run_ghostscript(input_path, output_path, "screen", GS_AGGRESSIVE_FLAGS, on_page=on_page)
+            else:
+                run_ghostscript(input_path, output_path, compression_type, on_page=on_page)
 
-    stdout, stderr = process.communicate()
-    if process.returncode != 0:
-        raise subprocess.CalledProcessError(
-            process.returncode,
-            process.args,
-            output=stdout,
-            stderr=stderr,
-        )
+        if not os.path.exists(output_path):
+            raise FileNotFoundError(f"Arquivo de saída não foi gerado: {output_path}")
 
-    if not os.path.exists(output_path):
-        raise FileNotFoundError(f"Arquivo de saída não foi gerado: {output_path}")
+        final_file_size = os.path.getsize(output_path)
 
     # --------- fallback agressivo se não tiver ganho ---------
-    final_file_size = os.path.getsize(output_path)
-    if final_file_size >= initial_file_size:
-        logging.warning(f"Compressão ineficaz em {filename}. Tentando fallback agressivo.")
+    # Só faz sentido se ainda não foi agressivo e se houver imagens (as flags só mexem nelas).
+    if strategy != 'skip' and final_file_size >= initial_file_size:
         fallback_path = output_path.replace('.pdf', '_fallback.pdf')
-        aggressive_flags = [
-            '-dDownsampleColorImages=true', '-dColorImageResolution=72', '-dAutoFilterColorImages=false', '-dColorImageFilter=/DCTEncode',
-            '-dGrayImageResolution=72', '-dDownsampleGrayImages=true', '-dAutoFilterGrayImages=false', '-dGrayImageFilter=/DCTEncode',
-            '-dMonoImageResolution=72', '-dDownsampleMonoImages=true',
-        ]
-        fallback_process = run_gs(input_path, fallback_path, "screen", aggressive_flags)
-        fb_stdout, fb_stderr = fallback_process.communicate()
-
-        if os.path.exists(fallback_path):
-            fallback_size = os.path.getsize(fallback_path)
-            if fallback_size < initial_file_size:
-                os.replace(fallback_path, output_path)
-                final_file_size = fallback_size
-            else:
-                os.replace(input_path, output_path)
-                final_file_size = initial_file_size
-                try:
-                    os.remove(fallback_path)
-                except Exception:
-                    pass
+        fallback_size = None
+
+        if strategy == 'standard' and analysis['image_count'] > 0:
+            logging.warning(f"Compressão ineficaz em {filename}. Tentando fallback agressivo.")
+            try:
+                with stage_timer("ghostscript_fallback", stage_s):
+                    run_ghostscript(input_path, fallback_path, "screen", GS_AGGRESSIVE_FLAGS, on_page=on_page)
+            except subprocess.CalledProcessError as e:
+                logging.warning(f"Fallback agressivo falhou em {filename}: {e.output}")
+            if os.path.exists(fallback_path):
+                fallback_size = os.path.getsize(fallback_path)
+        else:
+            logging.info(f"Compressão ineficaz em {filename}. Fallback ignorado (estratégia={strategy}).")
+
+        if fallback_size is not None and fallback_size < initial_file_size:
+            os.replace(fallback_path, output_path)
+            final_file_size = fallback_size
         else:
             os.replace(input_path, output_path)
             final_file_size = initial_file_size
+            try:
+                os.remove(fallback_path)
+            except FileNotFoundError:
+                pass
 
-    # --------- métricas finais ---------
-    size_reduction_bytes = initial_file_size - final_file_size
-    size_reduction_mb = round(size_reduction_bytes / (1024 * 1024), 2)
-    input_mb = round(initial_file_size / (1024 * 1024), 2)
-    output_mb = round(final_file_size / (1024 * 1024), 2)
-    if initial_file_size > 0:
-        size_reduction_pct = round((size_reduction_bytes / initial_file_size) * 100, 2)
-    else:
-        size_reduction_pct = 0.0
+    # limpa input individual (se ainda existir: sem ganho o original vira a saída)
+    if os.path.exists(input_path):
+        try:
+            os.remove(input_path)
+        except Exception as e:
+            logging.warning(f"Não foi possível remover o arquivo de entrada {input_path}: {e}")
+
+    res = build_compression_result(filename, output_path, initial_file_size, final_file_size, analysis['pages'])
+    res["strategy"] = strategy
+    res["estimated_mb"] = round(estimated_final_size / (1024 * 1024), 2)
+    res["stage_s"] = stage_s
+    return res
+
+def plan_shards(job, task_id):
+    """
+    Para PDFs acima de SHARD_MIN_MB ou SHARD_MIN_PAGES, grava faixas de
+    SHARD_PAGES páginas como jobs independentes. Devolve None se não precisar.
+    """
+    size_mb = job["input_size"] / (1024 * 1024)
+    pages_per_shard = app.config['SHARD_PAGES']
+
+    with fitz.open(job["input_path"]) as doc:
+        page_count = doc.page_count
+        if size_mb < app.config['SHARD_MIN_MB'] and page_count < app.config['SHARD_MIN_PAGES']:
+            return None
+        if page_count <= pages_per_shard:
+            return None
+
+        shards = []
+        for shard_idx, start in enumerate(range(0, page_count, pages_per_shard)):
+            end = min(start + pages_per_shard, page_count) - 1
+            shard_name = f"{task_id}_shard{shard_idx}_{job['filename']}"
+            shard_input = os.path.join(UPLOAD_FOLDER, shard_name)
+
+            shard_doc = fitz.open()
+            shard_doc.insert_pdf(doc, from_page=start, to_page=end)
+            shard_doc.save(shard_input, garbage=1)
+            shard_doc.close()
+
+            shards.append({
+                "filename": f"{job['filename']} [{start + 1}-{end + 1}]",
+                "input_path": shard_input,
+                "output_path": os.path.join(PROCESSED_FOLDER, shard_name),
+                "input_size": os.path.getsize(shard_input),
+                "pages": end - start + 1,
+            })
+
+    logging.info(f"{job['filename']}: {page_count} pág. / {size_mb:.1f} MB divididos em {len(shards)} partes.")
+    return shards
+
+
+SUBSET_FONT_PREFIX = re.compile(r"^/?[A-Z]{6}\+")
 
-    pages = get_pdf_page_count(output_path)
 
-    # limpa input individual
+def subset_font_overhead(pdf_doc) -> int:
+    """
+    Bytes de programas de fonte repetidos: a mesma fonte embutida mais de uma
+    vez com subsets diferentes (prefixo ABCDEF+). Conta tudo menos a maior
+    cópia de cada fonte.
+    """
+    copies = {}
+    for xref in range(1, pdf_doc.xref_length()):
+        for key in ("FontFile", "FontFile2", "FontFile3"):
+            kind, value = pdf_doc.xref_get_key(xref, key)
+            if kind == "xref":
+                break
+        else:
+            continue
+        font_name = SUBSET_FONT_PREFIX.sub("", pdf_doc.xref_get_key(xref, "FontName")[1])
+        try:
+            size = len(pdf_doc.xref_stream_raw(int(value.split()[0])) or b"")
+        except Exception:
+            continue
+        copies.setdefault(font_name, []).append(size)
+    return sum(sum(sizes) - max(sizes) for sizes in copies.values())
+
+
+def compress_single_pass(job, compression_type) -> str:
+    """Comprime o PDF inteiro de uma vez, sem consumir o original; devolve o caminho da saída."""
+    name = f"{uuid.uuid4().hex}_single_{os.path.basename(job['input_path'])}"
+    single_job = {
+        "filename": job["filename"],
+        "input_path": os.path.join(UPLOAD_FOLDER, name),
+        "output_path": os.path.join(PROCESSED_FOLDER, name),
+        "input_size": job["input_size"],
+    }
+    shutil.copyfile(job["input_path"], single_job["input_path"])
     try:
+        res = get_gs_pool().submit(compress_single_pdf, single_job, compression_type).result()
+    finally:
+        if os.path.exists(single_job["input_path"]):
+            os.remove(single_job["input_path"])
+    for stage, seconds in res.pop("stage_s", {}).items():
+        observe_stage(stage, seconds)
+    return single_job["output_path"]
+
+
+def reassemble_shards(job, shard_results, compression_type):
+    """
+    Junta as partes comprimidas na ordem original. O save com garbage=4 funde
+    objetos e streams idênticos entre partes (logos, imagens repetidas), mas
+    não fontes: o gs faz subset por parte, então cada parte traz a sua cópia.
+    Quando essas cópias passam de SHARD_FONT_OVERHEAD_PCT da saída, roda uma
+    passada única e fica com o menor. O resultado nunca fica maior que o original.
+    """
+    input_path = job["input_path"]
+    output_path = job["output_path"]
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+
+    merged = fitz.open()
+    for res in shard_results:
+        with fitz.open(res["output_path"]) as part:
+            merged.insert_pdf(part)
+    with fitz.open(input_path) as original:
+        merged.set_metadata(original.metadata)
+        merged.set_toc(original.get_toc(simple=False))
+    merged.save(tmp_path, garbage=4, deflate=True)
+    pages = merged.page_count
+    merged.close()
+
+    for res in shard_results:
+        try:
+            os.remove(res["output_path"])
+        except Exception as e:
+            logging.warning(f"Erro ao remover parte comprimida {res['output_path']}: {e}")
+
+    strategy = "sharded"
+    with fitz.open(tmp_path) as sharded:
+        font_overhead = subset_font_overhead(sharded)
+    if font_overhead > os.path.getsize(tmp_path) * app.config['SHARD_FONT_OVERHEAD_PCT'] / 100:
+        logging.info(
+            f"{job['filename']}: {font_overhead / (1024 * 1024):.2f} MB de fontes repetidas entre partes; "
+            f"comparando com uma passada única."
+        )
+        single_path = compress_single_pass(job, compression_type)
+        if os.path.getsize(single_path) < os.path.getsize(tmp_path):
+            os.replace(single_path, tmp_path)
+            strategy = "single"
+        else:
+            os.remove(single_path)
+
+    initial_file_size = os.path.getsize(input_path)
+    final_file_size = os.path.getsize(tmp_path)
+    if final_file_size < initial_file_size:
+        os.replace(tmp_path, output_path)
         os.remove(input_path)
-    except Exception as e:
-        logging.warning(f"Não foi possível remover o arquivo de entrada {input_path}: {e}")
+    else:
+        logging.info(f"{job['filename']}: partes juntas não ficaram menores; mantendo o original.")
+        os.replace(input_path, output_path)
+        os.remove(tmp_path)
+        final_file_size = initial_file_size
+
+    res = build_compression_result(job["filename"], output_path, initial_file_size, final_file_size, pages)
+    res["strategy"] = strategy
+    res["estimated_mb"] = round(sum(r.get("estimated_mb") or 0 for r in shard_results), 2)
+    res["shards"] = len(shard_results)
+    return res
+
+
+class _AppendOnlyFile:
+    """Arquivo sem seek/tell: o zipfile passa a usar data descriptors e nunca volta para reescrever cabeçalhos."""
+
+    def __init__(self, path: str):
+        self._file = open(path, 'wb')
+
+    def write(self, data) -> int:
+        return self._file.write(data)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class StreamingZip:
+    """
+    ZIP (STORED: PDF já é comprimido) que só cresce no fim. Pode ser lido
+    enquanto é escrito; cada PDF adicionado é apagado na hora.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = _AppendOnlyFile(path)
+        self._zip = zipfile.ZipFile(self._file, "w", zipfile.ZIP_STORED)
+        self._closed = False
+
+    def add(self, file_path: str, arcname: str) -> None:
+        with stage_timer("zip_build"):
+            self._zip.write(file_path, arcname=arcname)
+            self._file.flush()
+        try:
+            os.remove(file_path)
+        except Exception as e:
+            logging.warning(f"Erro ao remover PDF individual {file_path}: {e}")
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            with stage_timer("zip_build"):
+                self._zip.close()  # grava o diretório central
+        finally:
+            self._file.close()
 
-    return {
-        "filename": filename,
-        "output_path": output_path,
-        "input_mb": input_mb,
-        "output_mb": output_mb,
-        "reduction_mb": size_reduction_mb,
-        "reduction_pct": size_reduction_pct,
-        "pages": pages,
-    }
 
 def compress_task_thread_many(current_task_id, jobs, compression_type):
     """
@@ -461,27 +2699,128 @@ def compress_task_thread_many(current_task_id, jobs, compression_type):
         "input_size": int
       }
 
+    Os arquivos são comprimidos em paralelo no pool global (`GS_MAX_WORKERS`);
+    PDFs muito grandes são divididos em partes que também rodam em paralelo.
+
     Regra:
     - Se tiver 1 arquivo -> devolve o PDF direto (sem zip)
-    - Se tiver >1       -> zipa todos e devolve um .zip
+    - Se tiver >1       -> .zip montado em streaming: cada PDF entra (sem deflate)
+                           assim que termina, e o download pode começar antes do fim
     """
     start_time = time.time()
     started_at = datetime.utcnow().isoformat() + "Z"
+    archive = None
 
     try:
-        results = []
+        # saiu da fila do agendador
+        task_store.update(current_task_id, status="Iniciando compressão...", queue_position=0)
+
         total_input_mb = 0.0
         total_output_mb = 0.0
 
         total_files = len(jobs)
 
+        # Vários arquivos: o ZIP já nasce aqui e cada PDF entra assim que fica pronto
+        if total_files > 1:
+            zip_name = f"comprimidosZG_{current_task_id}.zip"
+            zip_path = os.path.join(PROCESSED_FOLDER, zip_name)
+            archive = StreamingZip(zip_path)
+            task_store.update(current_task_id, file=zip_path, streaming=True)
+
+        # =========================================================
+        # COMPRESSÃO: todos os arquivos vão para o pool global
+        # =========================================================
+        results = [None] * total_files
+        cache_keys = {}
+        for idx, job in enumerate(jobs):
+            key = compression_cache_key(job, compression_type)
+            results[idx] = compression_cache_get(key, job)
+            if results[idx] is None:
+                cache_keys[idx] = key
+
+        cache_hits = total_files - len(cache_keys)
+        cache_misses = len(cache_keys)
+        if cache_hits:
+            logging.info(f"Tarefa {current_task_id}: {cache_hits} arquivo(s) servido(s) do cache.")
+            if archive:
+                for res in results:
+                    if res is not None:
+                        archive.add(res["output_path"], res["filename"])
+
+        # PDFs muito grandes viram várias faixas de páginas (shards) no pool.
+        # Cada unidade (arquivo ou shard) informa as páginas que o gs já processou.
+        pool = get_gs_pool()
+        units = {}
+        units_to_submit = []
+        shard_plans = {}
+        for idx, job in enumerate(jobs):
+            if idx not in cache_keys:
+                units[str(idx)] = results[idx]["pages"]
+                continue
+            shards = plan_shards(job, current_task_id)
+            if shards:
+                shard_plans[idx] = {"shards": shards, "results": [None] * len(shards), "pending": len(shards)}
+                for shard_idx, shard in enumerate(shards):
+                    unit = f"{idx}.{shard_idx}"
+                    shard["progress_key"] = (current_task_id, unit)
+                    units[unit] = shard["pages"]
+                    units_to_submit.append((shard, idx, shard_idx))
+            else:
+                unit = str(idx)
+                job["progress_key"] = (current_task_id, unit)
+                units[unit] = get_pdf_page_count(job["input_path"])
+                units_to_submit.append((job, idx, None))
+
+        start_page_progress(current_task_id, units, total_files)
+        for idx in range(total_files):
+            if idx not in cache_keys:
+                record_unit_pages(current_task_id, str(idx), units[str(idx)], file_done=True, skipped=True)
+
+        futures = {
+            pool.submit(compress_single_pdf, unit_job, compression_type): (idx, shard_idx)
+            for unit_job, idx, shard_idx in units_to_submit
+        }
+        try:
+            for future in as_completed(futures):
+                idx, shard_idx = futures[future]
+                res = future.result()
+                for stage, seconds in res.pop("stage_s", {}).items():
+                    observe_stage(stage, seconds)
+                unit = str(idx) if shard_idx is None else f"{idx}.{shard_idx}"
+                # unidade pronta conta todas as páginas (ex.: estratégia 'skip' não roda o gs)
+                record_unit_pages(current_task_id, unit, units[unit])
+
+                if shard_idx is not None:
+                    plan = shard_plans[idx]
+                    plan["results"][shard_idx] = res
+                    plan["pending"] -= 1
+                    if plan["pending"] == 0:
+                        res = reassemble_shards(jobs[idx], plan["results"], compression_type)
+                    else:
+                        res = None
+
+                if res is not None:
+                    results[idx] = res
+                    try:
+                        compression_cache_put(cache_keys[idx], res)
+                    except Exception as e:
+                        logging.warning(f"Não foi possível gravar no cache de compressão: {e}")
+                    if archive:
+                        archive.add(res["output_path"], res["filename"])
+                    record_unit_pages(current_task_id, unit, units[unit], file_done=True)
+        except BrokenProcessPool:
+            reset_gs_pool()
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+            finish_page_progress(current_task_id)
+
         # =========================================================
         # CASO 1: APENAS 1 ARQUIVO → PDF DIRETO (SEM ZIP)
         # =========================================================
         if total_files == 1:
-            job = jobs[0]
-            res = compress_single_pdf(job, compression_type)
-            results.append(res)
+            res = results[0]
 
             total_input_mb = res["input_mb"]
             total_output_mb = res["output_mb"]
@@ -490,19 +2829,21 @@ def compress_task_thread_many(current_task_id, jobs, compression_type):
             reduction_pct = res["reduction_pct"]
             time_s = round(time.time() - start_time, 2)
 
-            with tasks_lock:
-                if current_task_id in tasks:
-                    tasks[current_task_id]["percent"] = 100
-                    tasks[current_task_id]["status"] = "Compressão concluída! Preparando download..."
-                    tasks[current_task_id]["file"] = res["output_path"]
-                    tasks[current_task_id]["summary"] = {
-                        "files_count": 1,
-                        "input_mb": total_input_mb,
-                        "output_mb": total_output_mb,
-                        "reduction_mb": reduction_mb,
-                        "reduction_pct": reduction_pct,
-                        "time_s": time_s,
-                    }
+            task_store.update(
+                current_task_id,
+                percent=100,
+                status="Compressão concluída! Preparando download...",
+                file=res["output_path"],
+                download_name=f"comprimidoZG_{res['filename']}",
+                summary={
+                    "files_count": 1,
+                    "input_mb": total_input_mb,
+                    "output_mb": total_output_mb,
+                    "reduction_mb": reduction_mb,
+                    "reduction_pct": reduction_pct,
+                    "time_s": time_s,
+                },
+            )
 
             # log detalhado
             log_data = {
@@ -515,8 +2856,13 @@ def compress_task_thread_many(current_task_id, jobs, compression_type):
                     "reduction_mb": res["reduction_mb"],
                     "reduction_pct": res["reduction_pct"],
                     "pages": res["pages"],
+                    "cache_hit": res["cache_hit"],
+                    "strategy": res.get("strategy"),
+                    "estimated_mb": res.get("estimated_mb"),
                 }],
                 "compression_type": compression_type,
+                "cache_hits": cache_hits,
+                "cache_misses": cache_misses,
                 "total_input_mb": total_input_mb,
                 "total_output_mb": total_output_mb,
                 "total_reduction_mb": reduction_mb,
@@ -530,52 +2876,32 @@ def compress_task_thread_many(current_task_id, jobs, compression_type):
             return
 
         # =========================================================
-        # CASO 2: VÁRIOS ARQUIVOS → COMPRIME E DEPOIS ZIPA
+        # CASO 2: VÁRIOS ARQUIVOS → FECHA O ZIP (já com todos os PDFs)
         # =========================================================
-        for idx, job in enumerate(jobs, start=1):
-            res = compress_single_pdf(job, compression_type)
-            results.append(res)
-
+        for res in results:
             total_input_mb += res["input_mb"]
             total_output_mb += res["output_mb"]
 
-            with tasks_lock:
-                if current_task_id in tasks:
-                    tasks[current_task_id]["percent"] = int((idx / total_files) * 90)
-                    tasks[current_task_id]["status"] = f"Comprimindo arquivo {idx} de {total_files}..."
-
-        # cria ZIP com todos os PDFs comprimidos
-        zip_name = f"comprimidosZG_{current_task_id}.zip"
-        zip_path = os.path.join(PROCESSED_FOLDER, zip_name)
-
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            for res in results:
-                zf.write(res["output_path"], arcname=res["filename"])
-
-        # remove PDFs individuais depois de zipar
-        for res in results:
-            try:
-                os.remove(res["output_path"])
-            except Exception as e:
-                logging.warning(f"Erro ao remover PDF individual {res['output_path']}: {e}")
+        archive.close()
 
         reduction_mb = total_input_mb - total_output_mb
         reduction_pct = (reduction_mb / total_input_mb * 100) if total_input_mb > 0 else 0.0
         time_s = round(time.time() - start_time, 2)
 
-        with tasks_lock:
-            if current_task_id in tasks:
-                tasks[current_task_id]["percent"] = 100
-                tasks[current_task_id]["status"] = "Compressão concluída! Preparando download..."
-                tasks[current_task_id]["file"] = zip_path
-                tasks[current_task_id]["summary"] = {
-                    "files_count": total_files,
-                    "input_mb": total_input_mb,
-                    "output_mb": total_output_mb,
-                    "reduction_mb": reduction_mb,
-                    "reduction_pct": reduction_pct,
-                    "time_s": time_s,
-                }
+        task_store.update(
+            current_task_id,
+            percent=100,
+            status="Compressão concluída! Preparando download...",
+            streaming=False,
+            summary={
+                "files_count": total_files,
+                "input_mb": total_input_mb,
+                "output_mb": total_output_mb,
+                "reduction_mb": reduction_mb,
+                "reduction_pct": reduction_pct,
+                "time_s": time_s,
+            },
+        )
 
         log_data = {
             "task_id": current_task_id,
@@ -587,8 +2913,13 @@ def compress_task_thread_many(current_task_id, jobs, compression_type):
                 "reduction_mb": r["reduction_mb"],
                 "reduction_pct": r["reduction_pct"],
                 "pages": r["pages"],
+                "cache_hit": r["cache_hit"],
+                "strategy": r.get("strategy"),
+                "estimated_mb": r.get("estimated_mb"),
             } for r in results],
             "compression_type": compression_type,
+            "cache_hits": cache_hits,
+            "cache_misses": cache_misses,
             "total_input_mb": total_input_mb,
             "total_output_mb": total_output_mb,
             "total_reduction_mb": reduction_mb,
@@ -602,11 +2933,15 @@ def compress_task_thread_many(current_task_id, jobs, compression_type):
 
     except Exception as e:
         logging.error(f"Erro inesperado na tarefa {current_task_id}: {e}")
-        with tasks_lock:
-            if current_task_id in tasks:
-                tasks[current_task_id]["status"] = "Erro interno"
-                tasks[current_task_id]["error"] = str(e)
-                tasks[current_task_id]["percent"] = -1
+        if archive:
+            archive.close()
+        task_store.update(
+            current_task_id,
+            status="Erro interno",
+            error=str(e),
+            percent=-1,
+            streaming=False,
+        )
 
 # ---------------------------- Conversão ----------------------------
 def extract_text_from_pdf(input_path, lang='por'):
@@ -619,7 +2954,8 @@ def extract_text_from_pdf(input_path, lang='por'):
             else:
                 # OCR fallback
                 pil_image = page.to_image().original.convert('RGB')
-                ocr_text = pytesseract.image_to_string(pil_image, lang=lang)
+                with stage_timer("tesseract_page"):
+                    ocr_text = pytesseract.image_to_string(pil_image, lang=lang)
                 text += ocr_text + "\n"
     return text.strip()
 
@@ -637,8 +2973,9 @@ def is_pdf_scanned(pdf_path):
 def pdf_to_docx(input_pdf_path, output_docx_path, lang='por', conf_threshold=50):
     # 1) PDF -> DOCX (layout)
     docx_buffer = io.BytesIO()
-    cv = Converter(input_pdf_path)
-    cv.convert(docx_buffer, start=0, end=None)
+    with stage_timer("pdf2docx"):
+        cv = pdf2docx.Converter(input_pdf_path)
+        cv.convert(docx_buffer, start=0, end=None)
     cv.close()
     docx_buffer.seek(0)
 
@@ -649,7 +2986,8 @@ def pdf_to_docx(input_pdf_path, output_docx_path, lang='por', conf_threshold=50)
     pdf_doc = fitz.open(input_pdf_path)
 
     def is_image_textual(img, lang=lang, conf_threshold=conf_threshold):
-        data = pytesseract.image_to_data(img, lang=lang, output_type=pytesseract.Output.DICT)
+        with stage_timer("tesseract_page"):
+            data = pytesseract.image_to_data(img, lang=lang, output_type=pytesseract.Output.DICT)
         confs = []
         for c in data['conf']:
             try:
@@ -668,7 +3006,8 @@ def pdf_to_docx(input_pdf_path, output_docx_path, lang='por', conf_threshold=50)
         img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
 
         if not text_in_page and is_image_textual(img, lang=lang):
-            ocr_text = pytesseract.image_to_string(img, lang=lang).strip()
+            with stage_timer("tesseract_page"):
+                ocr_text = pytesseract.image_to_string(img, lang=lang).strip()
             if i < len(word_doc.paragraphs):
                 p = word_doc.paragraphs[i]
                 # Limpeza simples: remove runs e substitui
@@ -716,9 +3055,9 @@ def upload_conversion():
             'options': []
         }), 200
 
-    task_id = str(uuid.uuid4())
-    input_path = os.path.join(UPLOAD_FOLDER, f"{task_id}_{filename}")
-    file.save(input_path)
+    task_id = g.task_id = str(uuid.uuid4())
+    input_path = claim_upload(file, os.path.join(UPLOAD_FOLDER, f"{task_id}_{filename}"))
+    upload_index.add(task_id, input_path)
 
     is_scanned = is_pdf_scanned(input_path) if ext == 'pdf' else False
 
@@ -757,7 +3096,8 @@ def convert_office_to_pdf_libreoffice(input_path):
     cmd = [soffice, '--headless', '--convert-to', 'pdf', '--outdir',
            os.path.dirname(input_path), input_path]
     try:
-        res = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        with stage_timer("libreoffice"):
+            res = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
     except FileNotFoundError as e:
         raise FileNotFoundError(f"Executável não encontrado: {soffice}") from e
     except subprocess.CalledProcessError as e:
@@ -797,9 +3137,10 @@ def run_conversion(input_path: str, target_format: str) -> tuple[bytes, str]:
             elif target_format == 'xlsx':
                 lines = text.strip().split("\n")
                 df_list = []
-                tables = camelot.read_pdf(input_path, pages='all', flavor='lattice')
-                if tables.n == 0:
-                    tables = camelot.read_pdf(input_path, pages='all', flavor='stream')
+                with stage_timer("camelot"):
+                    tables = camelot.read_pdf(input_path, pages='all', flavor='lattice')
+                    if tables.n == 0:
+                        tables = camelot.read_pdf(input_path, pages='all', flavor='stream')
                 if tables.n == 0:
                     df_list.append(pd.DataFrame({'Conteúdo': lines}))
                 else:
@@ -861,7 +3202,7 @@ def run_conversion(input_path: str, target_format: str) -> tuple[bytes, str]:
                 x_mm = (page_w_mm - disp_w_mm) / 2.0
                 y_mm = (page_h_mm - disp_h_mm) / 2.0
 
-                pdf = FPDF(orientation=orientation, unit='mm', format='A4')
+                pdf = fpdf.FPDF(orientation=orientation, unit='mm', format='A4')
                 pdf.set_auto_page_break(False)
                 pdf.add_page()
 
@@ -900,28 +3241,42 @@ def run_conversion(input_path: str, target_format: str) -> tuple[bytes, str]:
                     logging.warning(f"Erro removendo arquivo temporário: {temp_file} - {e}")
 
 
+def conversion_request_bytes() -> int:
+    """Prioridade da conversão no agendador: soma dos uploads que ela vai ler."""
+    data = request.get_json(silent=True) or {}
+    if data.get('batch_id'):
+        keys = [f"{data['batch_id']}_{t.get('task_id')}" for t in data.get('targets') or [] if isinstance(t, dict)]
+    else:
+        keys = [data.get('task_id')]
+    total = 0
+    for key in keys:
+        path = upload_index.get(key) if key else None
+        if path:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+    return total
+
+
 @app.route('/execute-conversion', methods=['POST'])
+@heavy_operation('convert', size=conversion_request_bytes)
 def execute_conversion():
     data = request.json or {}
-    task_id = data.get('task_id')
+    task_id = g.task_id = data.get('task_id')
     target_format = data.get('target_format')
 
     if not task_id or not target_format:
         return jsonify({'error': 'Parâmetros inválidos para conversão.'}), 400
 
-    file_match = None
-    for f in os.listdir(UPLOAD_FOLDER):
-        if f.startswith(task_id):
-            file_match = f
-            break
-    if not file_match:
+    input_path = upload_index.get(task_id)
+    if not input_path:
         return jsonify({'error': 'Arquivo temporário não encontrado.'}), 404
 
-    input_path = os.path.join(UPLOAD_FOLDER, file_match)
-
     try:
         content, download_name = run_conversion(input_path, target_format)
         # limpa upload temporário
+        upload_index.pop(task_id)
         try:
             if os.path.exists(input_path):
                 os.remove(input_path)
@@ -952,7 +3307,7 @@ def upload_conversion_batch():
     if not files:
         return jsonify({'error': 'Nenhum arquivo enviado.'}), 400
 
-    batch_id = str(uuid.uuid4())
+    batch_id = g.task_id = str(uuid.uuid4())
     items = []
 
     for file in files:
@@ -973,8 +3328,8 @@ def upload_conversion_batch():
 
         task_id = str(uuid.uuid4())
         stored_name = f"{batch_id}_{task_id}_{filename}"
-        input_path = os.path.join(UPLOAD_FOLDER, stored_name)
-        file.save(input_path)
+        input_path = claim_upload(file, os.path.join(UPLOAD_FOLDER, stored_name))
+        upload_index.add(f"{batch_id}_{task_id}", input_path)
 
         is_scanned = is_pdf_scanned(input_path) if ext == 'pdf' else False
 
@@ -993,6 +3348,7 @@ def upload_conversion_batch():
     }), 200
 
 @app.route('/execute-conversion-batch', methods=['POST'])
+@heavy_operation('convert', size=conversion_request_bytes)
 def execute_conversion_batch():
     """
     Executa conversão em lote.
@@ -1007,7 +3363,7 @@ def execute_conversion_batch():
     Retorna um ZIP com os arquivos convertidos.
     """
     data = request.json or {}
-    batch_id = data.get('batch_id')
+    batch_id = g.task_id = data.get('batch_id')
     targets = data.get('targets') or []
 
     if not batch_id or not isinstance(targets, list) or not targets:
@@ -1024,19 +3380,15 @@ def execute_conversion_batch():
             if not task_id or not target_format:
                 continue
 
-            prefix = f"{batch_id}_{task_id}_"
-            file_match = None
-            for f in os.listdir(UPLOAD_FOLDER):
-                if f.startswith(prefix):
-                    file_match = f
-                    break
+            index_key = f"{batch_id}_{task_id}"
+            input_path = upload_index.get(index_key)
 
-            if not file_match:
+            if not input_path:
                 logging.warning(f"Arquivo temporário não encontrado para task_id={task_id}")
                 results.append({'task_id': task_id, 'status': 'missing'})
                 continue
 
-            input_path = os.path.join(UPLOAD_FOLDER, file_match)
+            file_match = os.path.basename(input_path)
 
             try:
                 content, _download_name = run_conversion(input_path, target_format)
@@ -1050,7 +3402,8 @@ def execute_conversion_batch():
                 base, _ = os.path.splitext(original_name)
                 out_name = f"{base}.{target_format}"
 
-                z.writestr(out_name, content)
+                with stage_timer("zip_build"):
+                    z.writestr(out_name, content)
                 results.append({'task_id': task_id, 'status': 'ok', 'output': out_name})
 
             except ValueError as ve:
@@ -1061,6 +3414,7 @@ def execute_conversion_batch():
                 results.append({'task_id': task_id, 'status': 'error', 'error': 'Erro interno'})
             finally:
                 # Remove o upload original
+                upload_index.pop(index_key)
                 try:
                     if os.path.exists(input_path):
                         os.remove(input_path)
@@ -1079,20 +3433,717 @@ def execute_conversion_batch():
 
 
 # ---------------------------- Merge / Split / Organize ----------------------------
+def large_pdf_mode(total_bytes: int) -> bool:
+    """Entradas grandes: partes e resultado vão para o disco em vez de BytesIO."""
+    return total_bytes >= app.config['LARGE_PDF_MIN_MB'] * 1024 * 1024
+
+
+def respect_memory_budget() -> None:
+    """Passou de PDF_MEMORY_BUDGET_MB de RSS: esvazia o cache do MuPDF (imagens, fontes)."""
+    if process_rss_mb() > app.config['PDF_MEMORY_BUDGET_MB']:
+        fitz.TOOLS.store_shrink(100)
+        gc.collect()
+
+
+def disk_output_path(suffix: str) -> str:
+    return os.path.join(PROCESSED_FOLDER, f"{uuid.uuid4().hex}{suffix}")
+
+
+def send_and_remove(path: str, download_name: str, mimetype: str = None):
+    """Envia um resultado gravado em disco e apaga o arquivo depois da resposta."""
+    @after_this_request
+    def cleanup(response):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.warning(f"Erro ao remover arquivo {path}: {e}")
+        return response
+
+    return send_file(path, as_attachment=True, download_name=download_name, mimetype=mimetype)
+
+
+def _remove_quietly(path) -> None:
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class PdfOperationError(ValueError):
+    """Entrada inválida em merge/split/organize: 400 na rota síncrona, `error` na tarefa."""
+
+
+def wants_background_task() -> bool:
+    """Merge/split/organize a partir de ASYNC_PDF_MIN_MB viram tarefa (/progress + /download)."""
+    # uploads multipart já estão em disco quando request.files é lido
+    request.files
+    return (request.upload_bytes or 0) >= app.config['ASYNC_PDF_MIN_MB'] * 1024 * 1024
+
+
+class TaskPageProgress:
+    """on_page(feitas, total) das tarefas em background; grava no máximo a cada 0,5 s."""
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.started = False
+        self.last = 0.0
+
+    def __call__(self, done: int, total: int, file_done: bool = False) -> None:
+        if not self.started:
+            start_page_progress(self.task_id, {"pages": total}, 1)
+            self.started = True
+        now = time.monotonic()
+        if done < total and not file_done and now - self.last < 0.5:
+            return
+        self.last = now
+        record_unit_pages(self.task_id, "pages", done)
+
+
+# objetos com identidade própria nunca são unificados, mesmo iguais; o resto
+# (fontes, espaços de cor, ExtGState, dicionários de recursos...) pode ser
+MERGE_DEDUP_KEEP_TYPES = (
+    "/Page", "/Pages", "/Catalog", "/Annot", "/Outlines", "/StructTreeRoot", "/StructElem", "/Sig",
+)
+# anotações nem sempre têm /Type (os links do PyMuPDF não têm): reconhecidas pelo /Subtype
+MERGE_DEDUP_ANNOT_SUBTYPES = frozenset((
+    "/Text", "/Link", "/FreeText", "/Line", "/Square", "/Circle", "/Polygon", "/PolyLine",
+    "/Highlight", "/Underline", "/Squiggly", "/StrikeOut", "/Stamp", "/Caret", "/Ink", "/Popup",
+    "/FileAttachment", "/Sound", "/Movie", "/Widget", "/Screen", "/PrinterMark", "/TrapNet",
+    "/Watermark", "/3D", "/Redact", "/RichMedia", "/Projection",
+))
+# cada passada sobe um nível: stream -> espaço de cor/descritor -> imagem/fonte -> recursos...
+MERGE_DEDUP_MAX_PASSES = 8
+_XREF_LENGTH = re.compile(rb"/Length \d+(?: 0 R)?")
+_XREF_REF_TEXT = re.compile(r"(\d+) 0 R")
+
+
+def dedup_merged_objects(pdf_doc) -> dict:
+    """
+    Une objetos idênticos que vieram de entradas diferentes. Streams (imagens,
+    fontes embutidas, formulários) pelo hash do conteúdo bruto + dicionário; a
+    cada passada, os objetos que passaram a apontar para os mesmos streams
+    (espaços de cor, descritores, fontes, imagens) também viram um só. As
+    cópias ficam sem referência e o save as descarta. Páginas e anotações
+    (tudo o que está em algum /Annots ou tem /Subtype de anotação) nunca são
+    unificadas. Devolve {'dedup_objects': n, 'dedup_bytes_saved': bytes}.
+    """
+    # o texto de cada objeto é lido uma vez; as passadas só reescrevem referências
+    texts = {}
+    for xref in range(1, pdf_doc.xref_length()):
+        text = pdf_doc.xref_object(xref, compressed=True)
+        if text != "null":
+            texts[xref] = text
+    streams = {xref for xref in texts if pdf_doc.xref_is_stream(xref)}
+    kept_xrefs = {
+        xref for xref, text in texts.items()
+        if xref not in streams and (
+            ("/Type" in text and pdf_doc.xref_get_key(xref, "Type")[1] in MERGE_DEDUP_KEEP_TYPES)
+            or ("/Subtype" in text and pdf_doc.xref_get_key(xref, "Subtype")[1] in MERGE_DEDUP_ANNOT_SUBTYPES)
+            or _XREF_BACKLINK.search(text.encode('latin-1', 'replace'))
+        )
+    }
+    # cada anotação pertence à sua página, com ou sem /Type e /Subtype
+    for page in pdf_doc:
+        kept_xrefs.update(xref for xref, _, _ in page.annot_xrefs())
+    # o conteúdo do stream não muda entre passadas, só o dicionário
+    raw_digests = {}
+    for xref in streams:
+        raw = pdf_doc.xref_stream_raw(xref) or b""
+        raw_digests[xref] = (hashlib.sha256(raw).digest(), len(raw))
+
+    replaced = {}  # xref duplicado -> xref que fica
+    saved_bytes = 0
+    for _ in range(MERGE_DEDUP_MAX_PASSES):
+        seen = {}
+        found = {}
+        for xref, text in texts.items():
+            if xref in kept_xrefs:
+                continue
+            text = text.encode('latin-1', 'replace')
+            if xref in raw_digests:
+                digest, size = raw_digests[xref]
+                key = hashlib.sha256(_XREF_LENGTH.sub(b"", text) + digest).digest()
+            else:
+                key = hashlib.sha256(text).digest()
+                size = 0
+            kept = seen.setdefault(key, xref)
+            if kept != xref:
+                found[xref] = kept
+                saved_bytes += size + len(text)
+        if not found:
+            break
+        replaced.update(found)
+        for xref in found:
+            del texts[xref]
+        _redirect_xrefs(pdf_doc, texts, found)
+    return {'dedup_objects': len(replaced), 'dedup_bytes_saved': saved_bytes}
+
+
+def _redirect_xrefs(pdf_doc, texts, found) -> None:
+    """Troca as referências "N 0 R" das cópias em `found` pelo objeto que fica."""
+    def target(match):
+        xref = int(match.group(1))
+        return f"{found.get(xref, xref)} 0 R"
+
+    for xref, text in texts.items():
+        new_text = _XREF_REF_TEXT.sub(target, text)
+        if new_text != text:
+            pdf_doc.update_object(xref, new_text)
+            texts[xref] = new_text
+
+
+def dedup_headers(stats) -> dict:
+    """Headers com a economia da deduplicação do merge (vazio para outras operações)."""
+    if not stats or 'dedup_bytes_saved' not in stats:
+        return {}
+    return {
+        'X-ZG-Dedup-Bytes-Saved': str(stats['dedup_bytes_saved']),
+        'X-ZG-Dedup-Objects': str(stats['dedup_objects']),
+    }
+
+
+def merge_documents(paths, output, disk_mode: bool, on_page=None) -> dict:
+    """
+    Une os PDFs (lidos do disco) em `output` (caminho ou BytesIO). Com
+    MERGE_DEDUP, recursos repetidos entre as entradas são gravados uma vez;
+    devolve a economia (dedup_merged_objects) ou {}.
+    """
+    total = sum(get_pdf_page_count(path) for path in paths) if on_page else 0
+    merged_pdf = fitz.open()
+    stats = {}
+    try:
+        for path in paths:
+            with fitz.open(path, filetype='pdf') as doc:
+                merged_pdf.insert_pdf(doc)
+            if disk_mode:
+                respect_memory_budget()
+            if on_page:
+                on_page(merged_pdf.page_count, max(total, merged_pdf.page_count), file_done=True)
+        if app.config['MERGE_DEDUP'] and len(paths) > 1:
+            with stage_timer("merge_dedup"):
+                stats = dedup_merged_objects(merged_pdf)
+            logging.info(
+                f"Merge: {stats['dedup_objects']} objeto(s) repetido(s) unificado(s), "
+                f"{stats['dedup_bytes_saved']} bytes economizados."
+            )
+        # garbage=2 só descarta as cópias sem referência (o hash já fez o papel do garbage=4)
+        merged_pdf.save(output, garbage=2)
+    finally:
+        merged_pdf.close()
+    return stats
+
+
+def organize_document(path, new_order, output, disk_mode: bool, on_page=None) -> None:
+    """Monta `output` com as páginas de `path` na ordem/rotação de `new_order`."""
+    pdf_doc = fitz.open(path, filetype='pdf')
+    new_doc = fitz.open()
+    try:
+        for i, item in enumerate(new_order):
+            # Rotação é aplicada na cópia (insert_pdf mantém a geometria)
+            page_index = item['page'] - 1
+            new_doc.insert_pdf(pdf_doc, from_page=page_index, to_page=page_index, rotate=item.get('rotation', 0))
+            if disk_mode and i % 50 == 49:
+                respect_memory_budget()
+            if on_page:
+                on_page(i + 1, len(new_order))
+        new_doc.save(output)
+    finally:
+        pdf_doc.close()
+        new_doc.close()
+
+
+# insert_pdf só copia os objetos usados pelas páginas: basta garbage=3 (sem comparar streams)
+PART_SAVE_OPTIONS = {"garbage": 3, "deflate": True}
+
+
+def _copy_pages(pdf_doc, start_page: int, end_page: int):
+    """
+    Parte com as páginas start..end copiadas direto (insert_pdf): mantém links,
+    anotações e a página como ela é, sem embrulhar em Form XObject.
+    """
+    new_pdf = fitz.open()
+    new_pdf.insert_pdf(pdf_doc, from_page=start_page, to_page=end_page)
+    return new_pdf
+
+
+def extract_pages_job(source_path: str, ranges, output_path: str) -> dict:
+    """Roda no pool de processos: grava em output_path as faixas [(início, fim)] de source_path."""
+    with fitz.open(source_path, filetype='pdf') as source:
+        part = fitz.open()
+        try:
+            for start_page, end_page in ranges:
+                part.insert_pdf(source, from_page=start_page, to_page=end_page)
+            part.save(output_path, **PART_SAVE_OPTIONS)
+        finally:
+            part.close()
+    return {"path": output_path, "size": os.path.getsize(output_path)}
+
+
+def extract_parts_parallel(source_path: str, parts):
+    """
+    parts: [[(início, fim), ...], ...]. Gera as partes ao mesmo tempo no pool
+    de processos e as devolve na ordem pedida: (índice, caminho).
+    """
+    futures = [
+        get_pdf_pool().submit(extract_pages_job, source_path, ranges, disk_output_path('.pdf'))
+        for ranges in parts
+    ]
+    delivered = 0
+    try:
+        for future in futures:
+            part_path = future.result()["path"]
+            delivered += 1
+            yield delivered - 1, part_path
+    except BrokenProcessPool:
+        reset_pdf_pool()
+        raise
+    finally:
+        # interrompido no meio: cancela o resto e apaga o que ainda for gerado
+        for future in futures[delivered:]:
+            if not future.cancel():
+                future.add_done_callback(_discard_part_job)
+
+
+def _discard_part_job(future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        _remove_quietly(future.result()["path"])
+
+
+_XREF_REF = re.compile(rb"(\d+) 0 R")
+# referências que apontam "para cima" (árvore de páginas, página dona da anotação)
+_XREF_BACKLINK = re.compile(rb"/(?:Parent|P) \d+ 0 R")
+# sintaxe por objeto na parte salva: "N 0 obj ... endobj", entrada da tabela xref
+# e, nos streams, "stream ... endstream"
+SPLIT_OBJECT_SYNTAX = 40
+SPLIT_STREAM_SYNTAX = 17
+SPLIT_FILE_SYNTAX = 160     # cabeçalho %PDF, "xref 0 N" + entrada livre, startxref e %%EOF
+SPLIT_FILL_TARGET = 0.85    # parte verificada abaixo disso tenta levar mais páginas
+SPLIT_MAX_GROWS = 2
+
+
+def page_byte_costs(pdf_doc):
+    """
+    Custo em bytes de cada página pelo grafo de xrefs, calculado uma vez:
+    (próprio[i], compartilhados[i], tamanhos, fixo). "Próprio" soma os objetos
+    que só a página i usa (conteúdo, anotações) e a entrada dela em /Kids;
+    "compartilhados" são os xrefs usados por mais de uma página (fontes,
+    imagens, XObjects), cobrados uma vez por parte. "Fixo" é o que toda parte
+    carrega, medido na origem: trailer, catálogo e raiz da árvore de páginas.
+    """
+    page_xrefs = {page.xref for page in pdf_doc}
+    sizes = {}
+    children = {}
+
+    def refs(xref):
+        if xref not in children:
+            text = pdf_doc.xref_object(xref, compressed=True).encode('latin-1', 'replace')
+            sizes[xref] = len(text) + SPLIT_OBJECT_SYNTAX
+            if pdf_doc.xref_is_stream(xref):
+                sizes[xref] += _xref_stream_length(pdf_doc, xref) + SPLIT_STREAM_SYNTAX
+            children[xref] = {
+                int(found) for found in _XREF_REF.findall(_XREF_BACKLINK.sub(b"", text))
+                if int(found) not in page_xrefs and 0 < int(found) < pdf_doc.xref_length()
+            }
+        return children[xref]
+
+    reachable = []
+    users = {}
+    for page in pdf_doc:
+        seen = {page.xref}
+        stack = [page.xref]
+        while stack:
+            for child in refs(stack.pop()):
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        reachable.append(seen)
+        for xref in seen:
+            users[xref] = users.get(xref, 0) + 1
+
+    own, shared = [], []
+    for page, seen in zip(pdf_doc, reachable):
+        own.append(sum(sizes[xref] for xref in seen if users[xref] == 1) + len(f"{page.xref} 0 R "))
+        shared.append(frozenset(xref for xref in seen if users[xref] > 1))
+    return own, shared, sizes, part_fixed_cost(pdf_doc)
+
+
+def part_fixed_cost(pdf_doc) -> int:
+    """Bytes que toda parte carrega, qualquer que seja o número de páginas."""
+    catalog = pdf_doc.xref_object(pdf_doc.pdf_catalog(), compressed=True)
+    pages_root = pdf_doc.xref_get_key(pdf_doc.pdf_catalog(), "Pages")[1]
+    pages_text = pdf_doc.xref_object(int(pages_root.split()[0]), compressed=True) if pages_root.endswith(" R") else ""
+    # /Kids é cobrado por página; aqui fica só o resto do nó raiz
+    pages_text = re.sub(r"/Kids\s*\[[^\]]*\]", "/Kids[]", pages_text)
+    return (
+        SPLIT_FILE_SYNTAX
+        + len(pdf_doc.pdf_trailer(compressed=True))
+        + len(catalog) + len(pages_text) + 2 * SPLIT_OBJECT_SYNTAX
+    )
+
+
+def _pack_pages(costs, start: int, max_bytes: float, ratio: float) -> int:
+    """Última página que cabe a partir de `start` pela estimativa (no mínimo `start`)."""
+    own, shared, sizes, fixed = costs
+    in_part = set()
+    total = fixed
+    for page_num in range(start, len(own)):
+        added = own[page_num] + sum(sizes[xref] for xref in shared[page_num] - in_part)
+        if page_num > start and (total + added) * ratio > max_bytes:
+            return page_num - 1
+        total += added
+        in_part |= shared[page_num]
+    return len(own) - 1
+
+
+def _estimate_pages(costs, start: int, end: int) -> int:
+    own, shared, sizes, fixed = costs
+    in_part = set().union(*shared[start:end + 1])
+    return fixed + sum(own[start:end + 1]) + sum(sizes[xref] for xref in in_part)
+
+
+def plan_size_parts(pdf_doc, max_bytes: float, save_part, discard_part):
+    """
+    Divide por tamanho sem busca binária: empacota as páginas pelo custo do
+    grafo de xrefs e confirma cada parte com um único save de verdade
+    (save_part(doc) -> (salvo, bytes)). A razão real/estimado da última parte
+    aceita calibra as próximas; uma tentativa recusada só encolhe a parte
+    atual. Gera (início, fim, salvo) para cada parte aceita.
+    """
+    costs = page_byte_costs(pdf_doc)
+    ratio = 1.0  # real/estimado da última parte aceita
+    start = 0
+    while start < pdf_doc.page_count:
+        end = _pack_pages(costs, start, max_bytes, ratio)
+        best = None  # (fim, salvo) da maior parte já verificada que coube
+        grows = 0
+        while True:
+            part_doc = _copy_pages(pdf_doc, start, end)
+            saved, size = save_part(part_doc)
+            part_doc.close()
+            measured = size / _estimate_pages(costs, start, end)
+
+            if size <= max_bytes:
+                ratio = measured
+                if best:
+                    discard_part(best[1])
+                best = (end, saved)
+                if size >= max_bytes * SPLIT_FILL_TARGET or end == pdf_doc.page_count - 1 or grows >= SPLIT_MAX_GROWS:
+                    break
+                bigger = _pack_pages(costs, start, max_bytes, ratio)
+                if bigger <= end:
+                    break
+                grows += 1
+                end = bigger
+                continue
+
+            discard_part(saved)
+            if best:
+                # a tentativa de crescer passou do limite: fica a maior que coube
+                break
+            if end == start:
+                raise PdfOperationError(
+                    f"A página {start + 1} sozinha ({size / (1024*1024):.2f}MB) já é maior que o limite de {max_bytes / (1024 * 1024):g} MB."
+                )
+            end = max(start, min(end - 1, _pack_pages(costs, start, max_bytes, measured)))
+
+        yield start, best[0], best[1]
+        start = best[0] + 1
+
+
+_PAGE_RANGE = re.compile(r"^(\d+)(?:\s*-\s*(\d+|fim|end|final)?)?$", re.IGNORECASE)
+
+
+def parse_page_ranges(spec: str):
+    """
+    "1-3, 7, 10-40, 41-fim" -> [(1, 3), (7, 7), (10, 40), (41, None)], páginas
+    a partir de 1; None = última página. Aceita vírgula ou ponto e vírgula e
+    "10-" como "10-fim". Sintaxe inválida levanta ValueError com a mensagem.
+    """
+    ranges = []
+    for item in re.split(r"[,;]", spec or ""):
+        item = item.strip()
+        if not item:
+            continue
+        match = _PAGE_RANGE.match(item)
+        if not match:
+            raise ValueError(f"Intervalo inválido: '{item}'. Use algo como 1-3, 7, 10-fim.")
+        first = int(match.group(1))
+        if match.group(2) is None and '-' not in item:
+            last = first
+        elif match.group(2) and match.group(2).isdigit():
+            last = int(match.group(2))
+        else:
+            last = None
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"Intervalo inválido: '{item}'. O início deve ser 1 ou mais e não pode passar do fim.")
+        ranges.append((first, last))
+    if not ranges:
+        raise ValueError("Informe ao menos um intervalo de páginas.")
+    if len(ranges) > app.config['SPLIT_MAX_RANGES']:
+        raise ValueError(f"No máximo {app.config['SPLIT_MAX_RANGES']} intervalos por divisão.")
+    return ranges
+
+
+def resolve_page_ranges(ranges, page_count: int):
+    """Intervalos de parse_page_ranges -> [(início, fim)] a partir de 0, sem repetidos."""
+    resolved = []
+    for first, last in ranges:
+        if first > page_count:
+            raise PdfOperationError(f"O intervalo que começa na página {first} passa do fim do PDF ({page_count} páginas).")
+        span = (first - 1, page_count - 1 if last is None else min(last, page_count) - 1)
+        # o mesmo intervalo pedido duas vezes vira uma parte só
+        if span not in resolved:
+            resolved.append(span)
+    return resolved
+
+
+def split_document(path, filename, mode, value, repair_needed, output, disk_mode: bool, on_page=None) -> None:
+    """
+    Divide `path` em partes dentro de um ZIP em `output` (caminho ou BytesIO).
+    mode 'parts': value = nº de partes; mode 'size': value = MB máximos por parte;
+    mode 'ranges': value = intervalos de parse_page_ranges, um PDF por intervalo.
+    Erros de entrada (PDF ilegível, partes demais, página maior que o limite)
+    saem como PdfOperationError.
+    """
+    repaired_path = None
+    try:
+        if repair_needed:
+            # o reparado vai para o disco: os processos do pool leem dele
+            print(f"[{datetime.now()}] Reparo solicitado. Limpando PDF...")
+            original_doc = fitz.open(path, filetype='pdf')
+            repaired_path = disk_output_path('.pdf')
+            original_doc.save(repaired_path, garbage=4, deflate=True, clean=True)
+            original_doc.close()
+            pdf_doc = fitz.open(repaired_path, filetype='pdf')
+            print(f"[{datetime.now()}] PDF reparado com sucesso.")
+        else:
+            pdf_doc = fitz.open(path, filetype='pdf')
+        print(f"[{datetime.now()}] PDF aberto. {pdf_doc.page_count} páginas.")
+    except Exception as e:
+        _remove_quietly(repaired_path)
+        print(f"[{datetime.now()}] Erro ao abrir/reparar PDF: {e}")
+        raise PdfOperationError(f"Arquivo PDF inválido ou corrompido demais para reparar: {e}")
+
+    def save_part(part_doc):
+        """Salva a parte (em disco ou memória) e devolve (salvo, tamanho)."""
+        if disk_mode:
+            # a parte vai para o disco e entra no ZIP em blocos
+            part_path = disk_output_path('.pdf')
+            part_doc.save(part_path, **PART_SAVE_OPTIONS)
+            return part_path, os.path.getsize(part_path)
+        output_buffer = io.BytesIO()
+        part_doc.save(output_buffer, **PART_SAVE_OPTIONS)
+        return output_buffer, output_buffer.tell()
+
+    def discard_part(saved):
+        if isinstance(saved, str):
+            _remove_quietly(saved)
+
+    def store_part(saved, arcname):
+        """`saved`: caminho (modo em disco ou parte feita no pool) ou BytesIO."""
+        with stage_timer("zip_build"):
+            if isinstance(saved, str):
+                try:
+                    zipf.write(saved, arcname)
+                finally:
+                    _remove_quietly(saved)
+            else:
+                zipf.writestr(arcname, saved.getvalue())
+        if disk_mode:
+            respect_memory_budget()
+
+    def add_part(part_doc, arcname):
+        store_part(save_part(part_doc)[0], arcname)
+
+    def use_pool(part_count):
+        return (
+            part_count > 1
+            and app.config['PDF_WORKERS'] > 1
+            and pdf_doc.page_count >= app.config['SPLIT_PARALLEL_MIN_PAGES']
+        )
+
+    finished = False
+    try:
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            if mode == 'parts':
+                parts = value
+                if parts > pdf_doc.page_count:
+                    raise PdfOperationError(f"O número de partes ({parts}) não pode ser maior que o número de páginas ({pdf_doc.page_count}).")
+
+                pages_per_part = math.ceil(pdf_doc.page_count / parts)
+                part_ranges = []
+                for i in range(parts):
+                    start_page = i * pages_per_part
+                    end_page = min(start_page + pages_per_part - 1, pdf_doc.page_count - 1)
+                    if start_page <= end_page:
+                        part_ranges.append((i, start_page, end_page))
+
+                if use_pool(len(part_ranges)):
+                    print(f"[{datetime.now()}] Gerando {len(part_ranges)} partes em paralelo.")
+                    produced = extract_parts_parallel(
+                        repaired_path or path, [[(start_page, end_page)] for _, start_page, end_page in part_ranges]
+                    )
+                    with closing(produced):
+                        for n, part_path in produced:
+                            i, _, end_page = part_ranges[n]
+                            store_part(part_path, f"{filename}_parte_{i+1}_de_{parts}.pdf")
+                            if on_page:
+                                on_page(end_page + 1, pdf_doc.page_count)
+                else:
+                    for i, start_page, end_page in part_ranges:
+                        new_pdf = _copy_pages(pdf_doc, start_page, end_page)
+                        add_part(new_pdf, f"{filename}_parte_{i+1}_de_{parts}.pdf")
+                        new_pdf.close()
+                        if on_page:
+                            on_page(end_page + 1, pdf_doc.page_count)
+
+            elif mode == 'ranges':
+                spans = resolve_page_ranges(value, pdf_doc.page_count)
+                names = [
+                    f"{filename}_pagina_{start_page + 1}.pdf" if start_page == end_page
+                    else f"{filename}_paginas_{start_page + 1}-{end_page + 1}.pdf"
+                    for start_page, end_page in spans
+                ]
+                print(f"[{datetime.now()}] Iniciando divisão por intervalos: {len(spans)} parte(s).")
+                total_pages = sum(end_page - start_page + 1 for start_page, end_page in spans)
+                pages_done = 0
+
+                # cada intervalo entra no ZIP assim que fica pronto, na ordem pedida
+                if use_pool(len(spans)):
+                    produced = extract_parts_parallel(repaired_path or path, [[span] for span in spans])
+                    with closing(produced):
+                        for n, part_path in produced:
+                            store_part(part_path, names[n])
+                            pages_done += spans[n][1] - spans[n][0] + 1
+                            if on_page:
+                                on_page(pages_done, total_pages)
+                else:
+                    for (start_page, end_page), name in zip(spans, names):
+                        new_pdf = _copy_pages(pdf_doc, start_page, end_page)
+                        add_part(new_pdf, name)
+                        new_pdf.close()
+                        pages_done += end_page - start_page + 1
+                        if on_page:
+                            on_page(pages_done, total_pages)
+
+            elif mode == 'size':
+                max_size_mb = value
+                max_size_bytes = max_size_mb * 1024 * 1024
+
+                print(f"[{datetime.now()}] Iniciando divisão por tamanho (plano pelo grafo de xrefs). Limite: {max_size_mb}MB.")
+
+                parts = plan_size_parts(pdf_doc, max_size_bytes, save_part, discard_part)
+                for part_number, (start_page, end_page, saved) in enumerate(parts, start=1):
+                    print(f"[{datetime.now()}] ===== Bloco #{part_number} (págs. {start_page + 1}-{end_page + 1}) =====")
+                    store_part(saved, f"{filename}_parte_{part_number}.pdf")
+                    if on_page:
+                        on_page(end_page + 1, pdf_doc.page_count)
+        finished = True
+    finally:
+        pdf_doc.close()
+        _remove_quietly(repaired_path)
+        if not finished and isinstance(output, str):
+            _remove_quietly(output)
+
+
+def run_pdf_task(task_id, input_paths, output_path, work, *args) -> None:
+    """Thread de uma tarefa de merge/split/organize: work(*args, output_path, True, on_page)."""
+    started = time.time()
+    try:
+        task_store.update(task_id, status="Processando...", queue_position=0)
+        stats = work(*args, output_path, True, TaskPageProgress(task_id))
+        task_store.update(
+            task_id,
+            percent=100,
+            status="Concluído! Preparando download...",
+            file=output_path,
+            eta_s=0,
+            summary={'time_s': round(time.time() - started, 2), **(stats or {})},
+        )
+    except PdfOperationError as e:
+        _remove_quietly(output_path)
+        task_store.update(task_id, error=str(e), status=str(e))
+    except Exception as e:
+        _remove_quietly(output_path)
+        logging.exception(f"Erro na tarefa {task_id}: {e}")
+        task_store.update(task_id, error="Erro interno ao processar o PDF.", status="Erro ao processar o PDF.")
+    finally:
+        finish_page_progress(task_id)
+        for path in input_paths:
+            _remove_quietly(path)
+
+
+def start_pdf_task(operation, task_id, input_paths, suffix, download_name, work, *args):
+    """
+    Enfileira `work` no agendador como tarefa em background e responde 202 com o
+    task_id; o resultado sai por /progress e /download, como na compressão.
+    """
+    output_path = disk_output_path(suffix)
+    task_store.create(task_id, {
+        'percent': 0,
+        'status': 'Iniciando...',
+        'file': None,
+        'error': None,
+        'summary': None,
+        'streaming': False,
+        'eta_s': None,
+        'queue_position': 0,
+        'download_name': download_name,
+    })
+
+    def on_queued(position):
+        task_store.update(task_id, status=f"Na fila (posição {position})...", queue_position=position)
+
+    task_fn = run_pdf_task
+    if profile_handoff():
+        task_fn = profiled(task_fn, task_id, route=request.path)
+
+    try:
+        job_scheduler.submit(
+            operation,
+            sum(os.path.getsize(path) for path in input_paths),
+            task_fn, task_id, input_paths, output_path, work, *args,
+            on_queued=on_queued,
+        )
+    except SchedulerBusy:
+        task_store.pop(task_id)
+        for path in input_paths:
+            _remove_quietly(path)
+        raise
+
+    logging.info(f"Tarefa {task_id} ({operation}) criada em background.")
+    return jsonify({'task_id': task_id}), 202
+
+
 @app.route('/merge', methods=['POST'])
+@heavy_operation('merge', background=wants_background_task)
 def merge_pdfs():
     files = request.files.getlist('files')
-    merged_pdf = fitz.open()
-    for f in files:
-        doc = fitz.open(stream=f.read(), filetype='pdf')
-        merged_pdf.insert_pdf(doc)
-    buffer = io.BytesIO()
-    merged_pdf.save(buffer)
-    buffer.seek(0)
-    return send_file(buffer, as_attachment=True, download_name='unido.pdf')
+    if g.get('background_task'):
+        task_id = g.task_id = str(uuid.uuid4())
+        paths = [
+            claim_upload(f, os.path.join(UPLOAD_FOLDER, f"{task_id}_{i}_{secure_filename(f.filename)}"))
+            for i, f in enumerate(files)
+        ]
+        return start_pdf_task('merge', task_id, paths, '.pdf', 'unido.pdf', merge_documents, paths)
+
+    paths = [upload_path(f) for f in files]
+    if large_pdf_mode(sum(upload_size(f) for f in files)):
+        output_path = disk_output_path('.pdf')
+        stats = merge_documents(paths, output_path, True)
+        response = send_and_remove(output_path, 'unido.pdf')
+    else:
+        buffer = io.BytesIO()
+        stats = merge_documents(paths, buffer, False)
+        buffer.seek(0)
+        response = send_file(buffer, as_attachment=True, download_name='unido.pdf')
+    response.headers.update(dedup_headers(stats))
+    return response
 
 
 @app.route('/split', methods=['POST'])
+@heavy_operation('split', background=wants_background_task)
 def split_pdfs():
     print(f"[{datetime.now()}] REQUISIÇÃO /split recebida.")
 
@@ -1101,148 +4152,470 @@ def split_pdfs():
 
     f = request.files.getlist('pdfs')[0]
     mode = request.form.get('mode')
-
     repair_needed = request.form.get('repair_pdf') == 'true'
 
-    try:
-        pdf_bytes = f.read()
-
-        if repair_needed:
-            print(f"[{datetime.now()}] Reparo solicitado. Limpando PDF em memória...")
-            original_doc = fitz.open(stream=pdf_bytes, filetype='pdf')
-            repaired_buffer = io.BytesIO()
-            original_doc.save(repaired_buffer, garbage=4, deflate=True, clean=True)
-            original_doc.close()
-            pdf_bytes = repaired_buffer.getvalue()
-            print(f"[{datetime.now()}] PDF reparado com sucesso.")
-
-        pdf_doc = fitz.open(stream=pdf_bytes, filetype='pdf')
-        print(f"[{datetime.now()}] PDF aberto. {pdf_doc.page_count} páginas.")
-    except Exception as e:
-        print(f"[{datetime.now()}] Erro ao abrir/reparar PDF: {e}")
-        return jsonify({"message": f"Arquivo PDF inválido ou corrompido demais para reparar: {e}"}), 400
+    value = None
+    if mode == 'parts':
+        try:
+            value = int(request.form.get('parts'))
+            if value <= 0:
+                return jsonify({"message": "O número de partes deve ser maior que 0."}), 400
+        except (ValueError, TypeError):
+            return jsonify({"message": "Número de partes inválido."}), 400
+    elif mode == 'size':
+        try:
+            value = float(request.form.get('max_size_mb'))
+            if value <= 0:
+                return jsonify({"message": "O tamanho máximo deve ser maior que 0 MB."}), 400
+        except (ValueError, TypeError):
+            return jsonify({"message": "Tamanho máximo inválido."}), 400
+    elif mode == 'ranges':
+        try:
+            value = parse_page_ranges(request.form.get('ranges'))
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+    else:
+        return jsonify({"message": "Modo de divisão inválido."}), 400
 
     filename = f.filename.rsplit('.', 1)[0]
-    zip_buffer = io.BytesIO()
+    download_name = f'{filename}_dividido.zip'
+    discard_thumbnails_after(f)
+
+    if g.get('background_task'):
+        task_id = g.task_id = str(uuid.uuid4())
+        path = claim_upload(f, os.path.join(UPLOAD_FOLDER, f"{task_id}_{secure_filename(f.filename)}"))
+        return start_pdf_task(
+            'split', task_id, [path], '.zip', download_name,
+            split_document, path, filename, mode, value, repair_needed,
+        )
+
+    # PDF grande: reparo, partes e ZIP ficam em disco; o PDF é lido do upload sob demanda
+    disk_mode = large_pdf_mode(upload_size(f))
+    output = disk_output_path('.zip') if disk_mode else io.BytesIO()
+    try:
+        split_document(upload_path(f), filename, mode, value, repair_needed, output, disk_mode)
+    except PdfOperationError as e:
+        return jsonify({"message": str(e)}), 400
 
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        if mode == 'parts':
-            try:
-                parts = int(request.form.get('parts'))
-                if parts <= 0:
-                    return jsonify({"message": "O número de partes deve ser maior que 0."}), 400
-                if parts > pdf_doc.page_count:
-                    return jsonify({"message": f"O número de partes ({parts}) não pode ser maior que o número de páginas ({pdf_doc.page_count})."}), 400
-            except (ValueError, TypeError):
-                return jsonify({"message": "Número de partes inválido."}), 400
-
-            pages_per_part = math.ceil(pdf_doc.page_count / parts)
-            for i in range(parts):
-                start_page = i * pages_per_part
-                end_page = min(start_page + pages_per_part - 1, pdf_doc.page_count - 1)
-                if start_page > end_page:
-                    continue
-                new_pdf = fitz.open()
-                for page_num in range(start_page, end_page + 1):
-                    page = pdf_doc[page_num]
-                    new_pdf.new_page(width=page.rect.width, height=page.rect.height)
-                    new_pdf[-1].show_pdf_page(new_pdf[-1].rect, pdf_doc, page_num)
-                output_buffer = io.BytesIO()
-                new_pdf.save(output_buffer, garbage=4, deflate=True)
-                output_buffer.seek(0)
-                zipf.writestr(f"{filename}_parte_{i+1}_de_{parts}.pdf", output_buffer.read())
-                new_pdf.close()
-
-        elif mode == 'size':
-            try:
-                max_size_mb = float(request.form.get('max_size_mb'))
-                if max_size_mb <= 0:
-                    return jsonify({"message": "O tamanho máximo deve ser maior que 0 MB."}), 400
-            except (ValueError, TypeError):
-                return jsonify({"message": "Tamanho máximo inválido."}), 400
-
-            max_size_bytes = max_size_mb * 1024 * 1024
-            part_number = 1
-            chunk_start_page = 0
-
-            print(f"[{datetime.now()}] Iniciando divisão por tamanho (busca binária). Limite: {max_size_mb}MB.")
-
-            while chunk_start_page < pdf_doc.page_count:
-                print(f"[{datetime.now()}] ===== Bloco #{part_number} (pág. {chunk_start_page + 1}) =====")
-
-                # checa página única
-                single_page_doc = fitz.open()
-                page = pdf_doc[chunk_start_page]
-                single_page_doc.new_page(width=page.rect.width, height=page.rect.height)
-                single_page_doc[-1].show_pdf_page(single_page_doc[-1].rect, pdf_doc, chunk_start_page)
-                single_page_buffer = io.BytesIO()
-                single_page_doc.save(single_page_buffer)
-                if single_page_buffer.tell() > max_size_bytes:
-                    return jsonify({"message": f"A página {chunk_start_page + 1} sozinha ({single_page_buffer.tell() / (1024*1024):.2f}MB) já é maior que o limite de {max_size_mb} MB."}), 400
-
-                low, high = chunk_start_page, pdf_doc.page_count - 1
-                best_end_page = chunk_start_page
-
-                while low <= high:
-                    mid = (low + high) // 2
-                    test_doc = fitz.open()
-                    for page_num in range(chunk_start_page, mid + 1):
-                        p = pdf_doc[page_num]
-                        test_doc.new_page(width=p.rect.width, height=p.rect.height)
-                        test_doc[-1].show_pdf_page(test_doc[-1].rect, pdf_doc, page_num)
-                    test_buffer = io.BytesIO()
-                    test_doc.save(test_buffer)
-                    test_doc.close()
-
-                    if test_buffer.tell() <= max_size_bytes:
-                        best_end_page = mid
-                        low = mid + 1
-                    else:
-                        high = mid - 1
-
-                final_chunk_doc = fitz.open()
-                for page_num in range(chunk_start_page, best_end_page + 1):
-                    p = pdf_doc[page_num]
-                    final_chunk_doc.new_page(width=p.rect.width, height=p.rect.height)
-                    final_chunk_doc[-1].show_pdf_page(final_chunk_doc[-1].rect, pdf_doc, page_num)
-                output_buffer = io.BytesIO()
-                final_chunk_doc.save(output_buffer, garbage=4, deflate=True)
-                output_buffer.seek(0)
-                zipf.writestr(f"{filename}_parte_{part_number}.pdf", output_buffer.read())
-                final_chunk_doc.close()
-
-                part_number += 1
-                chunk_start_page = best_end_page + 1
-
-    pdf_doc.close()
-    zip_buffer.seek(0)
     print(f"[{datetime.now()}] Finalizado. Enviando ZIP.")
-    return send_file(zip_buffer, as_attachment=True, download_name=f'{filename}_dividido.zip', mimetype='application/zip')
+    if disk_mode:
+        return send_and_remove(output, download_name, mimetype='application/zip')
+    output.seek(0)
+    return send_file(output, as_attachment=True, download_name=download_name, mimetype='application/zip')
 
 
 @app.route('/organize', methods=['POST'])
+@heavy_operation('organize', background=wants_background_task)
 def organize_pdf():
     file = request.files.get('pdf')
     new_order = json.loads(request.form.get('order'))
-    pdf_doc = fitz.open(stream=file.read(), filetype='pdf')
-    new_doc = fitz.open()
-    for item in new_order:
-        # Rotação é aplicada na cópia (insert_pdf mantém a geometria)
-        page_index = item['page'] - 1
-        new_doc.insert_pdf(pdf_doc, from_page=page_index, to_page=page_index, rotate=item.get('rotation', 0))
+    discard_thumbnails_after(file)
+    if g.get('background_task'):
+        task_id = g.task_id = str(uuid.uuid4())
+        path = claim_upload(file, os.path.join(UPLOAD_FOLDER, f"{task_id}_{secure_filename(file.filename)}"))
+        return start_pdf_task('organize', task_id, [path], '.pdf', 'organized.pdf', organize_document, path, new_order)
+
+    if large_pdf_mode(upload_size(file)):
+        output_path = disk_output_path('.pdf')
+        organize_document(upload_path(file), new_order, output_path, True)
+        return send_and_remove(output_path, 'organized.pdf')
     buffer = io.BytesIO()
-    new_doc.save(buffer)
+    organize_document(upload_path(file), new_order, buffer, False)
     buffer.seek(0)
     return send_file(buffer, as_attachment=True, download_name='organized.pdf')
 
 
+# ---------------------------- Miniaturas ----------------------------
+THUMB_WIDTH_STEP = 50          # larguras arredondadas: poucas variações no cache
+THUMB_WIDTH_RANGE = (50, 600)
+THUMB_MIMETYPES = {"webp": "image/webp", "png": "image/png"}
+_THUMB_DOC_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+def thumbnail_width(raw) -> int:
+    try:
+        width = int(raw)
+    except (TypeError, ValueError):
+        width = 300
+    width = round(width / THUMB_WIDTH_STEP) * THUMB_WIDTH_STEP
+    return min(max(width, THUMB_WIDTH_RANGE[0]), THUMB_WIDTH_RANGE[1])
+
+
+def thumbnail_rotation(raw) -> int:
+    try:
+        return int(raw) % 360 // 90 * 90
+    except (TypeError, ValueError):
+        return 0
+
+
+def thumbnail_format() -> str:
+    fmt = app.config['THUMB_FORMAT']
+    return fmt if fmt in THUMB_MIMETYPES else "png"
+
+
+def thumbnail_doc_path(doc_id: str) -> str:
+    return os.path.join(THUMB_CACHE_FOLDER, f"{doc_id}.pdf")
+
+
+def thumbnail_path(doc_id: str, page: int, width: int, rotation: int, fmt: str) -> str:
+    return os.path.join(THUMB_CACHE_FOLDER, f"{doc_id}_{page}_{width}_{rotation}.{fmt}")
+
+
+def thumbnail_doc_info(doc_id: str):
+    """{'page_count', 'pages': [[larg, alt], ...]} do documento registrado, ou None."""
+    try:
+        with open(os.path.join(THUMB_CACHE_FOLDER, f"{doc_id}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def register_thumbnail_doc(file_storage) -> dict:
+    """
+    Guarda o PDF no cache de miniaturas pelo SHA-256 do upload (o mesmo arquivo
+    enviado de novo reaproveita tudo) e devolve doc_id, nº e tamanho das páginas.
+    """
+    doc_id = upload_sha256(file_storage)
+    info = thumbnail_doc_info(doc_id)
+    if info and os.path.exists(thumbnail_doc_path(doc_id)):
+        os.utime(thumbnail_doc_path(doc_id))
+        return {'doc_id': doc_id, **info}
+
+    with fitz.open(upload_path(file_storage), filetype='pdf') as doc:
+        info = {
+            'page_count': doc.page_count,
+            'pages': [[round(page.rect.width, 1), round(page.rect.height, 1)] for page in doc],
+        }
+    claim_upload(file_storage, thumbnail_doc_path(doc_id))
+    meta_path = os.path.join(THUMB_CACHE_FOLDER, f"{doc_id}.json")
+    tmp_meta = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_meta, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    os.replace(tmp_meta, meta_path)
+    evict_thumbnail_cache(keep=(thumbnail_doc_path(doc_id), meta_path))
+    return {'doc_id': doc_id, **info}
+
+
+def render_thumbnails(doc_id: str, pages, width: int, rotation: int, fmt: str) -> dict:
+    """
+    Miniaturas das páginas pedidas (a partir de 1): o que já está no cache só é
+    marcado como usado; o resto é renderizado abrindo o PDF uma vez.
+    A renderização ocupa uma vaga 'thumbnail' no agendador (SchedulerBusy = 429).
+    Devolve {página: caminho}. Documento fora do cache levanta FileNotFoundError.
+    """
+    paths = {page: thumbnail_path(doc_id, page, width, rotation, fmt) for page in pages}
+    missing = []
+    for page, path in paths.items():
+        try:
+            os.utime(path)  # LRU
+        except FileNotFoundError:
+            missing.append(page)
+    if not missing:
+        return paths
+
+    doc_path = thumbnail_doc_path(doc_id)
+    with job_scheduler.slot('thumbnail', len(missing)):
+        try:
+            # pode ter sido removido (janitor, evicção) depois da checagem da rota
+            os.utime(doc_path)
+            doc = fitz.open(doc_path, filetype='pdf')
+        except (FileNotFoundError, fitz.FileNotFoundError) as e:
+            raise FileNotFoundError(doc_path) from e
+        with stage_timer("thumbnail_render"), doc:
+            _render_missing_thumbnails(doc, missing, paths, width, rotation, fmt)
+    return paths
+
+
+def _render_missing_thumbnails(doc, missing, paths, width, rotation, fmt) -> None:
+    for page_number in missing:
+        page = doc[page_number - 1]
+        zoom = width / page.rect.width
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom).prerotate(rotation), alpha=False)
+        data = pix.pil_tobytes(format="WEBP", quality=75) if fmt == "webp" else pix.tobytes("png")
+        tmp_path = f"{paths[page_number]}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, paths[page_number])  # publica de forma atômica
+
+
+def evict_thumbnail_cache(keep=()) -> None:
+    """
+    Remove do cache de miniaturas o que está sem uso há THUMB_MAX_AGE_H e, se
+    passar de THUMB_CACHE_MAX_MB, os arquivos menos usados (PDFs, metadados e
+    imagens), menos os de `keep` (o documento que acabou de chegar).
+    """
+    max_bytes = app.config['THUMB_CACHE_MAX_MB'] * 1024 * 1024
+    max_age_s = app.config['THUMB_MAX_AGE_H'] * 3600
+    now = time.time()
+    with thumb_cache_lock:
+        entries = []
+        for name in os.listdir(THUMB_CACHE_FOLDER):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(THUMB_CACHE_FOLDER, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        sizes = {path: size for _, size, path in entries}
+        total_bytes = sum(sizes.values())
+        entries.sort()  # menos usados primeiro
+        for mtime, _, path in entries:
+            expired = now - mtime > max_age_s
+            if not expired and total_bytes <= max_bytes:
+                break
+            if path in keep or path not in sizes:
+                continue
+            victims = [path]
+            if path.endswith('.pdf'):
+                # sem o PDF o metadado não serve: o próximo pedido registra de novo
+                victims.append(path[:-len('.pdf')] + '.json')
+            for victim in victims:
+                try:
+                    os.remove(victim)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= sizes.pop(victim, 0)
+
+
+def discard_thumbnail_doc(doc_id: str) -> None:
+    """Apaga o PDF, o metadado e todas as miniaturas de um documento do cache."""
+    if not _THUMB_DOC_ID.match(doc_id or ""):
+        return
+    with thumb_cache_lock:
+        for name in os.listdir(THUMB_CACHE_FOLDER):
+            if name.startswith(doc_id):
+                _remove_quietly(os.path.join(THUMB_CACHE_FOLDER, name))
+
+
+def discard_thumbnails_after(file_storage) -> None:
+    """
+    O organize/split deste upload foi aceito: as miniaturas já não servem, e a
+    cópia do PDF no cache é apagada logo depois da resposta (200 ou 202).
+    """
+    doc_id = upload_sha256(file_storage)
+
+    @after_this_request
+    def cleanup(response):
+        if response.status_code in (200, 202):
+            discard_thumbnail_doc(doc_id)
+        return response
+
+
+def thumbnail_doc_missing():
+    return jsonify({"message": "Documento não encontrado. Envie o PDF novamente."}), 404
+
+
+@app.route('/thumbnails', methods=['POST'])
+@heavy_operation('thumbnail')
+def register_thumbnails():
+    """Recebe o PDF uma vez; as miniaturas saem depois por intervalo/página."""
+    file = request.files.get('pdf')
+    if not file:
+        return jsonify({"message": "Nenhum arquivo enviado."}), 400
+    try:
+        return jsonify(register_thumbnail_doc(file))
+    except Exception as e:
+        logging.warning(f"Miniaturas: PDF inválido ({file.filename}): {e}")
+        return jsonify({"message": "Arquivo PDF inválido ou corrompido."}), 400
+
+
+@app.route('/thumbnails/<doc_id>', methods=['GET'])
+def thumbnail_range(doc_id):
+    """
+    ?pages=1-20,35&w=300&rotate=0: renderiza as que faltam (uma abertura do PDF)
+    e devolve a URL de cada uma; o navegador pede só as páginas visíveis.
+    """
+    info = thumbnail_doc_info(doc_id) if _THUMB_DOC_ID.match(doc_id) else None
+    if not info or not os.path.exists(thumbnail_doc_path(doc_id)):
+        return thumbnail_doc_missing()
+    try:
+        spans = resolve_page_ranges(parse_page_ranges(request.args.get('pages')), info['page_count'])
+    except (ValueError, PdfOperationError) as e:
+        return jsonify({"message": str(e)}), 400
+    pages = sorted({page + 1 for start, end in spans for page in range(start, end + 1)})
+    if len(pages) > app.config['THUMB_MAX_PAGES']:
+        return jsonify({"message": f"No máximo {app.config['THUMB_MAX_PAGES']} páginas por pedido."}), 400
+
+    width = thumbnail_width(request.args.get('w'))
+    rotation = thumbnail_rotation(request.args.get('rotate'))
+    try:
+        render_thumbnails(doc_id, pages, width, rotation, thumbnail_format())
+    except FileNotFoundError:
+        return thumbnail_doc_missing()
+    return jsonify({'thumbnails': [
+        {'page': page, 'url': url_for('thumbnail_image', doc_id=doc_id, page=page, w=width, rotate=rotation)}
+        for page in pages
+    ]})
+
+
+@app.route('/thumbnails/<doc_id>/<int:page>', methods=['GET'])
+def thumbnail_image(doc_id, page):
+    """Imagem de uma página (do cache ou renderizada agora), com cache longo no navegador."""
+    info = thumbnail_doc_info(doc_id) if _THUMB_DOC_ID.match(doc_id) else None
+    if not info or not 1 <= page <= info['page_count']:
+        return jsonify({"message": "Miniatura não encontrada."}), 404
+
+    width = thumbnail_width(request.args.get('w'))
+    rotation = thumbnail_rotation(request.args.get('rotate'))
+    fmt = thumbnail_format()
+    try:
+        path = render_thumbnails(doc_id, [page], width, rotation, fmt)[page]
+        # o mtime muda a cada uso (LRU); o conteúdo não, então a ETag sai do próprio nome
+        response = send_file(
+            path, mimetype=THUMB_MIMETYPES[fmt], conditional=True,
+            etag=os.path.basename(path), max_age=86400,
+        )
+    except FileNotFoundError:
+        return thumbnail_doc_missing()
+
+    g.cacheable_response = True
+    return response
+
+
+# ---------------------------- Estatísticas ----------------------------
+@app.route('/stats/compression', methods=['GET'])
+def compression_stats():
+    """Agregados do log de compressão: por dia e por tipo (média de redução, p95 de tempo)."""
+    try:
+        days = max(int(request.args.get('days', 30)), 1)
+    except ValueError:
+        return jsonify({'error': 'Parâmetro days inválido.'}), 400
+
+    since = (datetime.utcnow() - timedelta(days=days)).isoformat() + "Z"
+
+    with closing(_compression_log_db()) as conn:
+        per_day = conn.execute("""
+            SELECT substr(finished_at, 1, 10) AS day, COUNT(*), SUM(files_count),
+                   SUM(total_input_mb), SUM(total_output_mb)
+            FROM compression_log
+            WHERE finished_at >= ?
+            GROUP BY day ORDER BY day
+        """, (since,)).fetchall()
+        rows = conn.execute("""
+            SELECT compression_type, total_reduction_pct, time_taken_seconds
+            FROM compression_log
+            WHERE finished_at >= ?
+        """, (since,)).fetchall()
+
+    by_type = {}
+    for compression_type, reduction_pct, time_s in rows:
+        entry = by_type.setdefault(compression_type, {'reductions': [], 'times': []})
+        if reduction_pct is not None:
+            entry['reductions'].append(reduction_pct)
+        if time_s is not None:
+            entry['times'].append(time_s)
+
+    return jsonify({
+        'days': days,
+        'per_day': [{
+            'day': day,
+            'tasks': tasks_count,
+            'files': files or 0,
+            'input_mb': round(input_mb or 0, 2),
+            'output_mb': round(output_mb or 0, 2),
+        } for day, tasks_count, files, input_mb, output_mb in per_day],
+        'per_type': [{
+            'compression_type': compression_type,
+            'tasks': len(entry['times']),
+            'avg_reduction_pct': round(sum(entry['reductions']) / len(entry['reductions']), 2) if entry['reductions'] else None,
+            'avg_time_s': round(sum(entry['times']) / len(entry['times']), 2) if entry['times'] else None,
+            'p95_time_s': _percentile(entry['times'], 95),
+        } for compression_type, entry in sorted(by_type.items(), key=lambda kv: str(kv[0]))],
+    })
+
+
+def _folder_bytes(folder: str) -> int:
+    total = 0
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return total
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Formato texto do Prometheus: contadores/histogramas deste processo + gauges do momento."""
+    gauges = []
+    for operation, state in job_scheduler.snapshot().items():
+        gauges.append(("zg_scheduler_queue_depth", {"operation": operation}, state["queued"]))
+        gauges.append(("zg_scheduler_running", {"operation": operation}, state["running"]))
+        gauges.append(("zg_scheduler_limit", {"operation": operation}, state["limit"]))
+    gauges.append(("zg_tasks_active", {}, task_store.count()))
+    for label, folder in (
+        ("uploads", UPLOAD_FOLDER), ("processed", PROCESSED_FOLDER),
+        ("cache", COMPRESS_CACHE_FOLDER), ("thumbs", THUMB_CACHE_FOLDER),
+    ):
+        gauges.append(("zg_folder_bytes", {"folder": label}, _folder_bytes(folder)))
+    with janitor_stats_lock:
+        gauges.append(("zg_janitor_reclaimed_bytes_total", {}, janitor_stats["bytes_reclaimed"]))
+        gauges.append(("zg_janitor_files_removed_total", {}, janitor_stats["files_removed"]))
+    gauges.append(("zg_process_resident_memory_bytes", {}, int(process_rss_mb() * 1024 * 1024)))
+
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
 # ---------------------------- No Cache ----------------------------
 @app.after_request
 def no_cache(response):
+    # quem marca cacheable_response define o próprio Cache-Control
+    # (miniaturas com max-age, resultados com revalidação)
+    if g.get('cacheable_response'):
+        return response
     response.headers['Cache-Control'] = 'no-store'
     return response
 
 
+# ---------------------------- Warm-up e relatório de startup ----------------------------
+def warm_up(names) -> None:
+    """Carrega já as bibliotecas escolhidas (com gunicorn --preload, o fork herda prontas)."""
+    for name in names:
+        module = LAZY_MODULES.get(name)
+        if module is None:
+            logging.warning(f"WARMUP_MODULES: biblioteca desconhecida '{name}'.")
+            continue
+        try:
+            module.load()
+        except ImportError as e:
+            logging.warning(f"WARMUP_MODULES: não foi possível carregar {name}: {e}")
+
+
+warm_up(app.config['WARMUP_MODULES'])
+
+startup_report = {
+    "startup_s": round(time.perf_counter() - _STARTUP_T0, 3),
+    "rss_mb": round(process_rss_mb(), 1),
+    "modules_loaded": [name for name, module in LAZY_MODULES.items() if module.loaded],
+}
+logging.info(
+    f"Startup: {startup_report['startup_s']:.2f} s, RSS {startup_report['rss_mb']:.0f} MB, "
+    f"bibliotecas carregadas: {', '.join(startup_report['modules_loaded']) or 'nenhuma'}."
+)
+
+
+@app.route('/stats/runtime', methods=['GET'])
+def runtime_stats():
+    """Startup e memória deste worker, e quais bibliotecas pesadas ele já carregou."""
+    return jsonify({
+        "pid": os.getpid(),
+        "startup": startup_report,
+        "rss_mb": round(process_rss_mb(), 1),
+        "modules": {
+            name: {"loaded": module.loaded, "load_s": module.load_s}
+            for name, module in LAZY_MODULES.items()
+        },
+    })
+
+
 if __name__ == '__main__':
     # Para Linux
     app.run(debug=True, host='0.0.0.0', port=5009)
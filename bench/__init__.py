@@ -0,0 +1,12 @@
+"""
+Benchmarks do ZG PDF.
+
+- `bench.corpus`: gera arquivos sintéticos representativos (texto, escaneado,
+  misto, 1.000+ páginas, tabelas, DOCX e imagens), sempre iguais para a mesma seed.
+- `bench.harness`: roda as rotas pelo test client do Flask e grava p50/p95,
+  throughput e pico de RSS num JSON comparável entre execuções.
+
+Uso:
+    python -m bench.harness --repeat 5
+    python -m bench.harness --compare bench/results/antes.json bench/results/depois.json
+"""
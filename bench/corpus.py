@@ -0,0 +1,217 @@
+"""
+Corpus sintético para os benchmarks.
+
+Cada arquivo é gerado a partir de uma seed fixa, então duas execuções com os
+mesmos parâmetros produzem os mesmos bytes (no DOCX só mudam as datas internas
+do zip) e os tempos podem ser comparados entre si.
+
+    python -m bench.corpus --out bench/corpus
+"""
+import argparse
+import io
+import os
+import random
+from datetime import datetime
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageFilter
+
+PAGE_W, PAGE_H = 595, 842  # A4 em pontos
+
+WORDS = (
+    "processo contrato cliente prazo valor pagamento fatura entrega relatório "
+    "análise cláusula documento assinatura parecer referência anexo período "
+    "empresa departamento aprovação revisão orçamento medição serviço obra"
+).split()
+
+
+def _paragraph(rng: random.Random, words: int = 90) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _text_page(doc, rng: random.Random, page_number: int) -> None:
+    page = doc.new_page(width=PAGE_W, height=PAGE_H)
+    page.insert_text((56, 56), f"Documento de teste - página {page_number}", fontsize=14)
+    body = "\n\n".join(_paragraph(rng) for _ in range(4))
+    page.insert_textbox(fitz.Rect(56, 80, PAGE_W - 56, PAGE_H - 56), body, fontsize=10)
+
+
+def _noise(rng: random.Random, size) -> Image.Image:
+    # ruído a partir da seed (Image.effect_noise não é reprodutível)
+    return Image.frombytes("L", size, rng.randbytes(size[0] * size[1]))
+
+
+def _photo(rng: random.Random, width: int, height: int) -> Image.Image:
+    """Imagem "fotográfica" (gradiente + ruído): comprime mal, como foto real."""
+    base = Image.linear_gradient("L").resize((width, height))
+    noise = _noise(rng, (width, height)).filter(ImageFilter.BoxBlur(1))
+    r = Image.blend(base, noise, 0.5)
+    g = Image.blend(base.transpose(Image.FLIP_LEFT_RIGHT), noise, 0.4)
+    b = noise.filter(ImageFilter.GaussianBlur(rng.randint(1, 3)))
+    return Image.merge("RGB", (r, g, b))
+
+
+def _scan_of_text(rng: random.Random, dpi: int = 150) -> Image.Image:
+    """Página "escaneada": texto rasterizado, levemente cinza e com ruído."""
+    doc = fitz.open()
+    _text_page(doc, rng, 1)
+    pix = doc[0].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    doc.close()
+    img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    noise = _noise(rng, img.size)
+    return Image.blend(img, noise, 0.04).rotate(rng.uniform(-0.8, 0.8), fillcolor=255)
+
+
+def _save(doc, path: str) -> None:
+    # sem datas nem /ID novo: o mesmo corpus sai byte a byte igual
+    doc.set_metadata({})
+    doc.save(path, garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+
+
+def _image_bytes(img: Image.Image, fmt: str = "JPEG", quality: int = 85) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, fmt, quality=quality)
+    return buffer.getvalue()
+
+
+def text_pdf(path: str, pages: int = 40, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for i in range(pages):
+        _text_page(doc, rng, i + 1)
+    _save(doc, path)
+    return path
+
+
+def scanned_pdf(path: str, pages: int = 12, seed: int = 2) -> str:
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=PAGE_W, height=PAGE_H)
+        page.insert_image(page.rect, stream=_image_bytes(_scan_of_text(rng)))
+    _save(doc, path)
+    return path
+
+
+def mixed_pdf(path: str, pages: int = 20, seed: int = 3) -> str:
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for i in range(pages):
+        _text_page(doc, rng, i + 1)
+        if i % 2 == 0:
+            photo = _image_bytes(_photo(rng, 1200, 800))
+            doc[-1].insert_image(fitz.Rect(56, 480, PAGE_W - 56, 780), stream=photo)
+    _save(doc, path)
+    return path
+
+
+def large_pdf(path: str, pages: int = 1200, seed: int = 4) -> str:
+    """Documento longo (1.000+ páginas) de texto com uma imagem a cada 50 páginas."""
+    rng = random.Random(seed)
+    photo = _image_bytes(_photo(rng, 800, 600))
+    doc = fitz.open()
+    for i in range(pages):
+        _text_page(doc, rng, i + 1)
+        if i % 50 == 0:
+            doc[-1].insert_image(fitz.Rect(56, 560, PAGE_W - 56, 780), stream=photo)
+    _save(doc, path)
+    return path
+
+
+def tables_pdf(path: str, pages: int = 10, rows: int = 30, cols: int = 6, seed: int = 5) -> str:
+    """Tabelas com grade desenhada (o camelot lattice encontra) e números."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    left, top, right = 40, 60, PAGE_W - 40
+    row_h = (PAGE_H - 100) / rows
+    col_w = (right - left) / cols
+    for p in range(pages):
+        page = doc.new_page(width=PAGE_W, height=PAGE_H)
+        page.insert_text((left, 40), f"Planilha de medição {p + 1}", fontsize=12)
+        bottom = top + rows * row_h
+        for r in range(rows + 1):
+            y = top + r * row_h
+            page.draw_line((left, y), (right, y), width=0.6)
+        for c in range(cols + 1):
+            x = left + c * col_w
+            page.draw_line((x, top), (x, bottom), width=0.6)
+        for r in range(rows):
+            for c in range(cols):
+                if r == 0:
+                    cell = f"Coluna {c + 1}"
+                elif c == 0:
+                    cell = f"Item {r}"
+                else:
+                    cell = f"{rng.uniform(0, 10000):.2f}"
+                page.insert_text((left + c * col_w + 4, top + r * row_h + row_h * 0.7), cell, fontsize=7)
+    _save(doc, path)
+    return path
+
+
+def sample_docx(path: str, paragraphs: int = 60, seed: int = 6) -> str:
+    import docx  # python-docx
+
+    rng = random.Random(seed)
+    document = docx.Document()
+    document.add_heading("Relatório de teste", level=1)
+    for i in range(paragraphs):
+        document.add_paragraph(_paragraph(rng))
+        if i % 20 == 0:
+            table = document.add_table(rows=6, cols=4)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = f"{rng.uniform(0, 1000):.1f}"
+    document.core_properties.created = datetime(2024, 1, 1)
+    document.core_properties.modified = datetime(2024, 1, 1)
+    document.save(path)
+    return path
+
+
+def photo_jpg(path: str, seed: int = 7) -> str:
+    _photo(random.Random(seed), 3000, 2000).save(path, "JPEG", quality=90)
+    return path
+
+
+def scan_png(path: str, seed: int = 8) -> str:
+    _scan_of_text(random.Random(seed), dpi=200).save(path, "PNG")
+    return path
+
+
+# nome do arquivo -> gerador
+CORPUS = {
+    "text.pdf": text_pdf,
+    "scanned.pdf": scanned_pdf,
+    "mixed.pdf": mixed_pdf,
+    "large.pdf": large_pdf,
+    "tables.pdf": tables_pdf,
+    "sample.docx": sample_docx,
+    "photo.jpg": photo_jpg,
+    "scan.png": scan_png,
+}
+
+
+def build_corpus(out_dir: str, force: bool = False) -> dict:
+    """Gera (ou reaproveita) todos os arquivos; devolve {nome: caminho}."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for name, generator in CORPUS.items():
+        path = os.path.join(out_dir, name)
+        if force or not os.path.exists(path):
+            generator(path)
+        paths[name] = path
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Gera o corpus sintético dos benchmarks.")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "corpus"))
+    parser.add_argument("--force", action="store_true", help="regera mesmo se o arquivo já existir")
+    args = parser.parse_args()
+    for name, path in build_corpus(args.out, args.force).items():
+        print(f"{name:<14} {os.path.getsize(path) / (1024 * 1024):8.2f} MB  {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Harness de benchmark: roda cada rota pelo test client do Flask sobre o corpus
+sintético e grava latência (p50/p95), throughput e pico de RSS em JSON.
+
+    python -m bench.harness                       # todos os cenários, 5 repetições
+    python -m bench.harness --only split compress --repeat 10
+    python -m bench.harness --compare antes.json depois.json
+
+O app roda num diretório de trabalho temporário (uploads/, processed/ e
+banco de log ficam lá). Cenários que dependem de programa externo (gs,
+tesseract, soffice) são marcados como "skipped" quando ele não existe.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "bench", "results")
+CORPUS_DIR = os.path.join(REPO_DIR, "bench", "corpus")
+
+
+# ---------------------------- Memória ----------------------------
+def _child_pids(pid: int) -> list:
+    pids = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children", encoding="utf-8") as f:
+                pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    return pids
+
+
+def tree_rss_mb(process_rss_mb, pid: int = None) -> float:
+    """RSS do processo + filhos (pool do gs, soffice, tesseract...)."""
+    pid = pid or os.getpid()
+    total = process_rss_mb(pid)
+    for child in _child_pids(pid):
+        total += tree_rss_mb(process_rss_mb, child)
+    return total
+
+
+class RssSampler:
+    """Amostra o RSS da árvore de processos em background e guarda o pico."""
+
+    def __init__(self, process_rss_mb, interval_s: float = 0.02):
+        self._rss = process_rss_mb
+        self.interval_s = interval_s
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak_mb = tree_rss_mb(self._rss)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.peak_mb = max(self.peak_mb, tree_rss_mb(self._rss))
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, tree_rss_mb(self._rss))
+
+
+# ---------------------------- Cenários ----------------------------
+def _upload(corpus, name):
+    """Arquivo do corpus lido para a memória: nenhum handle fica aberto entre repetições."""
+    with open(corpus[name], "rb") as f:
+        return io.BytesIO(f.read()), name
+
+
+def _files(corpus, field, *names):
+    return {field: [_upload(corpus, name) for name in names]}
+
+
+def _post(client, route, data):
+    response = client.post(route, data=data, content_type="multipart/form-data")
+    response.get_data()  # consome o corpo (send_file/streaming) como um cliente real
+    _release(response)
+    return response
+
+
+def _release(response):
+    """
+    Fecha a resposta (arquivo do send_file) e o corpo da requisição, que o
+    test client grava num arquivo temporário quando é grande e não fecha.
+    """
+    response.close()
+    response.request.environ["wsgi.input"].close()
+
+
+def _compress(compression, name):
+    def run(client, corpus):
+        data = _files(corpus, "files", name)
+        data["compression"] = compression
+        response = client.post("/compress", data=data, content_type="multipart/form-data")
+        response.get_data()
+        _release(response)
+        if response.status_code != 200:
+            return response
+        task_id = response.get_json()["task_id"]
+        while True:
+            progress = client.get(f"/progress/{task_id}")
+            state = progress.get_json() or {}
+            if progress.status_code != 200 or state.get("percent") in (100, -1):
+                break
+            time.sleep(0.05)
+        if progress.status_code != 200 or state.get("percent") == -1:
+            return progress
+        return _post_download(client, task_id)
+    return run
+
+
+def _post_download(client, task_id):
+    response = client.get(f"/download/{task_id}")
+    response.get_data()
+    _release(response)
+    return response
+
+
+def _split(name, **form):
+    def run(client, corpus):
+        data = _files(corpus, "pdfs", name)
+        data.update(form)
+        return _post(client, "/split", data)
+    return run
+
+
+def _merge(*names):
+    def run(client, corpus):
+        return _post(client, "/merge", _files(corpus, "files", *names))
+    return run
+
+
+def _organize(name, pages):
+    def run(client, corpus):
+        data = {"pdf": _upload(corpus, name)}
+        data["order"] = json.dumps([{"page": p, "rotation": 90 if p % 2 else 0} for p in range(pages, 0, -1)])
+        return _post(client, "/organize", data)
+    return run
+
+
+def _upload_conversion(name):
+    def run(client, corpus):
+        return _post(client, "/upload-conversion", {"file": _upload(corpus, name)})
+    return run
+
+
+def _convert(name, target_format):
+    def run(client, corpus):
+        upload = _post(client, "/upload-conversion", {"file": _upload(corpus, name)})
+        if upload.status_code != 200:
+            return upload
+        response = client.post("/execute-conversion", json={
+            "task_id": upload.get_json()["task_id"],
+            "target_format": target_format,
+        })
+        response.get_data()
+        return response
+    return run
+
+
+# nome -> (arquivos de entrada, programas externos exigidos, função)
+SCENARIOS = {
+    "compress_text": (["text.pdf"], ["gs"], _compress("ebook", "text.pdf")),
+    "compress_mixed": (["mixed.pdf"], ["gs"], _compress("ebook", "mixed.pdf")),
+    "compress_scanned": (["scanned.pdf"], ["gs"], _compress("screen", "scanned.pdf")),
+    "compress_large": (["large.pdf"], ["gs"], _compress("screen", "large.pdf")),
+    "split_size_large": (["large.pdf"], [], _split("large.pdf", mode="size", max_size_mb="0.5")),
+    "split_size_mixed": (["mixed.pdf"], [], _split("mixed.pdf", mode="size", max_size_mb="1")),
+    "split_parts_large": (["large.pdf"], [], _split("large.pdf", mode="parts", parts="4")),
+    "merge_mixed": (["text.pdf", "mixed.pdf", "tables.pdf"], [], _merge("text.pdf", "mixed.pdf", "tables.pdf")),
+    "organize_text": (["text.pdf"], [], _organize("text.pdf", 40)),
+    "upload_conversion_pdf": (["scanned.pdf"], [], _upload_conversion("scanned.pdf")),
+    "upload_conversion_docx": (["sample.docx"], [], _upload_conversion("sample.docx")),
+    "upload_conversion_jpg": (["photo.jpg"], [], _upload_conversion("photo.jpg")),
+    "convert_jpg_pdf": (["photo.jpg"], [], _convert("photo.jpg", "pdf")),
+    "convert_png_pdf": (["scan.png"], [], _convert("scan.png", "pdf")),
+    "convert_pdf_docx": (["text.pdf"], [], _convert("text.pdf", "docx")),
+    "convert_tables_xlsx": (["tables.pdf"], [], _convert("tables.pdf", "xlsx")),
+    "convert_scanned_txt": (["scanned.pdf"], ["tesseract"], _convert("scanned.pdf", "txt")),
+    "convert_docx_pdf": (["sample.docx"], ["soffice"], _convert("sample.docx", "pdf")),
+}
+
+
+def _missing_programs(programs) -> list:
+    aliases = {"gs": ("gs", "gswin64c"), "soffice": ("soffice", "libreoffice"), "tesseract": ("tesseract",)}
+    return [p for p in programs if not any(shutil.which(name) for name in aliases.get(p, (p,)))]
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def run_scenario(client, process_rss_mb, corpus, name, repeat: int, warmup: int) -> dict:
+    inputs, programs, run = SCENARIOS[name]
+    missing = _missing_programs(programs)
+    if missing:
+        return {"status": "skipped", "reason": f"programa ausente: {', '.join(missing)}"}
+
+    input_bytes = sum(os.path.getsize(corpus[f]) for f in inputs)
+    for _ in range(warmup):
+        run(client, corpus)
+
+    latencies, status_codes = [], {}
+    with RssSampler(process_rss_mb) as sampler:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            response = run(client, corpus)
+            latencies.append(time.perf_counter() - t0)
+            status_codes[str(response.status_code)] = status_codes.get(str(response.status_code), 0) + 1
+        total_s = time.perf_counter() - started
+
+    errors = sum(count for code, count in status_codes.items() if int(code) >= 400)
+    return {
+        "status": "ok" if not errors else "errors",
+        "runs": repeat,
+        "errors": errors,
+        "status_codes": status_codes,
+        "input_bytes": input_bytes,
+        "p50_s": round(_percentile(latencies, 50), 4),
+        "p95_s": round(_percentile(latencies, 95), 4),
+        "mean_s": round(statistics.mean(latencies), 4),
+        "min_s": round(min(latencies), 4),
+        "max_s": round(max(latencies), 4),
+        "throughput_rps": round(repeat / total_s, 3),
+        "throughput_mb_s": round(input_bytes * repeat / total_s / (1024 * 1024), 3),
+        "peak_rss_mb": round(sampler.peak_mb, 1),
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "-C", REPO_DIR, "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names, repeat: int, warmup: int, corpus_dir: str, workdir: str, verbose: bool) -> dict:
+    from bench.corpus import build_corpus
+
+    corpus = build_corpus(corpus_dir)
+
+    # o app cria uploads/, processed/ e bancos no diretório atual
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    os.environ.setdefault("JANITOR_ENABLED", "False")
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    import logging
+    import app as zg_app
+
+    if not verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    client = zg_app.app.test_client()
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+            "warmup": warmup,
+            "startup": zg_app.startup_report,
+        },
+        "scenarios": {},
+    }
+    for name in names:
+        print(f"{name} ...", flush=True)
+        result = run_scenario(client, zg_app.process_rss_mb, corpus, name, repeat, warmup)
+        results["scenarios"][name] = result
+        if result["status"] == "skipped":
+            print(f"  skipped ({result['reason']})")
+        else:
+            print(
+                f"  p50 {result['p50_s']:.3f} s  p95 {result['p95_s']:.3f} s  "
+                f"{result['throughput_rps']:.2f} req/s  pico RSS {result['peak_rss_mb']:.0f} MB"
+                + (f"  erros {result['errors']}" if result["errors"] else "")
+            )
+    return results
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """Tabela p50/p95/RSS de dois resultados (variação relativa ao primeiro)."""
+    with open(before_path, encoding="utf-8") as f:
+        before = json.load(f)["scenarios"]
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)["scenarios"]
+
+    def delta(old, new):
+        if not old:
+            return "   n/a"
+        return f"{(new - old) / old * 100:+6.1f}%"
+
+    print(f"{'cenário':<24} {'p50 antes':>10} {'p50 depois':>10} {'Δ':>7}  {'p95 Δ':>7}  {'RSS Δ':>7}")
+    for name in sorted(set(before) | set(after)):
+        old, new = before.get(name, {}), after.get(name, {})
+        if old.get("status") in (None, "skipped") or new.get("status") in (None, "skipped"):
+            print(f"{name:<24} {'-':>10} {'-':>10}")
+            continue
+        print(
+            f"{name:<24} {old['p50_s']:>10.3f} {new['p50_s']:>10.3f} {delta(old['p50_s'], new['p50_s'])}"
+            f"  {delta(old['p95_s'], new['p95_s'])}  {delta(old['peak_rss_mb'], new['peak_rss_mb'])}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks das rotas do ZG PDF.")
+    parser.add_argument("--only", nargs="*", help="prefixos de cenário (ex.: split compress)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--workdir", default=None, help="padrão: diretório temporário novo")
+    parser.add_argument("--out", default=None, help="padrão: bench/results/<data-hora>.json")
+    parser.add_argument("--verbose", action="store_true", help="mantém o log INFO do app")
+    parser.add_argument("--list", action="store_true", help="só lista os cenários")
+    parser.add_argument("--compare", nargs=2, metavar=("ANTES", "DEPOIS"))
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (inputs, programs, _) in SCENARIOS.items():
+            print(f"{name:<24} {', '.join(inputs)}" + (f"  (requer {', '.join(programs)})" if programs else ""))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    names = [n for n in SCENARIOS if not args.only or any(n.startswith(p) for p in args.only)]
+    corpus_dir = os.path.abspath(args.corpus)
+    out = os.path.abspath(args.out or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json"))
+    workdir = args.workdir or tempfile.mkdtemp(prefix="zg_bench_")
+
+    results = run_benchmarks(names, args.repeat, args.warmup, corpus_dir, workdir, args.verbose)
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Resultado gravado em {out}")
+
+
+if __name__ == "__main__":
+    main()
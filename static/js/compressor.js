@@ -257,7 +257,7 @@ function startCompression() {
         }
 
         const taskId = data.task_id;
-        pollProgress(taskId);
+        watchProgress(taskId);
     })
     .catch(error => {
         console.error('Erro ao iniciar compressão:', error);
@@ -270,9 +270,120 @@ function startCompression() {
 
 
 /**
- * Poll de progresso – continua igual, só lida com summary de múltiplos também.
+ * Aplica um estado de progresso na tela. Devolve true quando a tarefa terminou.
+ * `state.downloadStarted`: lotes têm o ZIP montado em streaming e o download
+ * pode começar antes do fim.
  */
-function pollProgress(taskId) {
+function handleProgress(taskId, data, state) {
+    const percent = data.percent;
+    const status = data.status;
+    const summary = data.summary || null;
+
+    if (progressBar) {
+        const currentWidth = parseFloat(progressBar.style.width) || 0;
+        const newWidth = currentWidth + (percent - currentWidth) * 0.3;
+        progressBar.style.width = newWidth + '%';
+
+        if (percent > 0 && percent < 100) {
+            progressBar.classList.add('animated');
+        } else {
+            progressBar.classList.remove('animated');
+        }
+    }
+
+    if (data.streaming && !state.downloadStarted) {
+        state.downloadStarted = true;
+        window.location.href = `/download/${taskId}`;
+    }
+
+    if (percent < 100) {
+        if (statusMessage) {
+            statusMessage.style.display = 'block';
+            statusMessage.textContent = `🛠️ ${status}`;
+        }
+        return false;
+    }
+
+    if (statusMessage) {
+        let msg = '✅ Compressão concluída!';
+        if (summary) {
+            const inMb = summary.input_mb;
+            const outMb = summary.output_mb;
+            const pct = summary.reduction_pct;
+            const filesCount = summary.files_count;
+
+            if (filesCount && filesCount > 1) {
+                msg += ` ${filesCount} arquivos comprimidos. Redução média de ${pct}% (${inMb.toFixed(2)} MB → ${outMb.toFixed(2)} MB em ${summary.time_s}s).`;
+            } else if (inMb != null && outMb != null && pct != null) {
+                msg += ` Redução de ${pct}% (${inMb.toFixed(2)} MB → ${outMb.toFixed(2)} MB em ${summary.time_s}s).`;
+            }
+        }
+        statusMessage.style.display = 'block';
+        statusMessage.textContent = msg;
+    }
+
+    setTimeout(() => {
+        if (!state.downloadStarted) {
+            window.location.href = `/download/${taskId}`;
+        }
+
+        setTimeout(() => {
+            if (typeof resetApp === 'function') {
+                resetApp();
+            }
+        }, 2000);
+    }, 1500);
+    return true;
+}
+
+function showProgressError() {
+    if (statusMessage) {
+        statusMessage.style.display = 'block';
+        statusMessage.textContent = 'Erro ao buscar progresso.';
+    }
+}
+
+/**
+ * Acompanha o progresso por Server-Sent Events (/progress/<id>/stream).
+ * Sem suporte a EventSource, ou se a conexão cair, volta para o polling.
+ */
+function watchProgress(taskId) {
+    const state = { downloadStarted: false, done: false };
+
+    if (!window.EventSource) {
+        pollProgress(taskId, state);
+        return;
+    }
+
+    const source = new EventSource(`/progress/${taskId}/stream`);
+    source.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.error) {
+            state.done = true;
+            source.close();
+            console.error('Erro na tarefa de compressão:', data.error);
+            showProgressError();
+            return;
+        }
+        if (handleProgress(taskId, data, state)) {
+            state.done = true;
+            source.close();
+        }
+    };
+    source.addEventListener('gone', () => {
+        state.done = true;
+        source.close();
+    });
+    source.onerror = () => {
+        source.close();
+        if (!state.done) pollProgress(taskId, state);
+    };
+}
+
+/**
+ * Poll de progresso – fallback do stream; também lida com summary de múltiplos.
+ */
+function pollProgress(taskId, state = { downloadStarted: false, done: false }) {
     const interval = setInterval(() => {
         fetch(`/progress/${taskId}`)
             .then(response => {
@@ -280,66 +391,15 @@ function pollProgress(taskId) {
                 return response.json();
             })
             .then(data => {
-                const percent = data.percent;
-                const status = data.status;
-                const summary = data.summary || null;
-
-                if (progressBar) {
-                    const currentWidth = parseFloat(progressBar.style.width) || 0;
-                    const newWidth = currentWidth + (percent - currentWidth) * 0.3;
-                    progressBar.style.width = newWidth + '%';
-
-                    if (percent > 0 && percent < 100) {
-                        progressBar.classList.add('animated');
-                    } else {
-                        progressBar.classList.remove('animated');
-                    }
-                }
-
-                if (percent < 100) {
-                    if (statusMessage) {
-                        statusMessage.style.display = 'block';
-                        statusMessage.textContent = `🛠️ ${status}`;
-                    }
-                } else {
+                if (handleProgress(taskId, data, state)) {
+                    state.done = true;
                     clearInterval(interval);
-
-                    if (statusMessage) {
-                        let msg = '✅ Compressão concluída!';
-                        if (summary) {
-                            const inMb = summary.input_mb;
-                            const outMb = summary.output_mb;
-                            const pct = summary.reduction_pct;
-                            const filesCount = summary.files_count;
-
-                            if (filesCount && filesCount > 1) {
-                                msg += ` ${filesCount} arquivos comprimidos. Redução média de ${pct}% (${inMb.toFixed(2)} MB → ${outMb.toFixed(2)} MB em ${summary.time_s}s).`;
-                            } else if (inMb != null && outMb != null && pct != null) {
-                                msg += ` Redução de ${pct}% (${inMb.toFixed(2)} MB → ${outMb.toFixed(2)} MB em ${summary.time_s}s).`;
-                            }
-                        }
-                        statusMessage.style.display = 'block';
-                        statusMessage.textContent = msg;
-                    }
-
-                    setTimeout(() => {
-                        window.location.href = `/download/${taskId}`;
-
-                        setTimeout(() => {
-                            if (typeof resetApp === 'function') {
-                                resetApp();
-                            }
-                        }, 2000);
-                    }, 1500);
                 }
             })
             .catch(err => {
                 clearInterval(interval);
                 console.error('Erro ao buscar progresso:', err);
-                if (statusMessage) {
-                    statusMessage.style.display = 'block';
-                    statusMessage.textContent = 'Erro ao buscar progresso.';
-                }
+                showProgressError();
             });
     }, 1000);
 }
@@ -75,6 +75,45 @@ function hideSpinner() {
     });
 }
 
+/**
+ * Mostra o andamento de uma tarefa em background (merge/split/organize grandes).
+ * @param {string} text - Texto a exibir; vazio esconde.
+ */
+function showTaskStatus(text) {
+    document.querySelectorAll('.task-status').forEach(el => {
+        el.textContent = text;
+        el.style.display = text ? 'block' : 'none';
+    });
+}
+
+/**
+ * Acompanha uma tarefa em background (resposta 202 com task_id) pelo
+ * /progress/<id> e, ao terminar, inicia o download por /download/<id>.
+ * @param {string} taskId - ID devolvido pelo servidor.
+ * @returns {Promise<void>} Rejeita com a mensagem de erro da tarefa (`taskError`).
+ */
+function followTask(taskId) {
+    return new Promise((resolve, reject) => {
+        const interval = setInterval(async () => {
+            try {
+                const response = await fetch(`/progress/${taskId}`);
+                const data = await response.json();
+                if (data.error) throw Object.assign(new Error(data.error), { taskError: true });
+                showTaskStatus(`${data.status} (${data.percent}%)`);
+                if (data.percent >= 100) {
+                    clearInterval(interval);
+                    window.location.href = `/download/${taskId}`;
+                    resolve();
+                }
+            } catch (err) {
+                clearInterval(interval);
+                showTaskStatus('');
+                reject(err);
+            }
+        }, 1000);
+    });
+}
+
 /**
  * Reseta o aplicativo recarregando a página.
  * @function
@@ -236,6 +275,8 @@ const PREVIEW_BATCH_SIZE = 20;
 let selectedWrappers = [];
 let intersectionObserver = null;
 let pdfDocument = null; // Usado principalmente em Organize, mas pode ser global se reutilizado
+const THUMB_WIDTH = 300; // largura (px) das miniaturas geradas no servidor (Organize/Split)
+let thumbnailDoc = null; // { doc_id, page_count, pages } do PDF registrado em /thumbnails
 
 // --- FUNÇÕES GLOBAIS ---
 
@@ -272,9 +313,128 @@ function updatePreviewIndices() {
     });
 }
 
+/**
+ * fetch das miniaturas: com o servidor ocupado (429), espera o Retry-After e tenta de novo.
+ */
+async function fetchThumbnailApi(url, options = {}, attempts = 3) {
+    for (let attempt = 1; ; attempt++) {
+        const response = await fetch(url, options);
+        if (response.status !== 429 || attempt >= attempts) return response;
+        const waitS = parseInt(response.headers.get('Retry-After')) || 1;
+        await new Promise(resolve => setTimeout(resolve, waitS * 1000));
+    }
+}
+
+/**
+ * Envia o PDF uma vez para o servidor, que passa a gerar as miniaturas das páginas.
+ * Reaproveita o registro se o arquivo já foi enviado nesta página.
+ * @param {File} file - O arquivo PDF.
+ * @returns {Promise<Object>} { doc_id, page_count, pages: [[largura, altura], ...] }
+ */
+async function registerThumbnailDoc(file) {
+    if (thumbnailDoc && thumbnailDoc.file === file) return thumbnailDoc;
+
+    const formData = new FormData();
+    formData.append('pdf', file);
+    const response = await fetchThumbnailApi('/thumbnails', { method: 'POST', body: formData });
+    if (!response.ok) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.message || 'Erro ao gerar as miniaturas.');
+    }
+    thumbnailDoc = { ...(await response.json()), file };
+    return thumbnailDoc;
+}
+
+/**
+ * URL da miniatura de uma página (renderizada no servidor sob demanda e guardada em cache).
+ */
+function thumbnailUrl(pageNum, rotation = 0) {
+    return `/thumbnails/${thumbnailDoc.doc_id}/${pageNum}?w=${THUMB_WIDTH}&rotate=${rotation}`;
+}
+
+/**
+ * Compacta números de página em intervalos: [3, 4, 5, 9] -> "3-5,9".
+ */
+function compactPageRanges(pageNums) {
+    const sorted = [...new Set(pageNums)].sort((a, b) => a - b);
+    const ranges = [];
+    for (const page of sorted) {
+        const last = ranges[ranges.length - 1];
+        if (last && page === last[1] + 1) last[1] = page;
+        else ranges.push([page, page]);
+    }
+    return ranges.map(([a, b]) => (a === b ? `${a}` : `${a}-${b}`)).join(',');
+}
+
+/**
+ * Pede de uma vez as miniaturas das páginas visíveis (o servidor abre o PDF uma vez só).
+ * @returns {Promise<Object>} { página: url }
+ */
+async function fetchThumbnails(pageNums) {
+    const pages = encodeURIComponent(compactPageRanges(pageNums));
+    const response = await fetchThumbnailApi(`/thumbnails/${thumbnailDoc.doc_id}?pages=${pages}&w=${THUMB_WIDTH}`);
+    if (!response.ok) throw new Error('Erro ao carregar as miniaturas.');
+    const { thumbnails } = await response.json();
+    return Object.fromEntries(thumbnails.map(t => [t.page, t.url]));
+}
+
+/**
+ * Cria uma pré-visualização de um arquivo PDF usando a miniatura da 1ª página
+ * gerada no servidor (sem carregar o PDF inteiro no navegador).
+ * Usado para os previews de arquivo único (Split/Organize).
+ * @param {File} file - O arquivo PDF.
+ * @param {number} index - O índice do arquivo na lista de selectedFiles.
+ * @returns {Promise<HTMLElement>} O wrapper da pré-visualização.
+ */
+async function createThumbnailPreview(file, index) {
+    await registerThumbnailDoc(file);
+    const img = document.createElement('img');
+    img.classList.add('preview-canvas');
+    img.draggable = false;
+    img.alt = file.name;
+    img.src = thumbnailUrl(1);
+    return buildFilePreview(file, index, img);
+}
+
+/**
+ * Monta o card de um arquivo (nome, imagem da 1ª página e botão de remover).
+ */
+function buildFilePreview(file, index, previewElement) {
+    const wrapper = document.createElement('div');
+    wrapper.classList.add('preview-wrapper');
+    wrapper.setAttribute('data-index', index);
+    wrapper.setAttribute('data-filename', file.name);
+
+    const removeBtn = document.createElement('button');
+    removeBtn.textContent = '×';
+    removeBtn.classList.add('remove-btn');
+    removeBtn.title = 'Remover arquivo';
+    removeBtn.addEventListener('click', () => {
+        if (previewContainer) previewContainer.removeChild(wrapper);
+        const idx = selectedFiles.findIndex(f => f.name === file.name);
+        if (idx !== -1) {
+            selectedFiles.splice(idx, 1);
+        }
+        if (selectedFiles.length === 0) {
+            resetApp();
+        } else {
+            rebuildPreviews();
+        }
+    });
+
+    const fileNameElement = document.createElement('p');
+    fileNameElement.textContent = file.name;
+    fileNameElement.classList.add('file-name');
+
+    wrapper.appendChild(fileNameElement);
+    wrapper.appendChild(previewElement);
+    wrapper.appendChild(removeBtn);
+    return wrapper;
+}
+
 /**
  * Cria uma pré-visualização de um arquivo PDF.
- * Usado para os previews de arquivos (Merge/Split).
+ * Usado para os previews de arquivos (Merge).
  * @param {File} file - O arquivo PDF.
  * @param {number} index - O índice do arquivo na lista de selectedFiles.
  * @returns {Promise<void>} Uma promessa que resolve quando a pré-visualização é criada.
@@ -291,11 +451,6 @@ function createPreview(file, index) {
             let scale = (originalViewport.width > MAX_PREVIEW_WIDTH) ? MAX_PREVIEW_WIDTH / originalViewport.width : 1;
             const viewport = page.getViewport({ scale: scale });
 
-            const wrapper = document.createElement('div');
-            wrapper.classList.add('preview-wrapper');
-            wrapper.setAttribute('data-index', index);
-            wrapper.setAttribute('data-filename', file.name);
-
             const canvas = document.createElement('canvas');
             canvas.classList.add('preview-canvas');
             canvas.height = viewport.height;
@@ -306,32 +461,7 @@ function createPreview(file, index) {
                 viewport: viewport
             }).promise;
 
-            const removeBtn = document.createElement('button');
-            removeBtn.textContent = '×';
-            removeBtn.classList.add('remove-btn');
-            removeBtn.title = 'Remover arquivo';
-            removeBtn.addEventListener('click', () => {
-                if (previewContainer) previewContainer.removeChild(wrapper);
-                const idx = selectedFiles.findIndex(f => f.name === file.name);
-                if (idx !== -1) {
-                    selectedFiles.splice(idx, 1);
-                }
-                if (selectedFiles.length === 0) {
-                    resetApp();
-                } else {
-                    rebuildPreviews();
-                }
-            });
-
-            const fileNameElement = document.createElement('p');
-            fileNameElement.textContent = file.name;
-            fileNameElement.classList.add('file-name');
-
-            wrapper.appendChild(fileNameElement);
-            wrapper.appendChild(canvas);
-            wrapper.appendChild(removeBtn);
-
-            resolve(wrapper); // Agora retorna o wrapper
+            resolve(buildFilePreview(file, index, canvas)); // Agora retorna o wrapper
         };
         fileReader.readAsArrayBuffer(file);
     });
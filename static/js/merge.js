@@ -133,11 +133,26 @@ if (startMergeBtn) {
             method: 'POST',
             body: formData,
         })
-        .then(response => {
+        .then(async response => {
+            if (response.status === 429) {
+                // servidor ocupado: a mensagem já traz o tempo de espera e a posição na fila
+                const data = await response.json();
+                throw Object.assign(new Error(data.message), { busy: true });
+            }
+            if (response.status === 202) {
+                // arquivos grandes: o servidor une em background e o download sai pelo /download
+                const { task_id } = await response.json();
+                await followTask(task_id);
+                return null;
+            }
             if (!response.ok) throw new Error('Erro ao unir PDFs');
             return response.blob();
         })
         .then(blob => {
+            if (!blob) {
+                setTimeout(() => resetApp(), 3000);
+                return;
+            }
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.href = url;
@@ -151,7 +166,7 @@ if (startMergeBtn) {
         .catch(err => {
             hideSpinner();
             console.error(err);
-            showError('Erro ao unir PDFs.', errorMessage3);
+            showError(err.busy || err.taskError ? err.message : 'Erro ao unir PDFs.', errorMessage3);
         })
         .finally(() => {
             closeMenu(mergeMenu);
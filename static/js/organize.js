@@ -66,9 +66,13 @@ async function rebuildPreviews() {
     if (fileInput) fileInput.disabled = true;
     if (dropZone) dropZone.classList.add('disabled-upload');
 
-    // Cria preview do arquivo único
-    const previewElement = await createPreview(selectedFiles[0], 0);
-    previewContainer.appendChild(previewElement);
+    // Cria preview do arquivo único (miniatura gerada no servidor)
+    try {
+        const previewElement = await createThumbnailPreview(selectedFiles[0], 0);
+        previewContainer.appendChild(previewElement);
+    } catch (error) {
+        showError(error.message, errorMessage);
+    }
 
     checkPreviewVisibility();
 }
@@ -77,17 +81,21 @@ async function rebuildPreviews() {
 
 /**
  * Gera pré-visualizações das páginas de um PDF para organização, com lazy loading.
+ * As miniaturas vêm do servidor; o navegador só pede as páginas que aparecem na tela.
  */
 async function generateOrganizePreviews() {
     if (selectedFiles.length === 0) return;
 
-    const file = selectedFiles[0];
-    const buffer = await file.arrayBuffer();
-    pdfDocument = await pdfjsLib.getDocument({ data: buffer }).promise;
+    try {
+        await registerThumbnailDoc(selectedFiles[0]);
+    } catch (error) {
+        showError(error.message);
+        return;
+    }
 
     if (previewContainer) previewContainer.innerHTML = '';
 
-    for (let pageNum = 1; pageNum <= pdfDocument.numPages; pageNum++) {
+    for (let pageNum = 1; pageNum <= thumbnailDoc.page_count; pageNum++) {
         const wrapper = document.createElement('div');
         wrapper.classList.add('preview-wrapper', 'lazy-load');
         wrapper.dataset.pageNum = pageNum;
@@ -140,60 +148,73 @@ async function generateOrganizePreviews() {
 }
 
 /**
- * Callback para o IntersectionObserver. Carrega a pré-visualização quando um wrapper entra na viewport.
+ * Coloca (ou troca) a miniatura de uma página no wrapper.
+ * @param {HTMLElement} wrapper
+ * @param {string} url
+ */
+function setPageThumbnail(wrapper, url) {
+    let img = wrapper.querySelector('img.preview-canvas');
+    if (!img) {
+        img = document.createElement('img');
+        img.classList.add('preview-canvas');
+        img.draggable = false;
+        img.alt = `Página ${wrapper.dataset.pageNum}`;
+
+        const pageNumberElement = wrapper.querySelector('.page-number');
+        if (pageNumberElement) {
+            wrapper.insertBefore(img, pageNumberElement);
+        } else {
+            wrapper.appendChild(img);
+        }
+
+        const rotateBtn = document.createElement('button');
+        rotateBtn.textContent = ' ⟳ ';
+        rotateBtn.classList.add('rotate-btn');
+        rotateBtn.addEventListener('click', (e) => {
+            e.stopPropagation();
+            const currentRotation = ((parseInt(wrapper.dataset.rotation) || 0) + 90) % 360;
+            wrapper.dataset.rotation = currentRotation;
+            setPageThumbnail(wrapper, thumbnailUrl(parseInt(wrapper.dataset.pageNum), currentRotation));
+        });
+        wrapper.appendChild(rotateBtn);
+    }
+    img.src = url;
+}
+
+/**
+ * Callback para o IntersectionObserver. Junta as páginas que entraram na viewport
+ * e pede as miniaturas delas ao servidor num único pedido.
  * @param {Array<IntersectionObserverEntry>} entries
  * @param {IntersectionObserver} observer
  */
 async function handleIntersection(entries, observer) {
+    const wrappers = [];
     for (const entry of entries) {
         if (entry.isIntersecting && entry.target.classList.contains('lazy-load')) {
             observer.unobserve(entry.target);
             entry.target.classList.remove('lazy-load');
+            wrappers.push(entry.target);
+        }
+    }
+    if (wrappers.length === 0 || !thumbnailDoc) return;
 
-            const wrapper = entry.target;
-            const pageNum = parseInt(wrapper.dataset.pageNum);
-            let rotation = parseInt(wrapper.dataset.rotation) || 0;
+    // o servidor limita as páginas por pedido: manda em blocos de PREVIEW_BATCH_SIZE
+    for (let i = 0; i < wrappers.length; i += PREVIEW_BATCH_SIZE) {
+        const batch = wrappers.slice(i, i + PREVIEW_BATCH_SIZE);
+        let urls = {};
+        try {
+            urls = await fetchThumbnails(batch.map(w => parseInt(w.dataset.pageNum)));
+        } catch (error) {
+            console.error('Erro ao carregar miniaturas:', error);
+        }
 
+        for (const wrapper of batch) {
+            const pageNum = parseInt(wrapper.dataset.pageNum);
+            const rotation = parseInt(wrapper.dataset.rotation) || 0;
             const placeholder = wrapper.querySelector('.preview-placeholder');
             if (placeholder) placeholder.remove();
-
-            if (!pdfDocument) {
-                console.error("PDF Documento não carregado para renderizar a página.");
-                return;
-            }
-
-            const page = await pdfDocument.getPage(pageNum);
-            const canvas = document.createElement('canvas');
-            canvas.classList.add('preview-canvas');
-
-            const renderPage = async (canvasElem, pdfPage, scale, rotationAngle) => {
-                const viewport = pdfPage.getViewport({ scale, rotation: rotationAngle });
-                canvasElem.width = viewport.width;
-                canvasElem.height = viewport.height;
-                const context = canvasElem.getContext('2d');
-                await pdfPage.render({ canvasContext: context, viewport }).promise;
-            };
-
-            await renderPage(canvas, page, 0.5, rotation);
-
-            const pageNumberElement = wrapper.querySelector('.page-number');
-            if (pageNumberElement) {
-                wrapper.insertBefore(canvas, pageNumberElement);
-            } else {
-                wrapper.appendChild(canvas);
-            }
-
-            const rotateBtn = document.createElement('button');
-            rotateBtn.textContent = ' ⟳ ';
-            rotateBtn.classList.add('rotate-btn');
-            rotateBtn.addEventListener('click', async (e) => {
-                e.stopPropagation();
-                // --- CORREÇÃO 1 AQUI ---
-                let currentRotation = ((parseInt(wrapper.dataset.rotation) || 0) + 90) % 360;
-                wrapper.dataset.rotation = currentRotation;
-                await renderPage(canvas, page, 0.5, currentRotation);
-            });
-            wrapper.appendChild(rotateBtn);
+            // girada antes de aparecer: a URL com a rotação é gerada sob demanda
+            setPageThumbnail(wrapper, rotation === 0 && urls[pageNum] ? urls[pageNum] : thumbnailUrl(pageNum, rotation));
         }
     }
 }
@@ -263,6 +284,18 @@ if (startOrganizeBtn) {
                 body: formData
             });
 
+            if (response.status === 429) {
+                // servidor ocupado: a mensagem já traz o tempo de espera e a posição na fila
+                const data = await response.json();
+                throw Object.assign(new Error(data.message), { busy: true });
+            }
+            if (response.status === 202) {
+                // PDF grande: a organização roda em background e o download sai pelo /download
+                const { task_id } = await response.json();
+                await followTask(task_id);
+                setTimeout(() => resetApp(), 3000);
+                return;
+            }
             if (!response.ok) throw new Error('Erro na resposta do servidor.');
 
             const blob = await response.blob();
@@ -279,7 +312,7 @@ if (startOrganizeBtn) {
 
         } catch (error) {
             console.error('Erro ao organizar PDF:', error);
-            showError('Ocorreu um erro ao organizar o PDF.');
+            showError(error.busy || error.taskError ? error.message : 'Ocorreu um erro ao organizar o PDF.');
         } finally {
             hideSpinner();
             closeMenu(organizeMenu);
@@ -316,30 +349,19 @@ if (rotateSelectedBtn) {
         }
         hideError();
 
-        // Reutiliza o pdfDocument já carregado
-        if (!pdfDocument) {
-            console.error("PDF Document não encontrado para rotação.");
+        if (!thumbnailDoc) {
+            console.error("PDF não registrado para as miniaturas.");
             return;
         }
 
         for (const wrapper of selectedWrappers) {
-            const canvas = wrapper.querySelector('canvas');
-            if (!canvas) continue; // Pula se a página ainda não foi renderizada
-
             const pageNum = parseInt(wrapper.dataset.pageNum);
-            // --- CORREÇÃO 2 AQUI ---
             let rotation = ((parseInt(wrapper.dataset.rotation) || 0) + 90) % 360;
             wrapper.dataset.rotation = rotation;
 
-            const page = await pdfDocument.getPage(pageNum);
-            const viewport = page.getViewport({ scale: 0.5, rotation: rotation });
-
-            canvas.width = viewport.width;
-            canvas.height = viewport.height;
-            await page.render({
-                canvasContext: canvas.getContext('2d'),
-                viewport
-            }).promise;
+            // página ainda não carregada: a rotação vale quando ela aparecer
+            if (!wrapper.querySelector('img.preview-canvas')) continue;
+            setPageThumbnail(wrapper, thumbnailUrl(pageNum, rotation));
         }
     });
 }
\ No newline at end of file
@@ -8,6 +8,7 @@ const startSplitBtn = document.getElementById('start-split');
 const modeButtons = document.querySelectorAll('.mode-btn');
 const partsOption = document.getElementById('parts-option');
 const sizeOption = document.getElementById('size-option');
+const rangesOption = document.getElementById('ranges-option');
 let selectedSplitMode = null; // Variável específica do Split
 
 // --- FUNÇÕES DO SPLIT ---
@@ -57,9 +58,13 @@ async function rebuildPreviews() {
     // Bloqueia novos uploads após 1 arquivo
     disableFileInputAndDropZone();
 
-    // Cria preview para o arquivo único
-    const previewElement = await createPreview(selectedFiles[0], 0);
-    previewContainer.appendChild(previewElement);
+    // Cria preview para o arquivo único (miniatura gerada no servidor)
+    try {
+        const previewElement = await createThumbnailPreview(selectedFiles[0], 0);
+        previewContainer.appendChild(previewElement);
+    } catch (error) {
+        showError(error.message, errorMessage);
+    }
 
     checkPreviewVisibility();
 }
@@ -131,6 +136,15 @@ if (startSplitBtn) {
                     return;
                 }
                 formData.append('max_size_mb', sizeMB);
+            } else if (mode === 'ranges') {
+                // a sintaxe é validada no servidor (1-3, 7, 10-fim)
+                const ranges = document.getElementById('split-ranges-input').value.trim();
+                if (!ranges) {
+                    hideSpinner();
+                    showError('Informe os intervalos de páginas. Ex.: 1-3, 7, 10-fim');
+                    return;
+                }
+                formData.append('ranges', ranges);
             }
 
 
@@ -140,6 +154,14 @@ if (startSplitBtn) {
                     body: formData
                 });
 
+                if (response.status === 202) {
+                    // PDF grande: a divisão roda em background e o ZIP sai pelo /download
+                    const { task_id } = await response.json();
+                    await followTask(task_id);
+                    setTimeout(() => resetApp(), 3000);
+                    return;
+                }
+
                 if (!response.ok) {
                     const errorData = await response.json().catch(() => ({ message: 'Erro desconhecido do servidor.' }));
                     throw new Error(errorData.message || 'Erro na resposta do servidor.');
@@ -170,7 +192,7 @@ if (startSplitBtn) {
     });
 }
 
-// Listener para alternar entre os modos de divisão (por partes / por tamanho)
+// Listener para alternar entre os modos de divisão (por partes / por tamanho / por intervalos)
 if (modeButtons) {
     modeButtons.forEach(btn => {
         btn.addEventListener('click', () => {
@@ -180,11 +202,14 @@ if (modeButtons) {
 
             if (partsOption) partsOption.style.display = 'none';
             if (sizeOption) sizeOption.style.display = 'none';
+            if (rangesOption) rangesOption.style.display = 'none';
 
             if (btn.dataset.mode === 'parts') {
                 if (partsOption) partsOption.style.display = 'block';
             } else if (btn.dataset.mode === 'size') {
                 if (sizeOption) sizeOption.style.display = 'block';
+            } else if (btn.dataset.mode === 'ranges') {
+                if (rangesOption) rangesOption.style.display = 'block';
             }
         });
     });
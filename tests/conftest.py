@@ -0,0 +1,22 @@
+"""
+O app cria uploads/, processed/ e cache/ no diretório atual ao ser importado:
+os testes rodam num diretório temporário, sem janitor, como o bench/harness.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("JANITOR_ENABLED", "False")
+os.chdir(tempfile.mkdtemp(prefix="zg_pdf_tests_"))
+sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture(scope="session")
+def zg_app():
+    import app
+
+    return app
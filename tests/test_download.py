@@ -0,0 +1,69 @@
+import os
+import uuid
+
+import pytest
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def retained(zg_app):
+    """Tarefa concluída com o resultado guardado em processed/."""
+    task_id = str(uuid.uuid4())
+    path = os.path.join(zg_app.PROCESSED_FOLDER, f"{task_id}_comprimidoZG_doc.pdf")
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n" + bytes(range(256)) * 64)
+    zg_app.task_store.create(task_id, {
+        'percent': 100,
+        'file': path,
+        'download_name': 'comprimidoZG_doc.pdf',
+    })
+    yield task_id, path
+    zg_app.task_store.pop(task_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def test_download_revalida_em_vez_de_no_store(zg_app, retained):
+    task_id, path = retained
+    client = zg_app.app.test_client()
+
+    response = client.get(f"/download/{task_id}")
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    assert response.headers['ETag']
+    assert response.get_data() == _read(path)
+    response.close()
+
+    again = client.get(f"/download/{task_id}", headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['Cache-Control'] == 'private, no-cache'
+
+
+def test_download_retoma_com_range(zg_app, retained):
+    task_id, path = retained
+    client = zg_app.app.test_client()
+
+    response = client.get(f"/download/{task_id}", headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f"bytes 100-199/{os.path.getsize(path)}"
+    assert response.get_data() == _read(path)[100:200]
+    response.close()
+
+
+def test_download_via_proxy_tambem_revalida(zg_app, retained, monkeypatch):
+    task_id, _ = retained
+    monkeypatch.setitem(zg_app.app.config, 'DOWNLOAD_ACCEL', 'x-sendfile')
+
+    response = zg_app.app.test_client().get(f"/download/{task_id}")
+    assert response.headers['X-Sendfile']
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+
+def test_demais_respostas_continuam_no_store(zg_app):
+    response = zg_app.app.test_client().get(f"/download/{uuid.uuid4()}")
+    assert response.status_code == 410
+    assert response.headers['Cache-Control'] == 'no-store'
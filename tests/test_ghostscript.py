@@ -0,0 +1,50 @@
+import os
+import stat
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+
+# gs falso: responde ao marcador de pronto e trava no primeiro job; o modo
+# avulso (sem "-" no argv) deixa um arquivo para o teste saber que rodou
+FAKE_GS = textwrap.dedent("""\
+    #!{python}
+    import sys, time
+    if sys.argv[-1] != "-":
+        open({standalone!r}, "w").close()
+        sys.exit(1)
+    for line in sys.stdin:
+        if "%%ZG_READY" in line:
+            print("%%ZG_READY", flush=True)
+        elif "OutputFile" in line:
+            time.sleep(60)
+""")
+
+
+@pytest.fixture
+def fake_gs(zg_app, tmp_path, monkeypatch):
+    standalone = tmp_path / "standalone-ran"
+    script = tmp_path / "gs"
+    script.write_text(FAKE_GS.format(python=sys.executable, standalone=str(standalone)))
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+
+    monkeypatch.setattr(zg_app, 'gs_executable', lambda: str(script))
+    monkeypatch.setitem(zg_app.app.config, 'GS_PERSISTENT', True)
+    pool = zg_app.GhostscriptPool(max_jobs=10, max_rss_mb=4096, job_timeout_s=0.5)
+    monkeypatch.setattr(zg_app, '_ghostscript_pool', pool)
+    yield standalone
+    pool.close_all()
+
+
+def test_timeout_na_instancia_persistente_nao_repete_avulso(zg_app, fake_gs, tmp_path):
+    started = time.monotonic()
+    with pytest.raises(subprocess.CalledProcessError) as info:
+        zg_app.run_ghostscript(str(tmp_path / "in.pdf"), str(tmp_path / "out.pdf"), "ebook")
+
+    assert info.value.returncode == -9
+    assert isinstance(info.value.__cause__, zg_app.GhostscriptTimeout)
+    assert not os.path.exists(fake_gs)
+    assert time.monotonic() - started < 5
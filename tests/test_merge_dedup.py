@@ -0,0 +1,50 @@
+import io
+
+import fitz  # PyMuPDF
+
+
+def _pdf_with_links(path, pages=3):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((50, 100), f"página {i + 1}")
+        page.insert_link({"kind": fitz.LINK_URI, "from": fitz.Rect(50, 40, 100, 60), "uri": "https://example.org"})
+    doc.save(path)
+    return str(path)
+
+
+def _merge(zg_app, paths):
+    output = io.BytesIO()
+    stats = zg_app.merge_documents(paths, output, False)
+    return fitz.open(stream=output.getvalue(), filetype="pdf"), stats
+
+
+def test_links_iguais_continuam_um_por_pagina(zg_app, tmp_path):
+    paths = [_pdf_with_links(tmp_path / f"in{k}.pdf") for k in range(4)]
+    merged, _ = _merge(zg_app, paths)
+
+    annot_xrefs = [[xref for xref, _, _ in page.annot_xrefs()] for page in merged]
+    assert all(len(xrefs) == 1 for xrefs in annot_xrefs)
+    flat = [xref for xrefs in annot_xrefs for xref in xrefs]
+    assert len(set(flat)) == merged.page_count == 12
+    assert all(page.get_links()[0]["uri"] == "https://example.org" for page in merged)
+
+
+def test_recursos_repetidos_sao_gravados_uma_vez(zg_app, tmp_path):
+    image = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+    image.set_rect(image.irect, (200, 30, 30))
+    logo = image.tobytes("png")
+    paths = []
+    for k in range(3):
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(20, 20, 120, 120), stream=logo)
+        path = tmp_path / f"logo{k}.pdf"
+        doc.save(path)
+        paths.append(str(path))
+
+    merged, stats = _merge(zg_app, paths)
+
+    assert stats["dedup_objects"] > 0 and stats["dedup_bytes_saved"] > 0
+    image_xrefs = {img[0] for page in merged for img in page.get_images()}
+    assert len(image_xrefs) == 1
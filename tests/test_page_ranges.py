@@ -0,0 +1,44 @@
+import pytest
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("1-3, 7, 10-40", [(1, 3), (7, 7), (10, 40)]),
+    ("1-3; 7;10-40", [(1, 3), (7, 7), (10, 40)]),
+    ("5 - 9", [(5, 9)]),
+    ("41-fim", [(41, None)]),
+    ("41-END", [(41, None)]),
+    ("2-Final", [(2, None)]),
+    ("10-", [(10, None)]),
+    ("4-4", [(4, 4)]),
+    (" 1 ,, 2 ; ", [(1, 1), (2, 2)]),
+])
+def test_intervalos_validos(zg_app, spec, expected):
+    assert zg_app.parse_page_ranges(spec) == expected
+
+
+@pytest.mark.parametrize("spec", [
+    "", " , ; ", None,      # nenhum intervalo
+    "5-3",                  # invertido
+    "0", "0-2",             # páginas começam em 1
+    "-3", "a-b", "1-2-3", "1 2", "fim-3", "1.5",
+])
+def test_intervalos_invalidos(zg_app, spec):
+    with pytest.raises(ValueError):
+        zg_app.parse_page_ranges(spec)
+
+
+def test_limite_de_intervalos(zg_app, monkeypatch):
+    monkeypatch.setitem(zg_app.app.config, "SPLIT_MAX_RANGES", 3)
+    assert len(zg_app.parse_page_ranges("1,2,3")) == 3
+    with pytest.raises(ValueError):
+        zg_app.parse_page_ranges("1,2,3,4")
+
+
+def test_resolve_corta_no_fim_e_remove_repetidos(zg_app):
+    ranges = zg_app.parse_page_ranges("1-3, 8-fim, 1-3, 9-99, 10")
+    assert zg_app.resolve_page_ranges(ranges, 10) == [(0, 2), (7, 9), (8, 9), (9, 9)]
+
+
+def test_resolve_inicio_depois_do_fim(zg_app):
+    with pytest.raises(zg_app.PdfOperationError):
+        zg_app.resolve_page_ranges([(11, None)], 10)
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+
+def _scheduler(zg_app, limit=1, max_queue=5, max_wait_s=2.0, aging_s=60.0):
+    return zg_app.JobScheduler({"merge": limit}, max_queue, max_wait_s, aging_s)
+
+
+def _wait_queued(scheduler, count, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while scheduler.snapshot()["merge"]["queued"] < count:
+        assert time.monotonic() < deadline, "jobs não entraram na fila"
+        time.sleep(0.005)
+
+
+def test_menor_arquivo_sai_primeiro(zg_app):
+    scheduler = _scheduler(zg_app)
+    order = []
+    done = threading.Event()
+
+    def job(name):
+        order.append(name)
+        if len(order) == 3:
+            done.set()
+
+    with scheduler.slot("merge"):
+        scheduler.submit("merge", 300, job, "grande")
+        scheduler.submit("merge", 10, job, "pequeno")
+        scheduler.submit("merge", 50, job, "medio")
+        assert scheduler.snapshot()["merge"] == {"running": 1, "queued": 3, "limit": 1}
+
+    assert done.wait(2)
+    assert order == ["pequeno", "medio", "grande"]
+
+
+def test_envelhecimento_passa_o_mais_antigo_na_frente(zg_app):
+    scheduler = _scheduler(zg_app, aging_s=0.05)
+    order = []
+    done = threading.Event()
+
+    def job(name):
+        order.append(name)
+        if len(order) == 2:
+            done.set()
+
+    with scheduler.slot("merge"):
+        scheduler.submit("merge", 300, job, "grande")
+        scheduler.submit("merge", 10, job, "pequeno")
+        time.sleep(0.1)
+
+    assert done.wait(2)
+    assert order[0] == "grande"
+
+
+def test_fila_cheia_recusa_na_hora(zg_app):
+    scheduler = _scheduler(zg_app, max_queue=1)
+    release = threading.Event()
+
+    with scheduler.slot("merge"):
+        scheduler.submit("merge", 1, release.wait)
+        with pytest.raises(zg_app.SchedulerBusy) as info:
+            scheduler.submit("merge", 1, release.wait)
+
+    release.set()
+    assert info.value.operation == "merge"
+    assert info.value.queue_position == 2
+    assert info.value.retry_after_s >= 1
+
+
+def test_espera_longa_demais_sai_da_fila(zg_app):
+    scheduler = _scheduler(zg_app, max_wait_s=0.05)
+    errors = []
+
+    def waiter():
+        try:
+            with scheduler.slot("merge"):
+                pass
+        except zg_app.SchedulerBusy as e:
+            errors.append(e)
+
+    with scheduler.slot("merge"):
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        thread.join(2)
+
+    assert len(errors) == 1 and errors[0].queue_position == 1
+    assert scheduler.snapshot()["merge"] == {"running": 0, "queued": 0, "limit": 1}
+
+
+def test_slot_liberado_mesmo_com_erro(zg_app):
+    scheduler = _scheduler(zg_app)
+    with pytest.raises(RuntimeError):
+        with scheduler.slot("merge"):
+            raise RuntimeError("falhou")
+    assert scheduler.snapshot()["merge"]["running"] == 0
+
+
+def test_on_queued_recebe_a_posicao(zg_app):
+    scheduler = _scheduler(zg_app)
+    positions = []
+    started = threading.Event()
+
+    with scheduler.slot("merge"):
+        scheduler.submit("merge", 100, lambda: None, on_queued=positions.append)
+        scheduler.submit("merge", 5, started.set, on_queued=positions.append)
+        _wait_queued(scheduler, 2)
+
+    assert positions == [1, 1]  # o menor passa na frente do que já estava na fila
+    assert started.wait(2)
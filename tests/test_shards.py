@@ -0,0 +1,84 @@
+import os
+
+import fitz
+import pytest
+
+FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSerif.ttf"
+
+pytestmark = pytest.mark.skipif(not os.path.exists(FONT), reason="fonte TrueType indisponível")
+
+
+def _page_texts(shard_idx, pages=3):
+    return [f"parte {shard_idx} página {n} " + chr(ord("a") + shard_idx * 5 + n) * 40 for n in range(pages)]
+
+
+def _pdf(path, texts, subset):
+    doc = fitz.open()
+    for text in texts:
+        doc.new_page().insert_text((40, 60), text, fontfile=FONT, fontname="F0")
+    if subset:
+        doc.subset_fonts()
+    doc.save(path, garbage=4, deflate=True)
+    doc.close()
+
+
+def _shard_job(zg_app, tmp_path, shards=3):
+    original = tmp_path / "original.pdf"
+    _pdf(original, [t for idx in range(shards) for t in _page_texts(idx)], subset=False)
+    results = []
+    for idx in range(shards):
+        part = tmp_path / f"part{idx}.pdf"
+        _pdf(part, _page_texts(idx), subset=True)
+        results.append({"output_path": str(part), "estimated_mb": 0})
+    job = {
+        "filename": "original.pdf",
+        "input_path": str(original),
+        "output_path": str(tmp_path / "out.pdf"),
+        "input_size": os.path.getsize(original),
+    }
+    return job, results
+
+
+def test_subset_por_parte_conta_como_fonte_repetida(zg_app, tmp_path):
+    job, results = _shard_job(zg_app, tmp_path)
+    merged = fitz.open()
+    for res in results:
+        with fitz.open(res["output_path"]) as part:
+            merged.insert_pdf(part)
+
+    assert zg_app.subset_font_overhead(merged) > 0
+    with fitz.open(job["input_path"]) as original:
+        assert zg_app.subset_font_overhead(original) == 0
+
+
+def test_passada_unica_menor_substitui_as_partes(zg_app, tmp_path, monkeypatch):
+    job, results = _shard_job(zg_app, tmp_path)
+    single = tmp_path / "single.pdf"
+    _pdf(single, [t for idx in range(3) for t in _page_texts(idx)], subset=True)
+    calls = []
+
+    def fake_single_pass(single_job, compression_type):
+        calls.append(compression_type)
+        return str(single)
+
+    monkeypatch.setattr(zg_app, "compress_single_pass", fake_single_pass)
+    monkeypatch.setitem(zg_app.app.config, "SHARD_FONT_OVERHEAD_PCT", 1)
+    single_size = os.path.getsize(single)
+
+    res = zg_app.reassemble_shards(job, results, "ebook")
+
+    assert calls == ["ebook"]
+    assert res["strategy"] == "single"
+    assert os.path.getsize(job["output_path"]) == single_size
+    assert not os.path.exists(job["input_path"])
+
+
+def test_sem_fontes_repetidas_nao_roda_passada_unica(zg_app, tmp_path, monkeypatch):
+    job, results = _shard_job(zg_app, tmp_path)
+    monkeypatch.setattr(zg_app, "compress_single_pass", pytest.fail)
+    monkeypatch.setitem(zg_app.app.config, "SHARD_FONT_OVERHEAD_PCT", 100)
+
+    res = zg_app.reassemble_shards(job, results, "ebook")
+
+    assert res["strategy"] == "sharded"
+    assert res["shards"] == 3
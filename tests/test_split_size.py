@@ -0,0 +1,93 @@
+import io
+import random
+
+import fitz  # PyMuPDF
+import pytest
+
+
+def _pdf_with_images(pages=24, seed=7):
+    """Páginas de pesos bem diferentes: ruído não comprime, então o tamanho é previsível."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_text((40, 40), f"página {n + 1}")
+        side = rng.choice((16, 64, 128, 200))
+        pixmap = fitz.Pixmap(fitz.csRGB, side, side, bytes(rng.getrandbits(8) for _ in range(side * side * 3)), False)
+        page.insert_image(fitz.Rect(40, 60, 300, 320), pixmap=pixmap)
+    data = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return fitz.open(stream=data, filetype="pdf")
+
+
+def _save_part(zg_app):
+    def save_part(part_doc):
+        buffer = io.BytesIO()
+        part_doc.save(buffer, **zg_app.PART_SAVE_OPTIONS)
+        return buffer, buffer.tell()
+    return save_part
+
+
+@pytest.mark.parametrize("limit_kb", [130, 250, 600])
+def test_toda_parte_cabe_no_limite(zg_app, limit_kb):
+    pdf_doc = _pdf_with_images()
+    max_bytes = limit_kb * 1024
+    parts = list(zg_app.plan_size_parts(pdf_doc, max_bytes, _save_part(zg_app), lambda saved: None))
+
+    assert len(parts) > 1
+    assert parts[0][0] == 0 and parts[-1][1] == pdf_doc.page_count - 1
+    for (_, end, _), (start, _, _) in zip(parts, parts[1:]):
+        assert start == end + 1
+    for start, end, saved in parts:
+        assert start <= end
+        assert len(saved.getvalue()) <= max_bytes
+        with fitz.open(stream=saved.getvalue(), filetype="pdf") as part:
+            assert part.page_count == end - start + 1
+
+
+def test_pagina_maior_que_o_limite(zg_app):
+    pdf_doc = _pdf_with_images(pages=3)
+    with pytest.raises(zg_app.PdfOperationError):
+        list(zg_app.plan_size_parts(pdf_doc, 20 * 1024, _save_part(zg_app), lambda saved: None))
+
+
+def _greedy_part_count(zg_app, pdf_doc, max_bytes):
+    """Referência: cada parte leva páginas enquanto o save real couber."""
+    save_part = _save_part(zg_app)
+    count, start = 0, 0
+    while start < pdf_doc.page_count:
+        end = start
+        while end + 1 < pdf_doc.page_count:
+            part = zg_app._copy_pages(pdf_doc, start, end + 1)
+            fits = save_part(part)[1] <= max_bytes
+            part.close()
+            if not fits:
+                break
+            end += 1
+        count += 1
+        start = end + 1
+    return count
+
+
+def _pdf_with_text(pages=12):
+    doc = fitz.open()
+    for n in range(pages):
+        doc.new_page().insert_text((40, 60), f"página {n + 1} " + "texto " * (5 + 7 * (n % 4)))
+    data = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return fitz.open(stream=data, filetype="pdf")
+
+
+@pytest.mark.parametrize("make_doc, limit_kb", [
+    (_pdf_with_text, 2),        # limite pequeno: o custo fixo da parte pesa
+    (_pdf_with_text, 3),
+    (_pdf_with_images, 130),
+    (_pdf_with_images, 250),
+    (_pdf_with_images, 600),
+])
+def test_partes_tao_poucas_quanto_o_guloso(zg_app, make_doc, limit_kb):
+    pdf_doc = make_doc()
+    max_bytes = limit_kb * 1024
+    parts = list(zg_app.plan_size_parts(pdf_doc, max_bytes, _save_part(zg_app), lambda saved: None))
+
+    assert len(parts) <= _greedy_part_count(zg_app, pdf_doc, max_bytes)
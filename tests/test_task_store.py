@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, zg_app, tmp_path):
+    def make(ttl_s=60.0):
+        if request.param == "sqlite":
+            return zg_app.SQLiteTaskStore(str(tmp_path / "tasks.db"), ttl_s)
+        return zg_app.MemoryTaskStore(ttl_s)
+    return make
+
+
+def test_create_get_update_pop(make_store):
+    store = make_store()
+    store.create("t1", {"percent": 0, "status": "Na fila"})
+
+    assert store.get("t1") == {"percent": 0, "status": "Na fila"}
+    assert store.update("t1", percent=40, eta_s=12.5) is True
+    assert store.get("t1") == {"percent": 40, "status": "Na fila", "eta_s": 12.5}
+    assert store.count() == 1
+
+    assert store.pop("t1") == {"percent": 40, "status": "Na fila", "eta_s": 12.5}
+    assert store.get("t1") is None
+    assert store.pop("t1") is None
+    assert store.count() == 0
+
+
+def test_update_de_tarefa_inexistente(make_store):
+    store = make_store()
+    assert store.update("nao-existe", percent=10) is False
+    assert store.get("nao-existe") is None
+
+
+def test_get_devolve_copia(make_store):
+    store = make_store()
+    store.create("t1", {"percent": 0})
+    store.get("t1")["percent"] = 99
+    assert store.get("t1") == {"percent": 0}
+
+
+def test_ttl_remove_tarefa_e_resultado(make_store, tmp_path):
+    store = make_store(ttl_s=0.05)
+    result = tmp_path / "resultado.pdf"
+    result.write_bytes(b"%PDF-1.4")
+    store.create("velha", {"file": str(result)})
+    store.create("sem-arquivo", {"percent": 100})
+    time.sleep(0.1)
+    store.create("nova", {"percent": 0})
+    store.touch("nova", 60)
+
+    assert store.sweep() == 2
+    assert not result.exists()
+    assert store.get("velha") is None and store.get("sem-arquivo") is None
+    assert store.get("nova") == {"percent": 0}
+    assert store.count() == 1
+
+
+def test_update_renova_o_prazo(make_store):
+    store = make_store(ttl_s=0.2)
+    store.create("t1", {"percent": 0})
+    time.sleep(0.12)
+    store.update("t1", percent=50)
+    time.sleep(0.12)
+
+    assert store.evict_expired() == []
+    assert store.get("t1") == {"percent": 50}
+
+
+def test_touch_encurta_o_prazo(make_store):
+    store = make_store()
+    store.create("t1", {"percent": 100})
+    store.touch("t1", 0)
+
+    assert store.evict_expired() == [{"percent": 100}]
+    assert store.get("t1") is None
+
+
+def test_updates_concorrentes_nao_se_perdem(make_store):
+    store = make_store()
+    store.create("t1", {})
+
+    def writer(n):
+        for i in range(20):
+            store.update("t1", **{f"w{n}": i})
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store.get("t1") == {f"w{n}": 19 for n in range(4)}
+
+
+def test_wait_for_change_acorda_com_update(make_store):
+    store = make_store()
+    store.create("t1", {"percent": 0})
+    known = store.get("t1")
+    timer = threading.Timer(0.05, store.update, args=("t1",), kwargs={"percent": 10})
+    timer.start()
+
+    assert store.wait_for_change("t1", known, timeout=2) == {"percent": 10}
+    timer.join()
+
+
+def test_sqlite_uma_conexao_por_thread(zg_app, tmp_path):
+    store = zg_app.SQLiteTaskStore(str(tmp_path / "tasks.db"), 60)
+    assert store._connect() is store._connect()
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(store._connect()))
+    thread.start()
+    thread.join()
+    assert other[0] is not store._connect()
+    assert store._connect().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+# ---------------------------- Progresso por página ----------------------------
+class _RecordingStore:
+    def __init__(self, lock):
+        self.lock = lock
+        self.updates = []
+
+    def update(self, task_id, **fields):
+        assert not self.lock.locked(), "gravação feita com o lock global de progresso"
+        self.updates.append(fields)
+        return True
+
+
+def test_progresso_grava_fora_do_lock_e_para_no_fim(zg_app, monkeypatch):
+    store = _RecordingStore(zg_app.task_progress_lock)
+    monkeypatch.setattr(zg_app, "task_store", store)
+
+    zg_app.start_page_progress("t1", {"0": 10}, 1)
+    for page in (2, 5, 5, 3, 10):
+        zg_app.record_unit_pages("t1", "0", page)
+    zg_app.finish_page_progress("t1")
+    zg_app.record_unit_pages("t1", "0", 10, file_done=True)
+
+    # páginas repetidas ou que voltam não geram gravação
+    assert [fields["pages_done"] for fields in store.updates] == [2, 5, 10]
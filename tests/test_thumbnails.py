@@ -0,0 +1,89 @@
+import io
+import os
+import time
+
+import fitz  # PyMuPDF
+import pytest
+
+
+def _pdf_bytes(pages=5):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((50, 100), f"página {i + 1}")
+    return doc.tobytes()
+
+
+@pytest.fixture
+def client(zg_app):
+    for name in os.listdir(zg_app.THUMB_CACHE_FOLDER):
+        os.remove(os.path.join(zg_app.THUMB_CACHE_FOLDER, name))
+    return zg_app.app.test_client()
+
+
+def _register(client, data):
+    response = client.post('/thumbnails', data={'pdf': (io.BytesIO(data), 'doc.pdf')})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_intervalo_e_imagem(client):
+    info = _register(client, _pdf_bytes())
+    assert info['page_count'] == 5
+
+    response = client.get(f"/thumbnails/{info['doc_id']}?pages=2-3&w=200")
+    assert response.status_code == 200
+    urls = [t['url'] for t in response.get_json()['thumbnails']]
+    assert len(urls) == 2
+
+    image = client.get(urls[0])
+    assert image.status_code == 200
+    assert client.get(urls[0], headers={'If-None-Match': image.headers['ETag']}).status_code == 304
+
+
+def test_documento_parado_expira(client, zg_app, monkeypatch):
+    info = _register(client, _pdf_bytes())
+    client.get(f"/thumbnails/{info['doc_id']}?pages=1-2")
+    old = time.time() - 3 * 3600
+    for name in os.listdir(zg_app.THUMB_CACHE_FOLDER):
+        os.utime(os.path.join(zg_app.THUMB_CACHE_FOLDER, name), (old, old))
+
+    monkeypatch.setitem(zg_app.app.config, 'THUMB_MAX_AGE_H', 2)
+    zg_app.evict_thumbnail_cache()
+
+    assert os.listdir(zg_app.THUMB_CACHE_FOLDER) == []
+    assert client.get(f"/thumbnails/{info['doc_id']}?pages=1").status_code == 404
+
+
+def test_organize_apaga_o_documento_do_cache(client, zg_app):
+    data = _pdf_bytes(3)
+    info = _register(client, data)
+    client.get(f"/thumbnails/{info['doc_id']}?pages=1-3")
+    assert os.listdir(zg_app.THUMB_CACHE_FOLDER)
+
+    response = client.post('/organize', data={
+        'pdf': (io.BytesIO(data), 'doc.pdf'),
+        'order': '[{"page": 3}, {"page": 1}, {"page": 2}]',
+    })
+    assert response.status_code == 200
+    assert os.listdir(zg_app.THUMB_CACHE_FOLDER) == []
+
+
+def test_documento_removido_durante_o_pedido_vira_404(client, zg_app):
+    info = _register(client, _pdf_bytes())
+    os.remove(zg_app.thumbnail_doc_path(info['doc_id']))
+
+    with pytest.raises(FileNotFoundError):
+        zg_app.render_thumbnails(info['doc_id'], [1], 300, 0, 'png')
+    assert client.get(f"/thumbnails/{info['doc_id']}/1").status_code == 404
+
+
+def test_servidor_ocupado_responde_429(client, zg_app, monkeypatch):
+    info = _register(client, _pdf_bytes())
+    scheduler = zg_app.job_scheduler
+    monkeypatch.setattr(scheduler, 'max_wait_s', 0.05)
+    monkeypatch.setitem(scheduler.limits, 'thumbnail', 1)
+
+    with scheduler.slot('thumbnail'):  # a única vaga fica ocupada
+        response = client.get(f"/thumbnails/{info['doc_id']}?pages=1-2")
+    assert response.status_code == 429
+    assert response.headers['Retry-After']
@@ -0,0 +1,115 @@
+import hashlib
+import io
+import os
+
+import pytest
+from flask import request
+
+
+def _payload(size):
+    return (b"%PDF-1.4\n" + os.urandom(1024) * (size // 1024 + 1))[:size]
+
+
+def _leftover_parts(zg_app):
+    return [name for name in os.listdir(zg_app.UPLOAD_FOLDER) if name.endswith(".part")]
+
+
+@pytest.fixture
+def written(zg_app, monkeypatch):
+    """Maior posição já gravada em disco por cada StreamedUpload da requisição."""
+    peaks = {}
+    original_write = zg_app.StreamedUpload.write
+
+    def write(self, data):
+        result = original_write(self, data)
+        peaks[self.path] = max(peaks.get(self.path, 0), self._file.tell())
+        return result
+
+    monkeypatch.setattr(zg_app.StreamedUpload, "write", write)
+    return peaks
+
+
+def test_hash_e_tamanho_calculados_no_upload(zg_app):
+    payload = _payload(300 * 1024)
+    with zg_app.app.test_request_context(
+        "/compress", method="POST",
+        data={"files": (io.BytesIO(payload), "doc.pdf")},
+        content_type="multipart/form-data",
+    ):
+        zg_app.app.preprocess_request()
+        upload = request.files["files"]
+
+        assert zg_app.upload_sha256(upload) == hashlib.sha256(payload).hexdigest()
+        assert zg_app.upload_size(upload) == len(payload)
+        path = zg_app.upload_path(upload)
+        with open(path, "rb") as f:
+            assert f.read() == payload
+
+    # sem claim_upload, o arquivo some no fim da requisição
+    assert not os.path.exists(path)
+
+
+def test_claim_upload_mantem_o_arquivo(zg_app, tmp_path):
+    payload = _payload(10 * 1024)
+    dest = os.path.join(zg_app.UPLOAD_FOLDER, "claimed_doc.pdf")
+    with zg_app.app.test_request_context(
+        "/compress", method="POST",
+        data={"files": (io.BytesIO(payload), "doc.pdf")},
+        content_type="multipart/form-data",
+    ):
+        zg_app.claim_upload(request.files["files"], dest)
+
+    with open(dest, "rb") as f:
+        assert f.read() == payload
+    os.remove(dest)
+
+
+def test_arquivo_acima_do_limite_para_no_meio(zg_app, monkeypatch, written):
+    # 64 KB por arquivo, 10 MB por requisição: o Content-Length passa, o arquivo não
+    monkeypatch.setitem(zg_app.app.config, "UPLOAD_LIMITS_MB", {"compress": (1 / 16, 10)})
+    payload = _payload(2 * 1024 * 1024)
+
+    response = zg_app.app.test_client().post(
+        "/compress",
+        data={"files": (io.BytesIO(payload), "doc.pdf"), "compression": "ebook"},
+        content_type="multipart/form-data",
+    )
+
+    assert response.status_code == 413
+    assert "limite" in response.get_json()["error"]
+    assert written and max(written.values()) <= 64 * 1024 < len(payload)
+    assert _leftover_parts(zg_app) == []
+
+
+def test_total_da_requisicao_acima_do_limite(zg_app, monkeypatch, written):
+    # cada arquivo cabe sozinho; a soma passa do limite da requisição
+    monkeypatch.setitem(zg_app.app.config, "UPLOAD_LIMITS_MB", {"compress": (1, 1.5)})
+    files = [(io.BytesIO(_payload(700 * 1024)), f"doc{n}.pdf") for n in range(4)]
+
+    response = zg_app.app.test_client().post(
+        "/compress",
+        data={"files": files, "compression": "ebook"},
+        content_type="multipart/form-data",
+        # sem Content-Length (como um upload chunked): o limite só pode valer na leitura
+        environ_overrides={"CONTENT_LENGTH": "", "wsgi.input_terminated": True},
+    )
+
+    assert response.status_code == 413
+    assert len(written) >= 2
+    assert sum(written.values()) <= 1.5 * 1024 * 1024
+    assert _leftover_parts(zg_app) == []
+
+
+def test_content_length_acima_do_limite_nem_abre_arquivo(zg_app, monkeypatch, written):
+    monkeypatch.setitem(zg_app.app.config, "UPLOAD_LIMITS_MB", {"compress": (1, 1)})
+    payload = _payload(2 * 1024 * 1024)
+
+    response = zg_app.app.test_client().post(
+        "/compress",
+        data={"files": (io.BytesIO(payload), "doc.pdf")},
+        content_type="multipart/form-data",
+    )
+
+    assert response.status_code == 413
+    assert written == {}
+    assert _leftover_parts(zg_app) == []